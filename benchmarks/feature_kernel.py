@@ -0,0 +1,63 @@
+'''Rows per second of the team-diff feature engineering.
+
+Compares the per-team column loop the transform and API used to run with the
+shared battle_features kernel, on raw stat.ink-shaped frames:
+
+    python benchmarks/feature_kernel.py --rows 1000 100000
+'''
+
+# Benchmarks put the flows directory on the path before importing from it
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'flows'))
+
+from legacy import legacy_engineer_features
+from synthetic import make_battles
+from battle_features import TRANSFORM_COLUMNS, engineer_features
+
+# The columns the loop produced; the battle identity hash is measured separately
+COLUMNS = [column for column in TRANSFORM_COLUMNS if column != 'battle_id']
+
+
+def kernel_engineer_features(df):
+    return engineer_features(df, COLUMNS)
+
+
+def rows_per_second(function, df, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        function(frame)
+        best = min(best, time.perf_counter() - start)
+    return len(df) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        df = make_battles(rows)
+        legacy = legacy_engineer_features(df.copy())
+        kernel = kernel_engineer_features(df.copy())
+        assert (legacy[kernel.columns].astype(str) == kernel.astype(str)).all().all()
+
+        legacy_rate = rows_per_second(legacy_engineer_features, df, args.repeat)
+        kernel_rate = rows_per_second(kernel_engineer_features, df, args.repeat)
+        print(
+            f'{rows:>8} rows: legacy {legacy_rate:>12,.0f} rows/s, '
+            f'kernel {kernel_rate:>12,.0f} rows/s ({kernel_rate / legacy_rate:.1f}x)'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+'''Prediction latency of the pandas model-input path and the array-native engine.
+
+Scores engineered synthetic battles with the model in --model-dir, once without a
+preprocessor (the batch-scaled get_dummies path the API used for every request)
+and once with a preprocessor fitted on a separate sample, each through pandas and
+through InferenceEngine, and checks both give the same predictions:
+
+    python benchmarks/inference_latency.py --rows 1 100 100000 --thread-count 1
+'''
+
+# Benchmarks put the flows and deployment directories on the path before importing
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+import time
+import pickle
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'flows'), os.path.join(ROOT, 'deployment')]
+
+from sklearn.preprocessing import MinMaxScaler
+from api import legacy_model_input
+from inference import InferenceEngine
+from synthetic import make_battles
+from preprocessing import Preprocessor
+from battle_features import NUM_COLUMNS, FEATURE_COLUMNS, engineer_features
+
+
+def best_seconds(function, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model-dir', default=os.path.join(ROOT, 'prod_model'))
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100, 100_000])
+    parser.add_argument('--thread-count', type=int, default=-1)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with open(os.path.join(args.model_dir, 'current_prod_model.pkl'), 'rb') as file:
+        model = pickle.load(file)
+    with open(os.path.join(args.model_dir, 'one_hot_columns.pkl'), 'rb') as file:
+        columns = pickle.load(file)
+    sample = engineer_features(make_battles(10_000, seed=1), FEATURE_COLUMNS)
+    preprocessor = Preprocessor.from_fitted(
+        MinMaxScaler().fit(sample[NUM_COLUMNS]), columns
+    )
+    paths = {
+        'batch-scaled': (
+            lambda df: legacy_model_input(df, columns),
+            InferenceEngine.for_model(model, columns),
+        ),
+        'preprocessor': (
+            preprocessor.transform,
+            InferenceEngine.for_model(model, columns, preprocessor),
+        ),
+    }
+
+    for rows in args.rows:
+        df = engineer_features(make_battles(rows, seed=0), FEATURE_COLUMNS)
+        for name, (model_input, engine) in paths.items():
+            np.testing.assert_array_equal(
+                engine.predict(df, args.thread_count),
+                model.predict(model_input(df), thread_count=args.thread_count),
+            )
+            pandas_seconds = best_seconds(
+                lambda df=df, model_input=model_input: model.predict(
+                    model_input(df), thread_count=args.thread_count
+                ),
+                args.repeat,
+            )
+            engine_seconds = best_seconds(
+                lambda df=df, engine=engine: engine.predict(df, args.thread_count),
+                args.repeat,
+            )
+            print(
+                f'{rows:>8} rows, {name}: pandas {pandas_seconds * 1000:>9.2f} ms, '
+                f'engine {engine_seconds * 1000:>9.2f} ms '
+                f'({pandas_seconds / engine_seconds:.1f}x), '
+                f'engine {rows / engine_seconds:>12,.0f} rows/s'
+            )
+
+
+if __name__ == '__main__':
+    main()
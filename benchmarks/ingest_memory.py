@@ -0,0 +1,99 @@
+'''Compare peak memory of the battle CSV ingestion paths.
+
+Each path runs in a fresh process so its peak RSS is measured in isolation:
+
+    python benchmarks/ingest_memory.py --days 30 --rows 50000
+    python benchmarks/ingest_memory.py --data-dir ../data
+'''
+
+# Benchmarks put the flows directory on the path before importing from it
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+import glob
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'flows'))
+
+from legacy import legacy_engineer_features
+from synthetic import write_battle_csv
+from battle_ingest import concat_battles, read_battle_csv
+from battle_features import engineer_features
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    # Resident set size right now, so import overhead can be subtracted from the peak
+    with open('/proc/self/statm', 'r', encoding='utf-8') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+
+
+def run_legacy(files, chunksize):
+    # The original transform: every column of every file loaded before aggregating
+    del chunksize
+    return legacy_engineer_features(pd.concat([pd.read_csv(f) for f in files]))
+
+
+def run_streaming(files, chunksize):
+    return concat_battles(
+        [read_battle_csv(f, engineer_features, chunksize) for f in files]
+    )
+
+
+def measure(mode, files, chunksize):
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    df = {'legacy': run_legacy, 'streaming': run_streaming}[mode](files, chunksize)
+    return {
+        'mode': mode,
+        'rows': len(df),
+        'seconds': time.perf_counter() - start,
+        'baseline_rss_mb': baseline,
+        'peak_rss_mb': peak_rss_mb(),
+        'result_mb': df.memory_usage(deep=True).sum() / 1024**2,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--data-dir', help='directory of stat.ink daily CSVs')
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.data_dir:
+            files = sorted(glob.glob(os.path.join(args.data_dir, '*.csv')))
+        else:
+            files = []
+            for day in pd.date_range('2023-07-01', periods=args.days):
+                files.append(os.path.join(tmp_dir, f'{day.date()}.csv'))
+                write_battle_csv(files[-1], args.rows, str(day.date()), seed=day.day)
+
+        context = multiprocessing.get_context('spawn')
+        for mode in ['legacy', 'streaming']:
+            with context.Pool(1) as pool:
+                result = pool.apply(measure, (mode, files, args.chunksize))
+            print(
+                f"{result['mode']:>9}: {result['rows']} rows in "
+                f"{result['seconds']:.2f}s, peak RSS {result['peak_rss_mb']:.0f} MB "
+                f"({result['peak_rss_mb'] - result['baseline_rss_mb']:.0f} MB above "
+                f"baseline), result {result['result_mb']:.1f} MB"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import pandas as pd
+
+
+def legacy_engineer_features(df: pd.DataFrame) -> pd.DataFrame:
+    # The per-team column loop that the transform and the API used before the shared
+    # battle_features kernel, kept as the baseline for the benchmarks
+    new_column_list = [
+        '-kill-assist',
+        '-kill',
+        '-assist',
+        '-death',
+        '-special',
+        '-inked',
+    ]
+    team_list = ['A', 'B']
+
+    for column in new_column_list:
+        for team in team_list:
+            column_names = [("{0}" + column).format(team + str(i)) for i in range(1, 5)]
+            df[team + column] = df[column_names].sum(axis=1)
+
+    df['kill_diff'] = df['A-kill'] - df['B-kill']
+    df['assist_diff'] = df['A-assist'] - df['B-assist']
+    df['death_diff'] = df['A-death'] - df['B-death']
+    df['special_diff'] = df['A-special'] - df['B-special']
+    df['inked_diff'] = df['A-inked'] - df['B-inked']
+
+    num_columns = [
+        'period',
+        'kill_diff',
+        'assist_diff',
+        'death_diff',
+        'special_diff',
+        'inked_diff',
+        'time',
+    ]
+    cat_columns = ['mode', 'stage', 'lobby', 'win']
+
+    return df[num_columns + cat_columns]
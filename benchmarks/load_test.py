@@ -0,0 +1,304 @@
+'''Load test of the prediction API, with results kept for comparison across runs.
+
+Serves the model in prod_model (with gunicorn unless --mode says otherwise) and
+drives it from concurrent clients with synthetic stat.ink battles:
+
+    json  POST /predict with a JSON list of --rows battles
+    csv   POST /predict_csv with a CSV export of --rows battles
+    job   POST /jobs with the same CSV, polling until its result can be downloaded
+
+Each scenario reports p50/p95/p99 request latency, requests and battles per
+second, and the peak memory (PSS) of the server's processes. Every run is
+appended to --results as one JSON line and compared with the last earlier run of
+the same scenario and settings:
+
+    python benchmarks/load_test.py --scenarios json csv --rows 1 100 --clients 8
+    python benchmarks/load_test.py --scenarios csv --rows 100000 --clients 2
+'''
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Dict, List, Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from synthetic import make_battles
+from serving_throughput import URL, COMMANDS, stop_server, start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results', 'load_test.jsonl')
+# Distinct payloads per scenario, so repeated requests aren't all the same battles
+PAYLOADS = 8
+
+
+def process_memory_kb(pid: str) -> int:
+    # Proportional set size: pages shared by the forked workers, such as the model
+    # loaded before forking, are split between them instead of counted in each
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as smaps:
+            for line in smaps:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    with open(f'/proc/{pid}/statm', encoding='utf-8') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def session_memory_mb(session: int) -> float:
+    # Memory of every process in the server's session: the master and its workers
+    total = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat', encoding='utf-8') as stat:
+                # Fields after the command name, which may contain spaces
+                fields = stat.read().rsplit(')', 1)[1].split()
+            if int(fields[3]) == session:
+                total += process_memory_kb(pid)
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / 1024
+
+
+class MemorySampler:
+    # Polls the server's memory in the background and keeps the highest total seen
+    def __init__(self, session: int, interval: float = 0.05):
+        self.session = session
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, session_memory_mb(self.session))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def json_payloads(rows: int) -> List[bytes]:
+    return [
+        make_battles(rows, seed=seed).to_json(orient='records').encode()
+        for seed in range(PAYLOADS)
+    ]
+
+
+def csv_payloads(rows: int) -> List[bytes]:
+    return [
+        make_battles(rows, seed=seed).to_csv(index=False).encode()
+        for seed in range(PAYLOADS)
+    ]
+
+
+def post_json(session: requests.Session, body: bytes) -> None:
+    response = session.post(
+        URL + '/predict',
+        data=body,
+        headers={'Content-Type': 'application/json'},
+        timeout=600,
+    )
+    response.raise_for_status()
+
+
+def post_csv(session: requests.Session, body: bytes) -> None:
+    response = session.post(URL + '/predict_csv', data=body, timeout=600)
+    response.raise_for_status()
+    # The scored CSV is streamed back, so the request ends when it has been read
+    for _ in response.iter_content(1 << 16):
+        pass
+
+
+def run_job(session: requests.Session, body: bytes) -> None:
+    response = session.post(
+        URL + '/jobs',
+        files={'file_csv': ('battles.csv', io.BytesIO(body))},
+        timeout=600,
+    )
+    response.raise_for_status()
+    job = response.json()
+    while True:
+        status = session.get(URL + job['status_url'], timeout=60).json()
+        if status['status'] == 'failed':
+            raise RuntimeError(status['error'])
+        if status['status'] == 'done':
+            break
+        time.sleep(0.05)
+    session.get(URL + job['result_url'], timeout=600).raise_for_status()
+
+
+SCENARIOS: Dict[str, tuple] = {
+    'json': (json_payloads, post_json),
+    'csv': (csv_payloads, post_csv),
+    'job': (csv_payloads, run_job),
+}
+
+
+def client(send: Callable, bodies: List[bytes], stop_at: float, offset: int):
+    # Send requests back to back until stop_at, returning each one's latency
+    session = requests.Session()
+    latencies, errors = [], 0
+    while time.time() < stop_at:
+        start = time.perf_counter()
+        try:
+            send(session, bodies[(offset + len(latencies) + errors) % len(bodies)])
+        except (requests.RequestException, RuntimeError):
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    return latencies, errors
+
+
+def run_scenario(name: str, rows: int, clients: int, seconds: float, session: int):
+    make_payloads, send = SCENARIOS[name]
+    bodies = make_payloads(rows)
+    with ThreadPoolExecutor(clients) as pool:
+        # One request per client first, so every worker has loaded the model
+        list(
+            pool.map(
+                lambda i: send(requests.Session(), bodies[i % PAYLOADS]), range(clients)
+            )
+        )
+        with MemorySampler(session) as memory:
+            start = time.time()
+            results = list(
+                pool.map(
+                    lambda i: client(send, bodies, start + seconds, i), range(clients)
+                )
+            )
+            elapsed = time.time() - start
+    latencies = np.concatenate([np.array(latency) for latency, _ in results]) * 1000
+    completed = len(latencies)
+    return {
+        'requests': completed,
+        'errors': sum(errors for _, errors in results),
+        'requests_per_second': completed / elapsed,
+        'rows_per_second': completed * rows / elapsed,
+        **{
+            f'p{q}_ms': float(np.percentile(latencies, q)) if completed else None
+            for q in [50, 95, 99]
+        },
+        'peak_server_memory_mb': memory.peak_mb,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def previous_run(results_path: str, config: dict):
+    # The latest stored run with the same settings, if any
+    if not os.path.isfile(results_path):
+        return None
+    previous = None
+    with open(results_path, encoding='utf-8') as results_file:
+        for line in results_file:
+            run = json.loads(line)
+            if run['config'] == config:
+                previous = run
+    return previous
+
+
+def describe(result: dict, previous) -> str:
+    if not result['requests']:
+        return f"no request completed, {result['errors']} errors"
+    line = (
+        f"{result['requests_per_second']:>8.1f} req/s "
+        f"{result['rows_per_second']:>11,.0f} rows/s  "
+        f"p50 {result['p50_ms']:>8.1f}  p95 {result['p95_ms']:>8.1f}  "
+        f"p99 {result['p99_ms']:>8.1f} ms  "
+        f"peak {result['peak_server_memory_mb']:.0f} MB"
+    )
+    if result['errors']:
+        line += f"  {result['errors']} errors"
+    if previous is not None:
+        before = previous['result']
+        changes = [
+            f"{label} {100 * (result[key] / before[key] - 1):+.0f}%"
+            for label, key in [
+                ('rows/s', 'rows_per_second'),
+                ('p95', 'p95_ms'),
+                ('peak', 'peak_server_memory_mb'),
+            ]
+            if result[key] and before.get(key)
+        ]
+        line += f"\n{'':>20}vs {previous['commit']}: {', '.join(changes)}"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS))
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100, 10_000])
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--mode', choices=list(COMMANDS), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--results', default=RESULTS)
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.results), exist_ok=True)
+    commit = git_commit()
+    with tempfile.TemporaryDirectory() as jobs_dir:
+        server = start_server(args.mode, args.workers, jobs_dir)
+        try:
+            for name in args.scenarios:
+                for rows in args.rows:
+                    config = {
+                        'scenario': name,
+                        'rows': rows,
+                        'clients': args.clients,
+                        'seconds': args.seconds,
+                        'mode': args.mode,
+                        'workers': args.workers,
+                        'cpus': os.cpu_count(),
+                    }
+                    result = run_scenario(
+                        name, rows, args.clients, args.seconds, server.pid
+                    )
+                    previous = previous_run(args.results, config)
+                    print(f'{name:>5} {rows:>8} rows: {describe(result, previous)}')
+                    if not args.no_save:
+                        with open(args.results, 'a', encoding='utf-8') as results_file:
+                            run = {
+                                'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                                'commit': commit,
+                                'python': sys.version.split()[0],
+                                'config': config,
+                                'result': result,
+                            }
+                            results_file.write(json.dumps(run) + '\n')
+        finally:
+            stop_server(server)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+'''Requests per second of the prediction API under concurrent load.
+
+Starts the API with the old entry point (python api.py, Flask's debug server) and
+with the production one (gunicorn -c gunicorn.conf.py), serving the model in
+prod_model, and sends single-battle JSON predictions from concurrent clients:
+
+    python benchmarks/serving_throughput.py --clients 16 --seconds 20
+    python benchmarks/serving_throughput.py --modes gunicorn --workers 4
+'''
+
+import os
+import sys
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from synthetic import make_battles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEPLOYMENT = os.path.join(ROOT, 'deployment')
+URL = 'http://127.0.0.1:9696'
+
+COMMANDS = {
+    'debug-server': [sys.executable, 'api.py'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'api:app'],
+}
+
+
+def start_server(mode, workers, jobs_dir):
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.path.join(ROOT, 'flows'),
+        MODEL_STORE_DIR=os.path.join(ROOT, 'prod_model'),
+        JOBS_DIR=jobs_dir,
+        WEB_CONCURRENCY=str(workers),
+    )
+    # The server outlives this function; stop_server ends it
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        COMMANDS[mode],
+        cwd=DEPLOYMENT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        # The debug server's reloader runs the app in a child process
+        start_new_session=True,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(URL + '/predict/stats', timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError(f'{mode} did not start')
+
+
+def stop_server(server):
+    os.killpg(server.pid, signal.SIGTERM)
+    server.wait()
+
+
+def client(bodies, stop_at):
+    session = requests.Session()
+    latencies = []
+    while time.time() < stop_at:
+        body = bodies[len(latencies) % len(bodies)]
+        start = time.perf_counter()
+        response = session.post(
+            URL + '/predict',
+            data=body,
+            headers={'Content-Type': 'application/json'},
+            timeout=30,
+        )
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_load(clients, seconds, bodies):
+    # Warm up every worker's model cache before timing
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(lambda _: client(bodies, time.time() + 1), range(clients)))
+        stop_at = time.time() + seconds
+        results = pool.map(lambda _: client(bodies, stop_at), range(clients))
+        latencies = np.concatenate([np.array(result) for result in results]) * 1000
+    return {
+        'requests_per_second': len(latencies) / seconds,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modes', nargs='+', default=list(COMMANDS))
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    battles = make_battles(200, seed=0)
+    bodies = [battles.iloc[i].to_json() for i in range(len(battles))]
+    with tempfile.TemporaryDirectory() as jobs_dir:
+        for mode in args.modes:
+            server = start_server(mode, args.workers, jobs_dir)
+            try:
+                result = run_load(args.clients, args.seconds, bodies)
+            finally:
+                stop_server(server)
+            print(
+                f"{mode:>12}: {result['requests_per_second']:.0f} requests/s, "
+                f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms "
+                f"({args.clients} clients)"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+'''Cold-start cost of the prediction API and the training flow.
+
+Each measurement runs in a fresh process: the time to import the module, which
+heavy dependencies that import pulled in, and for the API the time to load the
+model and score the first battle, with the model published as a pickle and in
+CatBoost's native format. The heavy dependencies the modules used to import up
+front are timed on their own for comparison:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --model-dir prod_model
+'''
+
+import os
+import sys
+import time
+import pickle
+import shutil
+import argparse
+import tempfile
+import importlib
+import multiprocessing
+
+from synthetic import make_battles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = [
+    'catboost',
+    'sklearn',
+    'google.cloud.storage',
+    'prefect_gcp',
+    'wandb',
+    'evidently',
+]
+# What api.py and main_flow.py imported at module level before they were made lazy
+EAGER_IMPORTS = {
+    'api': ['catboost', 'sklearn.preprocessing', 'google.cloud.storage'],
+    'main_flow': ['catboost', 'sklearn.preprocessing', 'prefect_gcp', 'wandb'],
+}
+
+
+def measure(module, model_dir=None):
+    sys.path[:0] = [os.path.join(ROOT, 'flows'), os.path.join(ROOT, 'deployment')]
+    if model_dir:
+        os.environ['MODEL_STORE_DIR'] = model_dir
+    start = time.perf_counter()
+    imported = importlib.import_module(module)
+    result = {
+        'import_seconds': time.perf_counter() - start,
+        'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+    if model_dir:
+        start = time.perf_counter()
+        imported.MODEL_CACHE.refresh()
+        result['model_load_seconds'] = time.perf_counter() - start
+        start = time.perf_counter()
+        imported.score_battles(make_battles(1))
+        result['first_prediction_seconds'] = time.perf_counter() - start
+    return result
+
+
+def measure_eager(modules):
+    start = time.perf_counter()
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+    return time.perf_counter() - start
+
+
+def publish(model_dir, source_dir, native):
+    os.makedirs(model_dir)
+    shutil.copy(os.path.join(source_dir, 'one_hot_columns.pkl'), model_dir)
+    with open(os.path.join(source_dir, 'current_prod_model.pkl'), 'rb') as model_file:
+        model = pickle.load(model_file)
+    if native:
+        model.save_model(os.path.join(model_dir, 'current_prod_model.cbm'))
+    else:
+        shutil.copy(os.path.join(source_dir, 'current_prod_model.pkl'), model_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model-dir', default=os.path.join(ROOT, 'prod_model'))
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        runs = [('main_flow', 'main_flow', None)]
+        for native in [False, True]:
+            model_dir = os.path.join(tmp_dir, 'native' if native else 'pickle')
+            publish(model_dir, args.model_dir, native)
+            runs.append((f"api ({'native' if native else 'pickle'})", 'api', model_dir))
+
+        for label, module, model_dir in runs:
+            with context.Pool(1) as pool:
+                result = pool.apply(measure, (module, model_dir))
+            line = f"{label:>12}: import {result['import_seconds']:.2f}s"
+            if model_dir:
+                line += (
+                    f", model load {result['model_load_seconds']:.2f}s, first "
+                    f"prediction {result['first_prediction_seconds']:.2f}s"
+                )
+            print(
+                f"{line}, heavy modules imported: {result['heavy_modules'] or 'none'}"
+            )
+
+        for module, eager in EAGER_IMPORTS.items():
+            with context.Pool(1) as pool:
+                seconds = pool.apply(measure_eager, (eager,))
+            print(
+                f'{module:>12}: previously imported up front, {seconds:.2f}s: {eager}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''Compute and best AUC of a full-budget sweep against successive halving.
+
+Engineers synthetic battles the way feature_engineering does, with wins drawn from
+a noisy function of the kill, death and inked differences so there is something
+to learn, and quantizes them once. The same --trials configurations are then
+trained on them twice: every one on the full --iterations, and with successive
+halving. Reports the boosting iterations each trained, wall-clock time and the
+best validation AUC:
+
+    python benchmarks/sweep_scheduler.py --rows 100000 --trials 27 --parallel 2
+'''
+
+# Benchmarks put the flows directory on the path before importing
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'flows'))
+
+from sweep import run_sweep, run_successive_halving
+from synthetic import make_battles
+from training_data import save_snapshot
+from quantized_data import quantize_dataset
+from battle_features import CAT_COLUMNS, NUM_COLUMNS, FEATURE_COLUMNS, engineer_features
+
+
+def training_data(rows: int, seed: int):
+    # Scaled numeric and one-hot columns like feature_engineering's, with a 75/25
+    # split and labels shaped like LabelBinarizer's
+    df = engineer_features(make_battles(rows, seed=seed), FEATURE_COLUMNS)
+    rng = np.random.default_rng(seed)
+    signal = (
+        df['kill_diff'] / df['kill_diff'].std()
+        - df['death_diff'] / df['death_diff'].std()
+        + 0.5 * df['inked_diff'] / df['inked_diff'].std()
+    )
+    y = (signal + rng.normal(0, 1.5, rows) > 0).astype(int).to_numpy().reshape(-1, 1)
+    X = pd.get_dummies(df, columns=CAT_COLUMNS, drop_first=True)
+    low, high = X[NUM_COLUMNS].min(), X[NUM_COLUMNS].max()
+    X[NUM_COLUMNS] = (X[NUM_COLUMNS] - low) / (high - low)
+    split = rows * 3 // 4
+    return X[:split], X[split:], y[:split], y[split:]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--trials', type=int, default=27)
+    parser.add_argument('--parallel', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--eta', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        dataset_dir, _ = quantize_dataset(
+            save_snapshot(
+                os.path.join(work_dir, 'snapshots'),
+                *training_data(args.rows, args.seed),
+            )
+        )
+        settings = {'mode': 'disabled'}
+        full = run_sweep(
+            dataset_dir,
+            os.path.join(work_dir, 'full'),
+            args.trials,
+            args.parallel,
+            settings,
+            args.seed,
+            args.iterations,
+        )
+        halving = run_successive_halving(
+            dataset_dir,
+            os.path.join(work_dir, 'halving'),
+            args.trials,
+            args.parallel,
+            settings,
+            args.seed,
+            args.iterations,
+            args.eta,
+        )
+
+    for name, result in [('full budget', full), ('halving', halving)]:
+        report = result['report']
+        print(
+            f"{name:>12}: {report['iterations_trained']:>7} iterations "
+            f"{report['wall_seconds']:>8.1f}s  "
+            f"best AUC {result['best']['validation']['AUC']:.4f}"
+        )
+    full_report, halving_report = full['report'], halving['report']
+    print(
+        f"halving trained "
+        f"{1 - halving_report['iterations_trained'] / full_report['iterations_trained']:.0%}"
+        f" fewer iterations in "
+        f"{1 - halving_report['wall_seconds'] / full_report['wall_seconds']:.0%}"
+        f" less time"
+    )
+
+
+if __name__ == '__main__':
+    main()
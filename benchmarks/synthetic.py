@@ -0,0 +1,81 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+LOBBIES = ['regular', 'bankara_challenge', 'bankara_open', 'xmatch']
+MODES = ['nawabari', 'area', 'yagura', 'hoko', 'asari']
+STAGES = [
+    'amabi',
+    'chozame',
+    'gonzui',
+    'hirame',
+    'kinmedai',
+    'kombu',
+    'kusaya',
+    'mahimahi',
+    'manta',
+    'masaba',
+    'mategai',
+    'namero',
+    'nampla',
+    'sumeshi',
+    'taraport',
+    'yagara',
+    'yunohana',
+    'zatou',
+]
+WEAPONS = ['sshooter_collabo', 'rapid_deco', 'momiji', 'bamboo14mk1', 'sblast92']
+ABILITIES = '{"ink_saver_main":1.9,"intensify_action":1.9,"ink_resistance_up":0.3}'
+PLAYERS = [team + str(i) for team in ['A', 'B'] for i in range(1, 5)]
+
+
+def make_battles(
+    rows: int, day: str = '2023-07-01', seed: Optional[int] = 0
+) -> pd.DataFrame:
+    # Random battles laid out with the full stat.ink battle CSV schema
+    rng = np.random.default_rng(seed)
+    hours = rng.integers(0, 12, rows) * 2
+    data = {
+        '# season': 'Sizzle Season 2023',
+        'period': [f'{day}T{hour:02d}:00:00+00:00' for hour in hours],
+        'game-ver': '4.0.2',
+        'lobby': rng.choice(LOBBIES, rows),
+        'mode': rng.choice(MODES, rows),
+        'stage': rng.choice(STAGES, rows),
+        'time': rng.integers(100, 301, rows),
+        'win': rng.choice(['alpha', 'bravo'], rows),
+        'knockout': rng.random(rows) < 0.1,
+        'rank': 'S',
+        'power': np.nan,
+        'alpha-inked': rng.integers(2000, 6000, rows),
+        'alpha-ink-percent': np.nan,
+        'alpha-count': rng.integers(0, 100, rows),
+        'alpha-color': 'df6624ff',
+        'alpha-theme': np.nan,
+        'bravo-inked': rng.integers(2000, 6000, rows),
+        'bravo-ink-percent': np.nan,
+        'bravo-count': rng.integers(0, 100, rows),
+        'bravo-color': '343bc4ff',
+        'bravo-theme': np.nan,
+    }
+    for player in PLAYERS:
+        kill = rng.integers(0, 20, rows)
+        assist = rng.integers(0, 10, rows)
+        data[f'{player}-weapon'] = rng.choice(WEAPONS, rows)
+        data[f'{player}-kill-assist'] = kill + assist
+        data[f'{player}-kill'] = kill
+        data[f'{player}-assist'] = assist
+        data[f'{player}-death'] = rng.integers(0, 20, rows)
+        data[f'{player}-special'] = rng.integers(0, 10, rows)
+        data[f'{player}-inked'] = rng.integers(200, 2500, rows)
+        data[f'{player}-abilities'] = ABILITIES
+    for medal in range(1, 4):
+        data[f'medal{medal}-grade'] = 'silver'
+        data[f'medal{medal}-name'] = '#1 Ground Traveler'
+    data['event'] = np.nan
+    return pd.DataFrame(data)
+
+
+def write_battle_csv(path: str, rows: int, day: str = '2023-07-01', seed: int = 0):
+    make_battles(rows, day, seed).to_csv(path, index=False)
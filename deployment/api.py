@@ -1,116 +1,437 @@
-'''CatBoostClassifer import not used directly in code,
-but needed to import model from pickle file and make predictions'''
-# pylint: disable=unused-import
-
-
+# Heavy dependencies are imported where they are first needed: catboost when the
+# model is loaded, and scikit-learn only for models without a preprocessor
 import os
-import pickle
+import time
+import itertools
+from typing import IO, List, Tuple, Iterator, Optional
+from concurrent import futures
 
 import numpy as np
 import pandas as pd
-from flask import Flask, request, send_file, render_template
-from catboost import CatBoostClassifier
-from google.cloud import storage
-from sklearn.preprocessing import MinMaxScaler
+from flask import (
+    Flask,
+    Response,
+    g,
+    jsonify,
+    request,
+    send_file,
+    url_for,
+    render_template,
+    stream_with_context,
+)
+from jobs import DONE, QueueFull, JobManager
+from metrics import Registry
+from micro_batch import MicroBatcher
+from model_store import LoadedModel, ModelCache, GcsModelStore, LocalModelStore
+from prediction_cache import PredictionCache, feature_hashes
+from shadow import ShadowScorer, shadow_stores
+from battle_features import (
+    NUM_COLUMNS,
+    CAT_COLUMNS,
+    FEATURE_COLUMNS,
+    stat_columns,
+    engineer_features,
+)
 
 app = Flask('winner-prediction')
-UPLOAD_FOLDER = "/home/seacevedo/app/static/files"
+JOBS_DIR = os.environ.get('JOBS_DIR', '/home/seacevedo/app/jobs')
+
+# Served on /metrics for Prometheus. gunicorn.conf.py sets METRICS_DIR, so every
+# worker's metrics are included whichever worker answers the scrape.
+METRICS = Registry(os.environ.get('METRICS_DIR'))
+REQUEST_SECONDS = METRICS.histogram(
+    'api_request_duration_seconds', 'Time to handle a request', ['endpoint']
+)
+REQUESTS_IN_FLIGHT = METRICS.gauge(
+    'api_requests_in_flight', 'Requests being handled', ['endpoint']
+)
+STAGE_SECONDS = METRICS.histogram(
+    'scoring_stage_seconds', 'Time spent in each stage of scoring battles', ['stage']
+)
+BATTLES_SCORED = METRICS.counter(
+    'battles_scored_total',
+    'Battles scored, by whether the model or the prediction cache answered',
+    ['source'],
+)
+MODEL_LOAD_SECONDS = METRICS.histogram(
+    'model_load_seconds', 'Time to load each newly published prod model'
+)
+JOBS_IN_FLIGHT = METRICS.gauge('scoring_jobs_in_flight', 'Scoring jobs running')
+
+
+def model_store():
+    # Serve the model in MODEL_STORE_DIR when it is set, as the integration image does,
+    # and the published prod model in GCS otherwise
+    model_dir = os.environ.get('MODEL_STORE_DIR')
+    return LocalModelStore(model_dir) if model_dir else GcsModelStore()
+
+
+# CatBoost threads per prediction; gunicorn.conf.py sizes this per worker
+PREDICT_THREAD_COUNT = int(os.environ.get('PREDICT_THREAD_COUNT', '-1'))
+
+MODEL_CACHE = ModelCache(
+    model_store(),
+    float(os.environ.get('MODEL_REFRESH_SECONDS', '60')),
+    on_load=MODEL_LOAD_SECONDS.observe,
+)
+
+
+def legacy_model_input(df: pd.DataFrame, columns) -> pd.DataFrame:
+    # For models published without a preprocessor: the scaler is fitted on the batch
+    # pylint: disable=import-outside-toplevel
+    from sklearn.preprocessing import MinMaxScaler
+
+    X = df[NUM_COLUMNS + CAT_COLUMNS]
+
+    X = pd.get_dummies(X, columns=CAT_COLUMNS, drop_first=True)
 
+    scaler = MinMaxScaler()
+    scaler.fit(X[NUM_COLUMNS])
+    X[NUM_COLUMNS] = scaler.transform(X[NUM_COLUMNS])
 
-def prepare_features(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
-
-    new_column_list = [
-        '-kill-assist',
-        '-kill',
-        '-assist',
-        '-death',
-        '-special',
-        '-inked',
-    ]
-    team_list = ['A', 'B']
-
-    for column in new_column_list:
-        for team in team_list:
-            column_names = [("{0}" + column).format(team + str(i)) for i in range(1, 5)]
-            df[team + column] = df[column_names].sum(axis=1)
-
-    df['kill_diff'] = df['A-kill'] - df['B-kill']
-    df['assist_diff'] = df['A-assist'] - df['B-assist']
-    df['death_diff'] = df['A-death'] - df['B-death']
-    df['special_diff'] = df['A-special'] - df['B-special']
-    df['inked_diff'] = df['A-inked'] - df['B-inked']
-
-    num_columns = [
-        'time',
-        'kill_diff',
-        'assist_diff',
-        'death_diff',
-        'special_diff',
-        'inked_diff',
-    ]
-    cat_columns = ['mode', 'stage', 'lobby']
+    X = X.reindex(columns=columns).fillna(0)
 
-    df = df[num_columns + cat_columns]
+    one_hot_encoded_cols = list(set(columns).difference(NUM_COLUMNS))
 
-    return df
+    X[one_hot_encoded_cols] = X[one_hot_encoded_cols].astype(int)
 
+    return X
 
-def predict(df: pd.DataFrame):
-    storage_client = storage.Client()
-    bucket = storage_client.get_bucket('splatoon-data-bucket')
-    blob_cols = bucket.blob('../prod_model/one_hot_columns.pkl')
-    blob_model = bucket.blob('../prod_model/current_prod_model.pkl')
 
-    pickle_cols = blob_cols.download_as_string()
-    columns = pickle.loads(pickle_cols)
+def model_predictions(
+    loaded: LoadedModel, df: pd.DataFrame, thread_count: Optional[int] = None
+) -> np.ndarray:
+    model, columns, preprocessor, _, engine = loaded
+    thread_count = PREDICT_THREAD_COUNT if thread_count is None else thread_count
 
-    pickle_model = blob_model.download_as_string()
-    model = pickle.loads(pickle_model)
+    if engine is not None:
+        return engine.predict(df, thread_count=thread_count)
 
-    num_columns = [
-        'kill_diff',
-        'assist_diff',
-        'death_diff',
-        'special_diff',
-        'inked_diff',
-        'time',
-    ]
-    cat_columns = ['mode', 'stage', 'lobby']
+    if preprocessor is None:
+        X = legacy_model_input(df, columns)
+    else:
+        X = preprocessor.transform(df)
 
-    X = df[num_columns + cat_columns]
+    predictions = model.predict(X, thread_count=thread_count)
 
-    X = pd.get_dummies(X, columns=cat_columns, drop_first=True)
+    return predictions
 
-    scaler = MinMaxScaler()
-    scaler.fit(X[num_columns])
-    X[num_columns] = scaler.transform(X[num_columns])
 
-    X = X.reindex(columns=columns).fillna(0)
+PREDICTION_CACHE = PredictionCache(
+    int(os.environ.get('PREDICTION_CACHE_SIZE', '100000')),
+    float(os.environ.get('PREDICTION_CACHE_TTL', '3600')),
+)
 
-    one_hot_encoded_cols = list(set(columns).difference(num_columns))
 
-    X[one_hot_encoded_cols] = X[one_hot_encoded_cols].astype(int)
+def run_model(loaded: LoadedModel, df: pd.DataFrame) -> np.ndarray:
+    with STAGE_SECONDS.time('inference'):
+        predictions = model_predictions(loaded, df)
+    BATTLES_SCORED.inc('model', amount=len(df))
+    return predictions
 
-    predictions = model.predict(X)
 
+def prod_predictions(df: pd.DataFrame) -> np.ndarray:
+    # Battles scored recently by the same model are answered from the cache. Without
+    # a preprocessor a battle's prediction depends on the rest of its batch, which the
+    # numeric columns are scaled on, so those models are never cached.
+    with STAGE_SECONDS.time('model_fetch'):
+        loaded = MODEL_CACHE.get()
+    if not PREDICTION_CACHE.enabled or loaded.preprocessor is None:
+        return run_model(loaded, df)
+
+    with STAGE_SECONDS.time('cache_lookup'):
+        keys = feature_hashes(df)
+        cached = PREDICTION_CACHE.get_many(loaded.version, keys)
+        missing = np.array([value is None for value in cached])
+    BATTLES_SCORED.inc('cache', amount=len(df) - int(missing.sum()))
+    if not missing.any():
+        return np.asarray(cached)
+    predictions = run_model(loaded, df[missing])
+    PREDICTION_CACHE.put_many(loaded.version, keys[missing], predictions)
+    if missing.all():
+        return predictions
+    for position, prediction in zip(np.flatnonzero(missing), predictions):
+        cached[position] = prediction
+    return np.asarray(cached)
+
+
+SHADOW_SECONDS = METRICS.histogram(
+    'shadow_scoring_seconds',
+    'Time for a candidate model to score a batch in shadow',
+    ['model'],
+)
+SHADOW_BATTLES = METRICS.counter(
+    'shadow_battles_total', 'Battles scored in shadow by each candidate', ['model']
+)
+SHADOW_DISAGREEMENTS = METRICS.counter(
+    'shadow_disagreements_total',
+    'Battles a candidate predicted differently from the prod model',
+    ['model'],
+)
+
+
+def record_shadow_scoring(name: str, seconds: float, battles: int, disagreements: int):
+    SHADOW_SECONDS.observe(seconds, name)
+    SHADOW_BATTLES.inc(name, amount=battles)
+    SHADOW_DISAGREEMENTS.inc(name, amount=disagreements)
+
+
+# Candidate models scored next to the prod model, from SHADOW_MODELS entries like
+# candidate=gs://splatoon-data-bucket/candidates/1 or candidate=/path/to/model. They
+# use SHADOW_THREAD_COUNT CatBoost threads, so they take little CPU from requests.
+SHADOW_THREAD_COUNT = int(os.environ.get('SHADOW_THREAD_COUNT', '1'))
+SHADOW = ShadowScorer(
+    {
+        name: ModelCache(store, float(os.environ.get('MODEL_REFRESH_SECONDS', '60')))
+        for name, store in shadow_stores(os.environ.get('SHADOW_MODELS', '')).items()
+    },
+    lambda loaded, df: model_predictions(loaded, df, SHADOW_THREAD_COUNT),
+    max_queued=int(os.environ.get('SHADOW_MAX_QUEUED', '64')),
+    on_scored=record_shadow_scoring,
+)
+
+
+def predict(df: pd.DataFrame) -> np.ndarray:
+    # Prod predictions for engineered battles. Candidate models score the same
+    # features afterwards, off the request's path.
+    predictions = prod_predictions(df)
+    SHADOW.submit(df, predictions)
     return predictions
 
 
-def add_predictions(path: str, predictions: np.ndarray) -> pd.DataFrame:
-    df = pd.read_csv(path)
+def winner_labels(predictions: np.ndarray) -> np.ndarray:
     predictions = predictions.astype(str)
     predictions[predictions == '0'] = 'alpha'
     predictions[predictions == '1'] = 'bravo'
-    df['prediction'] = predictions
-    pred_location = os.path.join(UPLOAD_FOLDER, 'predictions.csv')
-    df.to_csv(pred_location)
+    return predictions
 
 
-@app.route("/download_predict", methods=['GET'])
-def download_predict():
-    csv_location = os.path.join(UPLOAD_FOLDER, 'predictions.csv')
-    return send_file(csv_location, as_attachment=True)
+def score_battles(df: pd.DataFrame) -> np.ndarray:
+    with STAGE_SECONDS.time('features'):
+        features = engineer_features(df, FEATURE_COLUMNS)
+    return predict(features)
+
+
+# Battle fields engineer_features needs from each battle
+NUMERIC_FIELDS = stat_columns() + ['time']
+BATTLE_FIELDS = NUMERIC_FIELDS + CAT_COLUMNS
+CSV_CHUNKSIZE = int(os.environ.get('CSV_CHUNKSIZE', '50000'))
+
+
+def read_csv_chunks(
+    source: IO[bytes], chunksize: Optional[int] = None
+) -> Tuple[List[str], Iterator[pd.DataFrame]]:
+    # The battle fields a stat.ink CSV export is missing, and its chunks as text.
+    # The first chunk is read here, so an upload can be rejected before a response
+    # starts streaming.
+    chunks = STAGE_SECONDS.time_each(
+        pd.read_csv(
+            source,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunksize or CSV_CHUNKSIZE,
+        ),
+        'csv_read',
+    )
+    first = next(chunks, None)
+    if first is None:
+        return [], iter([])
+    missing = [field for field in BATTLE_FIELDS if field not in first.columns]
+    return missing, itertools.chain([first], chunks)
+
+
+def score_csv_chunks(chunks: Iterator[pd.DataFrame]) -> Iterator[str]:
+    for number, chunk in enumerate(chunks):
+        with STAGE_SECONDS.time('csv_convert'):
+            battles = chunk[BATTLE_FIELDS].copy()
+            battles[NUMERIC_FIELDS] = battles[NUMERIC_FIELDS].apply(
+                pd.to_numeric, errors='coerce'
+            )
+        predictions = score_battles(battles)
+        with STAGE_SECONDS.time('csv_write'):
+            chunk['prediction'] = winner_labels(predictions)
+            text = chunk.to_csv(header=number == 0)
+        yield text
+
+
+def score_csv(source: IO[bytes], chunksize: Optional[int] = None) -> Iterator[str]:
+    # Score a stat.ink CSV export chunk by chunk, yielding the annotated CSV text. The
+    # file is parsed once, as text, so each battle is written back exactly as it was
+    # uploaded with its prediction appended, and memory is bounded by the chunk size.
+    missing, chunks = read_csv_chunks(source, chunksize)
+    if missing:
+        raise ValueError(f"Battles are missing fields: {', '.join(missing)}")
+    yield from score_csv_chunks(chunks)
+
+
+def batchable() -> bool:
+    # Models without a preprocessor scale battles on the batch they are scored in,
+    # so their requests are scored one by one rather than with each other
+    return MODEL_CACHE.get().preprocessor is not None
+
+
+BATCHER = MicroBatcher(
+    score_battles,
+    max_batch_size=int(os.environ.get('PREDICT_MAX_BATCH_SIZE', '64')),
+    max_wait=float(os.environ.get('PREDICT_MAX_WAIT_MS', '5')) / 1000,
+    batchable=batchable,
+)
+# Longest a /predict request waits for its batch to be scored
+PREDICT_TIMEOUT = float(os.environ.get('PREDICT_TIMEOUT_SECONDS', '30'))
+
+
+@app.route("/predict", methods=['POST'])
+def predict_json():
+    # Score one stat.ink battle, or a list of them, given as JSON objects with the
+    # same fields as the CSV export. Concurrent requests are scored together when the
+    # prod model has a preprocessor.
+    with STAGE_SECONDS.time('json_read'):
+        battles = request.get_json(force=True)
+        single = isinstance(battles, dict)
+        if not single and not (
+            isinstance(battles, list)
+            and all(isinstance(battle, dict) for battle in battles)
+        ):
+            return jsonify(error='Expected a battle object or a list of them'), 400
+        df = pd.DataFrame.from_records([battles] if single else battles)
+    missing = [field for field in BATTLE_FIELDS if field not in df.columns]
+    if len(df) == 0 or missing:
+        return jsonify(error='Battles are missing fields', missing=missing), 400
+    # Stats are coerced as score_csv does, but a value that isn't a number is
+    # rejected here rather than failing the batch it would be scored in
+    numeric = df[NUMERIC_FIELDS].apply(pd.to_numeric, errors='coerce')
+    invalid = [
+        field
+        for field in NUMERIC_FIELDS
+        if (numeric[field].isna() & df[field].notna()).any()
+    ]
+    if invalid:
+        return jsonify(error='Battles have non-numeric fields', invalid=invalid), 400
+    df[NUMERIC_FIELDS] = numeric
+    # Waiting for the batch to close and scoring it, features included
+    try:
+        with STAGE_SECONDS.time('micro_batch'):
+            predictions = BATCHER.predict(df, PREDICT_TIMEOUT)
+    except futures.TimeoutError:
+        return jsonify(error='Scoring timed out'), 503
+    predictions = winner_labels(predictions).tolist()
+    if single:
+        return jsonify(prediction=predictions[0])
+    return jsonify(predictions=predictions)
+
+
+@app.route("/predict/stats", methods=['GET'])
+def predict_stats():
+    return jsonify(
+        dict(BATCHER.stats(), cache=PREDICTION_CACHE.stats(), shadow=SHADOW.stats())
+    )
+
+
+@app.route("/predict_csv", methods=['POST'])
+def predict_csv():
+    # Stream the annotated CSV back while the upload, sent as file_csv or as the raw
+    # request body, is still being scored
+    csv_file = request.files.get('file_csv')
+    source = csv_file.stream if csv_file else request.stream
+    try:
+        missing, chunks = read_csv_chunks(source)
+    except pd.errors.EmptyDataError:
+        return jsonify(error='The CSV is empty'), 400
+    if missing:
+        return jsonify(error='Battles are missing fields', missing=missing), 400
+    return Response(
+        stream_with_context(score_csv_chunks(chunks)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=predictions.csv'},
+    )
+
+
+def score_csv_file(source_path: str, result_path: str) -> None:
+    with JOBS_IN_FLIGHT.track(), open(source_path, 'rb') as source:
+        with open(result_path, 'w', encoding='utf-8') as result:
+            result.writelines(score_csv(source))
+
+
+JOBS = JobManager(
+    JOBS_DIR,
+    score_csv_file,
+    max_workers=int(os.environ.get('SCORING_WORKERS', '2')),
+    max_queued=int(os.environ.get('SCORING_MAX_QUEUED', '32')),
+    ttl=float(os.environ.get('SCORING_RESULT_TTL', '3600')),
+)
+
+
+def submit_job(upload: IO[bytes]):
+    try:
+        with STAGE_SECONDS.time('upload'):
+            job_id = JOBS.submit(upload)
+    except QueueFull as error:
+        return None, (jsonify(error=str(error)), 503)
+    return job_id, None
+
+
+@app.route("/jobs", methods=['POST'])
+def create_job():
+    # Queue an upload, sent as file_csv or as the raw request body, for scoring
+    csv_file = request.files.get('file_csv')
+    job_id, error = submit_job(csv_file.stream if csv_file else request.stream)
+    if error:
+        return error
+    return (
+        jsonify(
+            job_id=job_id,
+            status_url=url_for('job_status', job_id=job_id),
+            result_url=url_for('job_result', job_id=job_id),
+        ),
+        202,
+    )
+
+
+@app.route("/jobs/stats", methods=['GET'])
+def job_stats():
+    return jsonify(JOBS.stats())
+
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+def job_status(job_id: str):
+    status = JOBS.status(job_id)
+    if status is None:
+        return jsonify(error='Unknown or expired job'), 404
+    return jsonify(status)
+
+
+@app.route("/jobs/<job_id>/result", methods=['GET'])
+def job_result(job_id: str):
+    status = JOBS.status(job_id)
+    if status is None:
+        return jsonify(error='Unknown or expired job'), 404
+    if status['status'] != DONE:
+        return jsonify(status), 409
+    return send_file(
+        JOBS.result_path(job_id), as_attachment=True, download_name='predictions.csv'
+    )
+
+
+@app.before_request
+def start_request_timer():
+    METRICS.start()
+    g.request_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc(request.endpoint or 'unknown')
+
+
+@app.teardown_request
+def observe_request(_error):
+    # Streamed responses are torn down once the last chunk has been sent
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unknown'
+        REQUESTS_IN_FLIGHT.dec(endpoint)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -118,12 +439,12 @@ def home():
     if request.method == "POST":
         csv_file = request.files["file_csv"]
         if csv_file:
-            csv_location = os.path.join(UPLOAD_FOLDER, csv_file.filename)
-            csv_file.save(csv_location)
-            df = prepare_features(csv_location)
-            pred = predict(df)
-            add_predictions(csv_location, pred)
-            return render_template("index.html", csv_loc=csv_file.filename)
+            job_id, error = submit_job(csv_file.stream)
+            if error:
+                return error
+            return render_template(
+                "index.html", csv_loc=csv_file.filename, job_id=job_id
+            )
     return render_template("index.html", csv_loc=None)
 
 
@@ -0,0 +1,39 @@
+import os
+import threading
+from typing import Callable, Optional
+
+
+class BackgroundThread:
+    # A daemon thread running target, started by the first call to start() in each
+    # process. Threads don't survive a fork, so a forked worker starts its own the
+    # first time it is used. on_fork runs in the forked child first, for the owner
+    # to replace the locks and queues it shares with the thread: one held at fork
+    # time would never be released there.
+    def __init__(
+        self,
+        target: Callable[[], None],
+        name: str,
+        on_fork: Optional[Callable[[], None]] = None,
+    ):
+        self.target = target
+        self.name = name
+        self.on_fork = on_fork
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        if self.on_fork is not None:
+            self.on_fork()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self.target, name=self.name, daemon=True
+                )
+                self._thread.start()
@@ -0,0 +1,45 @@
+# Production serving: gunicorn -c gunicorn.conf.py api:app
+#
+# The app, and with it the prod model, is loaded once in the master before the
+# workers are forked, so every worker shares the same copy of the model pages.
+# CatBoost gets an equal share of the cores in each worker rather than all of them.
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '9696')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+# Threads let one worker hold several requests for the JSON micro-batcher
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+preload_app = True
+timeout = 120
+
+# Set before the app is imported, so every worker shares one metrics directory
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='api-metrics-'))
+
+
+def when_ready(server):
+    # Load the model in the master after the app is imported, before any fork.
+    # Refreshing doesn't start the poller; each worker starts its own.
+    # pylint: disable=import-outside-toplevel
+    import api
+
+    api.MODEL_CACHE.refresh()
+    server.log.info(f'Loaded prod model version {api.MODEL_CACHE.version}')
+    for name, cache in api.SHADOW.models.items():
+        cache.refresh()
+        server.log.info(f'Loaded shadow model {name} version {cache.version}')
+
+
+def post_fork(server, worker):
+    # pylint: disable=import-outside-toplevel
+    import api
+
+    api.PREDICT_THREAD_COUNT = int(
+        os.environ.get(
+            'PREDICT_THREAD_COUNT', max(1, (os.cpu_count() or 1) // server.num_workers)
+        )
+    )
+    server.log.info(
+        f'Worker {worker.pid} scores with {api.PREDICT_THREAD_COUNT} CatBoost threads'
+    )
@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from typing import IO, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+UPLOAD_FILE = 'upload.csv'
+RESULT_FILE = 'predictions.csv'
+STATUS_FILE = 'status.json'
+JOB_ID = re.compile('[0-9a-f]{32}')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobManager:
+    # Scores uploads in the background on a bounded pool of worker threads. Every job
+    # has its own directory holding the upload, the result and a status file, so any
+    # API worker process can answer for a job, and finished jobs are removed once
+    # they are older than ttl seconds.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        jobs_dir: str,
+        score: Callable[[str, str], None],
+        max_workers: int = 2,
+        max_queued: int = 32,
+        ttl: float = 3600,
+    ):
+        self.jobs_dir = jobs_dir
+        self.score = score
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        self._busy_seconds = 0.0
+        self._started = time.monotonic()
+        self._last_cleanup = 0.0
+        self._after_fork()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # Pool threads don't survive a fork, so each worker process makes its own
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _job_path(self, job_id: str, name: str) -> str:
+        return os.path.join(self.jobs_dir, job_id, name)
+
+    def _write_status(self, job_id: str, **status) -> None:
+        status_fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.jobs_dir, job_id))
+        with os.fdopen(status_fd, 'w', encoding='utf-8') as status_file:
+            json.dump({'job_id': job_id, **status}, status_file)
+        os.replace(tmp_path, self._job_path(job_id, STATUS_FILE))
+
+    def submit(self, upload: IO[bytes]) -> str:
+        # Store the upload and queue it for scoring, returning the new job's ID
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.jobs_dir, job_id))
+        with self._lock:
+            full = self._counts[QUEUED] >= self.max_queued
+            if not full:
+                self._counts[QUEUED] += 1
+        if full:
+            shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+            raise QueueFull(f'{self.max_queued} jobs are already queued')
+
+        submitted = time.time()
+        try:
+            with open(self._job_path(job_id, UPLOAD_FILE), 'wb') as upload_file:
+                shutil.copyfileobj(upload, upload_file)
+            self._write_status(job_id, status=QUEUED, submitted=submitted)
+        except BaseException:
+            with self._lock:
+                self._counts[QUEUED] -= 1
+            shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+            raise
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix='scoring-job'
+                )
+        self._pool.submit(self._run, job_id, submitted)
+        return job_id
+
+    def _run(self, job_id: str, submitted: float) -> None:
+        with self._lock:
+            self._counts[QUEUED] -= 1
+            self._counts[RUNNING] += 1
+        started = time.time()
+        self._write_status(job_id, status=RUNNING, submitted=submitted, started=started)
+        result_path = self._job_path(job_id, RESULT_FILE)
+        try:
+            self.score(self._job_path(job_id, UPLOAD_FILE), result_path + '.tmp')
+            os.replace(result_path + '.tmp', result_path)
+            status = {'status': DONE}
+        except Exception as error:  # pylint: disable=broad-except
+            status = {'status': FAILED, 'error': str(error)}
+            # Whatever was written before the failure is not a result
+            if os.path.exists(result_path + '.tmp'):
+                os.remove(result_path + '.tmp')
+        finished = time.time()
+        os.remove(self._job_path(job_id, UPLOAD_FILE))
+        with self._lock:
+            self._counts[RUNNING] -= 1
+            self._counts[status['status']] += 1
+            self._busy_seconds += finished - started
+        self._write_status(
+            job_id, submitted=submitted, started=started, finished=finished, **status
+        )
+
+    def status(self, job_id: str) -> Optional[dict]:
+        # The job's status, or None for an unknown or expired job
+        if not JOB_ID.fullmatch(job_id):
+            return None
+        try:
+            with open(self._job_path(job_id, STATUS_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def result_path(self, job_id: str) -> str:
+        return self._job_path(job_id, RESULT_FILE)
+
+    def cleanup(self) -> None:
+        # Remove jobs that finished more than ttl seconds ago, at most once a minute
+        now = time.time()
+        if now - self._last_cleanup < min(60, self.ttl):
+            return
+        self._last_cleanup = now
+        if not os.path.isdir(self.jobs_dir):
+            return
+        for job_id in os.listdir(self.jobs_dir):
+            job_dir = os.path.join(self.jobs_dir, job_id)
+            status = self.status(job_id)
+            if status is None:
+                # Left behind by a process that stopped while storing the upload
+                finished = os.path.getmtime(job_dir)
+            else:
+                finished = status.get('finished', now)
+            if now - finished > self.ttl:
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        # Queue depth and pool utilisation in this process since it started
+        with self._lock:
+            counts = dict(self._counts)
+            busy_seconds = self._busy_seconds
+        elapsed = time.monotonic() - self._started
+        return {
+            'queue_depth': counts[QUEUED],
+            'running': counts[RUNNING],
+            'done': counts[DONE],
+            'failed': counts[FAILED],
+            'max_workers': self.max_workers,
+            'max_queued': self.max_queued,
+            'busy_workers': counts[RUNNING] / self.max_workers,
+            'utilisation': busy_seconds / (elapsed * self.max_workers),
+        }
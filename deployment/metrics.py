@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import tempfile
+import threading
+from typing import Dict, List, Tuple, Iterable, Iterator, Optional
+from contextlib import contextmanager
+
+from background import BackgroundThread
+
+# Upper bounds in seconds; scoring stages run from well under a millisecond for a
+# cached battle to seconds for a large CSV chunk
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{escape(str(value))}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    # A family of series, one per combination of label values. Updates take the
+    # registry's lock for a few dictionary operations, so recording is cheap enough
+    # for every request.
+    kind = ''
+
+    def __init__(self, registry, name: str, help_text: str, label_names: List[str]):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], object] = {}
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            json.dumps(labels): list(value) if isinstance(value, list) else value
+            for labels, value in self.values.items()
+        }
+
+    def render(self, values: Dict[Tuple[str, ...], object]) -> List[str]:
+        return [
+            f'{self.name}{format_labels(self.label_names, labels)} '
+            f'{format_value(value)}'
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    @contextmanager
+    def track(self, *labels: str) -> Iterator[None]:
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(Metric):
+    # Each series holds its count per bucket, not cumulated until rendering, then
+    # the sum and count of everything observed
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, label_names, buckets=None):
+        super().__init__(registry, name, help_text, label_names)
+        self.buckets = list(buckets or DEFAULT_BUCKETS)
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def time_each(self, items: Iterable, *labels: str) -> Iterator:
+        # Yield from items, observing how long each one took to produce
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            self.observe(time.perf_counter() - start, *labels)
+            yield item
+
+    def render(self, values: Dict[Tuple[str, ...], object]) -> List[str]:
+        lines = []
+        for labels, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], series[:-2]):
+                cumulative += count
+                bucket_labels = format_labels(
+                    self.label_names + ['le'], labels + (str(bound),)
+                )
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            series_labels = format_labels(self.label_names, labels)
+            lines.append(f'{self.name}_sum{series_labels} {format_value(series[-2])}')
+            lines.append(f'{self.name}_count{series_labels} {series[-1]}')
+        return lines
+
+
+def add(total, value):
+    if isinstance(value, list):
+        return value if total is None else [a + b for a, b in zip(total, value)]
+    return value if total is None else total + value
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    # The metrics of one process, rendered in Prometheus' text exposition format.
+    #
+    # Prefork servers run several processes behind one port, and a scrape reaches
+    # only one of them. With a directory, each process writes its values there every
+    # flush_interval seconds and renders the sum over every process's file, so the
+    # totals cover the whole server, at most flush_interval seconds behind for the
+    # other processes. Counters and histograms of processes that have exited are kept,
+    # so totals never go down; gauges only count live processes.
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics: List[Metric] = []
+        self._after_fork()
+        self._flusher = BackgroundThread(
+            self._flush_periodically, 'metrics-flush', on_fork=self._after_fork
+        )
+        os.register_at_fork(before=self.flush)
+        atexit.register(self.flush)
+
+    def _after_fork(self) -> None:
+        # A forked worker starts from zero; what the parent recorded before forking
+        # is in the parent's own file
+        self.lock = threading.Lock()
+        for metric in self.metrics:
+            metric.values = {}
+
+    def counter(self, name: str, help_text: str, labels=()) -> Counter:
+        return self._add(Counter(self, name, help_text, list(labels)))
+
+    def gauge(self, name: str, help_text: str, labels=()) -> Gauge:
+        return self._add(Gauge(self, name, help_text, list(labels)))
+
+    def histogram(self, name: str, help_text: str, labels=(), buckets=None):
+        return self._add(Histogram(self, name, help_text, list(labels), buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        with self.lock:
+            return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def flush(self) -> None:
+        # Write this process's values to its file in the directory
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot_fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(snapshot_fd, 'w', encoding='utf-8') as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(tmp_path, os.path.join(self.directory, f'{os.getpid()}.json'))
+
+    def start(self) -> None:
+        # Start flushing in this process; called on each request, so a forked worker
+        # starts its own flusher the first time it serves one
+        if self.directory:
+            self._flusher.start()
+
+    def _flush_periodically(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as error:
+                print(f'Writing metrics failed: {error}')
+
+    def _snapshots(self) -> Iterator[Tuple[bool, Dict[str, Dict[str, object]]]]:
+        # (live, snapshot) for this process and every other process that wrote one
+        yield True, self.snapshot()
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            pid, extension = os.path.splitext(name)
+            if extension != '.json' or int(pid) == os.getpid():
+                continue
+            try:
+                with open(
+                    os.path.join(self.directory, name), encoding='utf-8'
+                ) as snapshot_file:
+                    snapshot = json.load(snapshot_file)
+            except (OSError, ValueError):
+                continue
+            yield process_alive(int(pid)), snapshot
+
+    def render(self) -> str:
+        totals: Dict[str, Dict[Tuple[str, ...], object]] = {
+            metric.name: {} for metric in self.metrics
+        }
+        for live, snapshot in self._snapshots():
+            for metric in self.metrics:
+                if metric.kind == 'gauge' and not live:
+                    continue
+                values = totals[metric.name]
+                for labels, value in snapshot.get(metric.name, {}).items():
+                    labels = tuple(json.loads(labels))
+                    values[labels] = add(values.get(labels), value)
+
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(totals[metric.name]))
+        return '\n'.join(lines) + '\n'
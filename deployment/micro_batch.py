@@ -0,0 +1,152 @@
+import time
+import queue
+import threading
+from typing import Callable, Optional, NamedTuple
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+from background import BackgroundThread
+
+
+class Pending(NamedTuple):
+    df: pd.DataFrame
+    future: Future
+    submitted: float
+
+
+class MicroBatcher:
+    # Groups concurrent scoring requests into one model call. A batch closes once it
+    # holds max_batch_size rows or its first request has waited max_wait seconds, so
+    # max_wait bounds the latency added to a lone request. Each request gets back
+    # the slice of predictions for its own rows. While batchable returns False, the
+    # requests of a batch are scored one by one instead.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        score: Callable[[pd.DataFrame], np.ndarray],
+        max_batch_size: int = 64,
+        max_wait: float = 0.005,
+        history: int = 1000,
+        batchable: Optional[Callable[[], bool]] = None,
+    ):
+        self.score = score
+        self.batchable = batchable or (lambda: True)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._latencies = deque(maxlen=history)
+        self._batch_sizes = deque(maxlen=history)
+        self._counts = {'requests': 0, 'rows': 0, 'batches': 0, 'errors': 0}
+        self._after_fork()
+        self._worker = BackgroundThread(
+            self._run, 'micro-batcher', on_fork=self._after_fork
+        )
+
+    def _after_fork(self) -> None:
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+    def submit(self, df: pd.DataFrame) -> Future:
+        self._worker.start()
+        future = Future()
+        self._queue.put(Pending(df, future, time.perf_counter()))
+        return future
+
+    def predict(self, df: pd.DataFrame, timeout: Optional[float] = None) -> np.ndarray:
+        return self.submit(df).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        rows = len(batch[0].df)
+        deadline = batch[0].submitted + self.max_wait
+        while rows < self.max_batch_size:
+            try:
+                pending = self._queue.get(
+                    timeout=max(deadline - time.perf_counter(), 0)
+                )
+            except queue.Empty:
+                break
+            batch.append(pending)
+            rows += len(pending.df)
+        return batch, rows
+
+    def _score_each(self, batch) -> list:
+        # Each request scored on its own, with the error of any that fails
+        results = []
+        for pending in batch:
+            try:
+                results.append(np.asarray(self.score(pending.df)))
+            except Exception as error:  # pylint: disable=broad-except
+                results.append(error)
+        return results
+
+    def _score(self, batch) -> list:
+        # Predictions, or the error that scoring raised, for each request of a batch
+        try:
+            if len(batch) == 1 or not self.batchable():
+                return self._score_each(batch)
+            predictions = self.score(
+                pd.concat([pending.df for pending in batch], ignore_index=True)
+            )
+        except Exception:  # pylint: disable=broad-except
+            # Retry the requests one by one, so only those at fault fail. Checking
+            # whether they can be combined loads the model, which can fail too.
+            return self._score_each(batch)
+        offsets = np.cumsum([len(pending.df) for pending in batch])[:-1]
+        return np.split(np.asarray(predictions), offsets)
+
+    def _run(self) -> None:
+        while True:
+            batch, _ = self._collect()
+            try:
+                self._finish(batch, self._score(batch))
+            except Exception as error:  # pylint: disable=broad-except
+                # Fail the batch's requests rather than the worker thread, which
+                # would leave every later request waiting
+                failed = [pending for pending in batch if not pending.future.done()]
+                for pending in failed:
+                    pending.future.set_exception(error)
+                with self._lock:
+                    self._counts['errors'] += len(failed)
+
+    def _finish(self, batch, results: list) -> None:
+        finished = time.perf_counter()
+        scored = []
+        for pending, result in zip(batch, results):
+            if isinstance(result, Exception):
+                pending.future.set_exception(result)
+            else:
+                pending.future.set_result(result)
+                scored.append(pending)
+        rows = sum(len(pending.df) for pending in scored)
+        with self._lock:
+            self._counts['errors'] += len(batch) - len(scored)
+            if not scored:
+                return
+            self._counts['requests'] += len(scored)
+            self._counts['rows'] += rows
+            self._counts['batches'] += 1
+            self._batch_sizes.append(rows)
+            self._latencies.extend(finished - pending.submitted for pending in scored)
+
+    def stats(self) -> dict:
+        # Totals since start, and latency and batch size over the recent history
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            batch_sizes = np.array(self._batch_sizes)
+            stats = dict(self._counts)
+        stats.update(
+            queue_depth=self._queue.qsize(),
+            max_batch_size=self.max_batch_size,
+            max_wait_ms=self.max_wait * 1000,
+        )
+        if len(batch_sizes):
+            stats.update(
+                mean_batch_rows=float(batch_sizes.mean()),
+                max_batch_rows=int(batch_sizes.max()),
+                latency_ms={
+                    f'p{q}': float(np.percentile(latencies, q)) for q in [50, 95, 99]
+                },
+            )
+        return stats
@@ -0,0 +1,178 @@
+import os
+import time
+import posixpath
+import threading
+from typing import Any, List, Callable, Optional, NamedTuple
+
+from inference import InferenceEngine
+from preprocessing import Preprocessor
+from model_format import (
+    MODEL_MANIFEST,
+    PUBLISHED_FILES,
+    IncompleteModelError,
+    read_published_file,
+    load_published_model,
+)
+from background import BackgroundThread
+
+# Stores expose version(), a cheap fingerprint of the published files and their
+# manifest that changes whenever one is overwritten, and read(name), the bytes of one published file, which
+# raises FileNotFoundError when it isn't there.
+
+
+class GcsModelStore:
+    # Prod model objects in the bucket the training flow publishes to. The version is
+    # the generation number of each object, which GCS bumps on every overwrite.
+    def __init__(
+        self, bucket_name: str = 'splatoon-data-bucket', prefix: str = '../prod_model'
+    ):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._bucket = None
+        # The client's connections can't be shared with a forked worker
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            # Imported here so images that serve a local model don't need the client
+            # pylint: disable=import-outside-toplevel
+            from google.cloud import storage
+
+            self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def version(self) -> str:
+        generations = []
+        for name in PUBLISHED_FILES + [MODEL_MANIFEST]:
+            blob = self.bucket.get_blob(posixpath.join(self.prefix, name))
+            generations.append('-' if blob is None else str(blob.generation))
+        return ':'.join(generations)
+
+    def read(self, name: str) -> bytes:
+        # pylint: disable=import-outside-toplevel
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self.bucket.blob(
+                posixpath.join(self.prefix, name)
+            ).download_as_bytes()
+        except NotFound as error:
+            raise FileNotFoundError(
+                f'gs://{self.bucket_name}/{self.prefix}/{name}'
+            ) from error
+
+
+class LocalModelStore:
+    # Filesystem stand-in for GcsModelStore, used by the integration image and tests.
+    # The version is each file's modification time and size.
+    def __init__(self, model_dir: str):
+        self.model_dir = model_dir
+
+    def version(self) -> str:
+        versions = []
+        for name in PUBLISHED_FILES + [MODEL_MANIFEST]:
+            path = os.path.join(self.model_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                versions.append(f'{stat.st_mtime_ns}-{stat.st_size}')
+            else:
+                versions.append('-')
+        return ':'.join(versions)
+
+    def read(self, name: str) -> bytes:
+        return read_published_file(self.model_dir, name)
+
+
+class LoadedModel(NamedTuple):
+    model: Any
+    columns: List[str]
+    preprocessor: Optional[Preprocessor]
+    version: str
+    # None for models the array-native path can't score
+    engine: Optional[InferenceEngine]
+
+
+class ModelCache:
+    # The prod model, its column layout and preprocessing, loaded once per process and
+    # shared by every request. A background thread polls the store and swaps in a new
+    # set when the model is republished; requests keep whichever set they picked up.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        store,
+        refresh_interval: float = 60.0,
+        on_load: Optional[Callable[[float], None]] = None,
+    ):
+        self.store = store
+        self.refresh_interval = refresh_interval
+        # Called with the seconds each newly published model took to load
+        self.on_load = on_load
+        self._loaded: Optional[LoadedModel] = None
+        self._after_fork()
+        self._refresher = BackgroundThread(
+            self._poll, 'model-refresh', on_fork=self._after_fork
+        )
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def version(self) -> Optional[str]:
+        return None if self._loaded is None else self._loaded.version
+
+    def get(self) -> LoadedModel:
+        loaded = self._loaded
+        if loaded is None:
+            self.refresh()
+            loaded = self._loaded
+        self.start()
+        return loaded
+
+    def refresh(self) -> bool:
+        # Load the published model if its version differs from the one being served.
+        # Returns whether a new model was swapped in.
+        with self._lock:
+            version = self.store.version()
+            if self._loaded is not None and self._loaded.version == version:
+                return False
+            start = time.perf_counter()
+            try:
+                model, columns, preprocessor = load_published_model(self.store.read)
+            except IncompleteModelError:
+                # Part way through a publish: keep serving the current set until the
+                # manifest, uploaded last, matches every file
+                if self._loaded is None:
+                    raise
+                return False
+            if self._loaded is not None and self.store.version() != version:
+                # Republished mid-read, so the files may not match; retry next time
+                return False
+            engine = InferenceEngine.for_model(model, columns, preprocessor)
+            self._loaded = LoadedModel(model, columns, preprocessor, version, engine)
+        if self.on_load is not None:
+            self.on_load(time.perf_counter() - start)
+        return True
+
+    def start(self) -> None:
+        # Start polling in this process. A forked worker starts its own refresher the
+        # first time it serves a request.
+        if self.refresh_interval > 0:
+            self._refresher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _poll(self) -> None:
+        stop = self._stop
+        while not stop.wait(self.refresh_interval):
+            try:
+                if self.refresh():
+                    print(f'Loaded prod model version {self._loaded.version}')
+            except Exception as error:  # pylint: disable=broad-except
+                # Keep serving the current model until the store is readable again
+                print(f'Prod model refresh failed: {error}')
@@ -0,0 +1,100 @@
+import os
+import time
+import threading
+from typing import Any, List, Iterable, Optional
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from battle_features import NUM_COLUMNS, CAT_COLUMNS
+
+
+def feature_hashes(df: pd.DataFrame) -> np.ndarray:
+    # 64-bit hash of each engineered battle's model inputs. Numbers are hashed as
+    # floats and categories as text, so a battle hashes the same whether its fields
+    # were parsed from JSON, a CSV chunk or inferred dtypes.
+    features = pd.DataFrame(
+        df[NUM_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan), columns=NUM_COLUMNS
+    )
+    for column in CAT_COLUMNS:
+        features[column] = df[column].astype(str).to_numpy()
+    return pd.util.hash_pandas_object(features, index=False).to_numpy()
+
+
+class PredictionCache:
+    # Predictions of recently scored battles, by feature hash, for the model version
+    # that made them. Entries are dropped least recently used first once there are
+    # max_entries of them, once they are older than ttl seconds, and all at once when
+    # a new model version is looked up. A max_entries of 0 disables the cache.
+    def __init__(self, max_entries: int = 100_000, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._version: Optional[str] = None
+        self._entries: OrderedDict = OrderedDict()
+        self._counts = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+        self._after_fork()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _use_version(self, version: str) -> None:
+        if version != self._version:
+            if self._entries:
+                self._counts['invalidations'] += 1
+            self._entries.clear()
+            self._version = version
+
+    def get_many(self, version: str, keys: Iterable[int]) -> List[Optional[Any]]:
+        # The cached prediction for each key, or None where there isn't one
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            self._use_version(version)
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    self._counts['expirations'] += 1
+                    entry = None
+                if entry is None:
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[0])
+            hits = len(values) - values.count(None)
+            self._counts['hits'] += hits
+            self._counts['misses'] += len(values) - hits
+        return values
+
+    def put_many(self, version: str, keys: Iterable[int], values: Iterable[Any]):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._use_version(version)
+            for key, value in zip(keys, values):
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counts['evictions'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counts, entries=len(self._entries))
+        lookups = stats['hits'] + stats['misses']
+        stats.update(
+            max_entries=self.max_entries,
+            ttl_seconds=self.ttl,
+            hit_rate=stats['hits'] / lookups if lookups else None,
+        )
+        return stats
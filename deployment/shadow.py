@@ -0,0 +1,135 @@
+import time
+import queue
+import threading
+from typing import Any, Dict, Callable, Optional, NamedTuple
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from background import BackgroundThread
+from model_store import ModelCache, LoadedModel, GcsModelStore, LocalModelStore
+
+
+def shadow_stores(spec: str) -> Dict[str, Any]:
+    # Candidate model stores from 'name=location,...', where a location is either
+    # gs://bucket/prefix or a local model directory
+    stores = {}
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        name, location = entry.split('=', 1)
+        if location.startswith('gs://'):
+            bucket_name, _, prefix = location[len('gs://') :].partition('/')
+            stores[name] = GcsModelStore(bucket_name, prefix)
+        else:
+            stores[name] = LocalModelStore(location)
+    return stores
+
+
+class ShadowBatch(NamedTuple):
+    features: pd.DataFrame
+    predictions: np.ndarray
+
+
+class ShadowScorer:
+    # Scores the battles the prod model has just scored with candidate models too,
+    # on a background thread, and compares their predictions. Requests only pay for
+    # putting the engineered features on a queue; when scoring falls behind and
+    # the queue is full, batches are dropped rather than delaying requests.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        models: Dict[str, ModelCache],
+        score: Callable[[LoadedModel, pd.DataFrame], np.ndarray],
+        max_queued: int = 64,
+        history: int = 1000,
+        on_scored: Optional[Callable[[str, float, int, int], None]] = None,
+    ):
+        self.models = models
+        self.score = score
+        self.max_queued = max_queued
+        # Called with the model name, seconds taken, battles and disagreements
+        self.on_scored = on_scored
+        self._latencies = {name: deque(maxlen=history) for name in models}
+        self._counts = {
+            name: {'battles': 0, 'disagreements': 0, 'errors': 0} for name in models
+        }
+        self._dropped = 0
+        self._after_fork()
+        self._worker = BackgroundThread(
+            self._run, 'shadow-scorer', on_fork=self._after_fork
+        )
+
+    def _after_fork(self) -> None:
+        self._queue = queue.Queue(self.max_queued)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.models)
+
+    def submit(self, features: pd.DataFrame, predictions: np.ndarray) -> None:
+        # Queue battles and their prod predictions for shadow scoring. The features
+        # are shared, not copied, so callers must not modify them afterwards.
+        if not self.enabled:
+            return
+        self._worker.start()
+        try:
+            self._queue.put_nowait(ShadowBatch(features, np.asarray(predictions)))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = self._queue.get()
+            for name, cache in self.models.items():
+                self._score_candidate(name, cache, batch)
+            self._queue.task_done()
+
+    def _score_candidate(self, name: str, cache: ModelCache, batch: ShadowBatch):
+        start = time.perf_counter()
+        try:
+            predictions = np.asarray(self.score(cache.get(), batch.features))
+        except Exception as error:  # pylint: disable=broad-except
+            # A broken candidate mustn't stop the others, or the prod model
+            with self._lock:
+                self._counts[name]['errors'] += 1
+            print(f'Shadow model {name} failed: {error}')
+            return
+        seconds = time.perf_counter() - start
+        disagreements = int(
+            (predictions.astype(str) != batch.predictions.astype(str)).sum()
+        )
+        with self._lock:
+            counts = self._counts[name]
+            counts['battles'] += len(predictions)
+            counts['disagreements'] += disagreements
+            self._latencies[name].append(seconds)
+        if self.on_scored is not None:
+            self.on_scored(name, seconds, len(predictions), disagreements)
+
+    def join(self) -> None:
+        # Wait until every queued batch has been scored
+        self._queue.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {name: dict(values) for name, values in self._counts.items()}
+            latencies = {
+                name: np.array(values) * 1000
+                for name, values in self._latencies.items()
+            }
+            stats = {'dropped_batches': self._dropped, 'models': counts}
+        stats['queue_depth'] = self._queue.qsize()
+        for name, model_stats in counts.items():
+            cache = self.models[name]
+            model_stats['version'] = cache.version
+            battles = model_stats['battles']
+            model_stats['disagreement_rate'] = (
+                model_stats['disagreements'] / battles if battles else None
+            )
+            if len(latencies[name]):
+                model_stats['latency_ms'] = {
+                    f'p{q}': float(np.percentile(latencies[name], q))
+                    for q in [50, 95, 99]
+                }
+        return stats
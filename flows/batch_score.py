@@ -0,0 +1,201 @@
+'''Score daily stat.ink battle archives with the prod model.
+
+Scores the YYYY-MM-DD.csv files extract_battle_data downloads, optionally limited
+to a date range, on a pool of worker processes that each load the model once.
+Every day is written as its own Parquet partition under the output directory,
+and days whose archive and model haven't changed since they were last scored
+are skipped, so an interrupted run picks up where it stopped:
+
+    python batch_score.py ../data --start 2023-06-01 --end 2023-06-30
+    python batch_score.py ../data --output-dir ../data/scores --workers 4
+'''
+
+import os
+import re
+import hashlib
+import argparse
+from typing import Dict, List, Optional
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from inference import InferenceEngine
+from downloader import load_manifest, save_manifest
+from battle_store import partition_file, write_partition
+from model_format import PUBLISHED_FILES, read_published_file, load_published_model
+from battle_ingest import read_battle_csv
+from feature_cache import file_digest
+from battle_features import engineer_features
+
+SCORE_MANIFEST = '.score_manifest.json'
+ARCHIVE_NAME = re.compile(r'(\d{4}-\d{2}-\d{2})\.csv')
+# Battle details written next to each prediction
+OUTPUT_COLUMNS = ['battle_id', 'period', 'mode', 'stage', 'lobby', 'win']
+
+SCORED = 'scored'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+# Set in each worker process by load_worker_model
+WORKER_ENGINE: Optional[InferenceEngine] = None
+WORKER_THREAD_COUNT = -1
+
+
+def archive_files(
+    data_dir: str, start: Optional[str] = None, end: Optional[str] = None
+) -> List[str]:
+    # Daily archives in data_dir, oldest first, between start and end inclusive
+    days = []
+    for name in os.listdir(data_dir):
+        match = ARCHIVE_NAME.fullmatch(name)
+        if match and (start or '') <= match.group(1) <= (end or '9999'):
+            days.append(match.group(1))
+    return [os.path.join(data_dir, day + '.csv') for day in sorted(days)]
+
+
+def model_version(model_dir: str) -> str:
+    # Content hash of the published model files, so a retrained model rescores
+    # every day even if it was published with the same timestamps
+    digest = hashlib.sha256()
+    for name in PUBLISHED_FILES:
+        path = os.path.join(model_dir, name)
+        if os.path.isfile(path):
+            digest.update(f'{name}:{file_digest(path)}\n'.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def source_version(path: str) -> str:
+    stat = os.stat(path)
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
+def load_engine(model_dir: str) -> InferenceEngine:
+    model, columns, preprocessor = load_published_model(
+        partial(read_published_file, model_dir)
+    )
+    engine = InferenceEngine.for_model(model, columns, preprocessor)
+    if engine is None:
+        raise ValueError(f'The model in {model_dir} does not take the training layout')
+    return engine
+
+
+def load_worker_model(model_dir: str, thread_count: int) -> None:
+    # Process pool initializer: load the model once for every file the worker scores
+    global WORKER_ENGINE, WORKER_THREAD_COUNT  # pylint: disable=global-statement
+    WORKER_ENGINE = load_engine(model_dir)
+    WORKER_THREAD_COUNT = thread_count
+
+
+def score_file(source_path: str, output_path: str, chunksize: Optional[int]) -> int:
+    # Score one daily archive into its partition, returning the number of battles.
+    # The whole day is scored in one call, so models without a preprocessor scale
+    # on the day, as the training data was scaled on its window.
+    features = read_battle_csv(source_path, engineer_features, chunksize)
+    # The same battle can be uploaded to stat.ink more than once
+    features = features.drop_duplicates('battle_id')
+    scored = features[OUTPUT_COLUMNS].copy()
+    if len(features):
+        predictions = WORKER_ENGINE.predict(features, WORKER_THREAD_COUNT)
+        scored['prediction'] = np.where(
+            np.asarray(predictions).astype(str) == '1', 'bravo', 'alpha'
+        )
+    else:
+        scored['prediction'] = np.array([], dtype=object)
+    write_partition(scored, output_path)
+    return len(scored)
+
+
+def score_archives(
+    files: List[str],
+    output_dir: str,
+    model_dir: str,
+    workers: int = 1,
+    chunksize: Optional[int] = 50_000,
+    force: bool = False,
+) -> Dict[str, List[str]]:
+    # Score every archive not already scored with this model, returning the days
+    # scored, skipped and failed. Progress is recorded as each day finishes.
+    os.makedirs(output_dir, exist_ok=True)
+    version = model_version(model_dir)
+    manifest_path = os.path.join(output_dir, SCORE_MANIFEST)
+    manifest = load_manifest(manifest_path)
+    results = {SCORED: [], SKIPPED: [], FAILED: []}
+
+    pending = {}
+    for source_path in files:
+        day = os.path.splitext(os.path.basename(source_path))[0]
+        output_path = os.path.join(output_dir, partition_file(day))
+        source = source_version(source_path)
+        entry = manifest.get(day, {})
+        if (
+            not force
+            and entry.get('model') == version
+            and entry.get('source') == source
+            and os.path.isfile(output_path)
+        ):
+            results[SKIPPED].append(day)
+        else:
+            pending[day] = (source_path, output_path, source)
+    if not pending:
+        return results
+
+    thread_count = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(
+        workers, initializer=load_worker_model, initargs=(model_dir, thread_count)
+    ) as pool:
+        futures = {
+            pool.submit(score_file, source_path, output_path, chunksize): day
+            for day, (source_path, output_path, _) in pending.items()
+        }
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                rows = future.result()
+            except Exception as error:  # pylint: disable=broad-except
+                # One unreadable archive shouldn't stop the rest of the run
+                print(f'Failed to score {day}: {error}')
+                results[FAILED].append(day)
+                continue
+            manifest[day] = {
+                'model': version,
+                'source': pending[day][2],
+                'battles': rows,
+            }
+            save_manifest(manifest_path, manifest)
+            results[SCORED].append(day)
+
+    for status in results.values():
+        status.sort()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('data_dir', help='Directory of daily stat.ink CSV archives')
+    parser.add_argument('--start', help='First day to score, YYYY-MM-DD')
+    parser.add_argument('--end', help='Last day to score, YYYY-MM-DD')
+    parser.add_argument('--output-dir', help='Defaults to <data_dir>/scores')
+    parser.add_argument('--model-dir', default='../prod_model')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    parser.add_argument('--force', action='store_true', help='Rescore every day')
+    args = parser.parse_args()
+
+    files = archive_files(args.data_dir, args.start, args.end)
+    results = score_archives(
+        files,
+        args.output_dir or os.path.join(args.data_dir, 'scores'),
+        args.model_dir,
+        args.workers,
+        args.chunksize,
+        args.force,
+    )
+    print({status: len(days) for status, days in results.items()})
+    if results[FAILED]:
+        raise SystemExit(f"Failed to score {', '.join(results[FAILED])}")
+
+
+if __name__ == '__main__':
+    main()
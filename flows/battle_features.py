@@ -0,0 +1,73 @@
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+TEAMS = ['A', 'B']
+PLAYERS_PER_TEAM = 4
+STATS = ['kill', 'assist', 'death', 'special', 'inked']
+DIFF_COLUMNS = [stat + '_diff' for stat in STATS]
+
+NUM_COLUMNS = DIFF_COLUMNS + ['time']
+CAT_COLUMNS = ['mode', 'stage', 'lobby']
+# Model inputs, as used by training and the prediction API
+FEATURE_COLUMNS = NUM_COLUMNS + CAT_COLUMNS
+# Columns the transform writes for each battle, including the label and its identity
+TRANSFORM_COLUMNS = ['battle_id', 'period'] + NUM_COLUMNS + CAT_COLUMNS + ['win']
+# stat.ink exports carry no battle id, so a battle is identified by when and where it
+# was played, its length and result, and every player's counters
+IDENTITY_COLUMNS = ['period', 'lobby', 'mode', 'stage', 'win']
+
+
+def stat_columns() -> List[str]:
+    # Per-player stat columns ordered team, then player, then stat, so the values
+    # reshape directly into a (rows, team, player, stat) array
+    return [
+        f'{team}{player}-{stat}'
+        for team in TEAMS
+        for player in range(1, PLAYERS_PER_TEAM + 1)
+        for stat in STATS
+    ]
+
+
+def team_stat_diffs(df: pd.DataFrame) -> np.ndarray:
+    # Team A minus team B totals for every stat, computed in one pass. Blank stats
+    # count as zero, matching DataFrame.sum. Counters are whole numbers far below
+    # float32's exact integer range, so the float32 sums are exact.
+    values = df[stat_columns()].to_numpy(dtype=np.float32, na_value=np.nan)
+    totals = np.nansum(
+        values.reshape(len(df), len(TEAMS), PLAYERS_PER_TEAM, len(STATS)), axis=2
+    )
+    return (totals[:, 0] - totals[:, 1]).astype(np.int32)
+
+
+def battle_ids(df: pd.DataFrame) -> np.ndarray:
+    # Signed 64-bit hash of each battle's identity. Values are normalised first, so a
+    # battle hashes the same whether it was read with compact or inferred dtypes.
+    counters = df[stat_columns() + ['time']].to_numpy(dtype=np.float64, na_value=np.nan)
+    identity = pd.DataFrame(
+        np.nan_to_num(counters).astype(np.int64),
+        columns=stat_columns() + ['time'],
+    )
+    for column in IDENTITY_COLUMNS:
+        identity[column] = df[column].astype(str).to_numpy()
+    hashes = pd.util.hash_pandas_object(identity, index=False).to_numpy()
+    return hashes.view(np.int64)
+
+
+def engineer_features(
+    df: pd.DataFrame, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    # Build the modelling frame from raw stat.ink battles without materialising the
+    # intermediate per-team total columns
+    columns = columns or TRANSFORM_COLUMNS
+    diffs = team_stat_diffs(df)
+    data = {}
+    for column in columns:
+        if column in DIFF_COLUMNS:
+            data[column] = diffs[:, DIFF_COLUMNS.index(column)]
+        elif column == 'battle_id':
+            data[column] = battle_ids(df)
+        else:
+            data[column] = df[column].array
+    return pd.DataFrame(data, index=df.index)
@@ -0,0 +1,71 @@
+from typing import Dict, List, Callable, Optional
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+from battle_features import stat_columns
+
+# Counters are parsed as float32, since disconnected players leave blank cells and the
+# C parser is several times slower with nullable integer dtypes, then filled with 0 and
+# narrowed to these integer dtypes chunk by chunk
+COUNTER_DTYPES = {
+    'time': 'int16',
+    'kill': 'int16',
+    'assist': 'int16',
+    'death': 'int16',
+    'special': 'int16',
+    'inked': 'int32',
+}
+CATEGORY_COLUMNS = ['period', 'mode', 'stage', 'lobby', 'win']
+
+
+def counter_dtypes() -> Dict[str, str]:
+    dtypes = {'time': COUNTER_DTYPES['time']}
+    for column in stat_columns():
+        dtypes[column] = COUNTER_DTYPES[column.split('-', 1)[1]]
+    return dtypes
+
+
+def battle_dtypes() -> Dict[str, str]:
+    # Parse dtypes for the only stat.ink columns the pipeline uses
+    dtypes = {column: 'category' for column in CATEGORY_COLUMNS}
+    dtypes.update({column: 'float32' for column in counter_dtypes()})
+    return dtypes
+
+
+def narrow_counters(chunk: pd.DataFrame) -> pd.DataFrame:
+    # Blank counters count as zero, which is also how the team sums treat them
+    for column, dtype in counter_dtypes().items():
+        chunk[column] = chunk[column].fillna(0).astype(dtype)
+    return chunk
+
+
+def concat_battles(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    # pd.concat falls back to object columns when categoricals differ between frames,
+    # so align every categorical column on the union of its categories first
+    frames = [frame for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    frames = [frame.copy(deep=False) for frame in frames]
+    for column in frames[0].select_dtypes('category').columns:
+        categories = union_categoricals(
+            [frame[column] for frame in frames], ignore_order=True
+        ).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames)
+
+
+def read_battle_csv(
+    path: str,
+    reduce: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    chunksize: Optional[int] = 50_000,
+) -> pd.DataFrame:
+    # Read a stat.ink battle CSV with only the needed columns and compact dtypes. With a
+    # chunksize the file is streamed and each chunk is reduced before concatenating,
+    # so the wide raw frame never exists for the whole file at once.
+    dtypes = battle_dtypes()
+    chunks = pd.read_csv(path, usecols=list(dtypes), dtype=dtypes, chunksize=chunksize)
+    if chunksize is None:
+        chunks = [chunks]
+    reduce = reduce or (lambda chunk: chunk)
+    return concat_battles([reduce(narrow_counters(chunk)) for chunk in chunks])
@@ -0,0 +1,92 @@
+import io
+import os
+import shutil
+import posixpath
+from typing import List, Optional, Sequence
+from urllib.parse import quote
+
+import pandas as pd
+from downloader import atomic_write, load_manifest, save_manifest
+from feature_cache import file_digest
+
+PARTITION_DIR = 'battle_data'
+UPLOAD_MANIFEST = '.gcs_manifest.json'
+
+
+def partition_file(day: str) -> str:
+    # Hive-style path of a battle day's partition, relative to the partition root
+    return posixpath.join(f'battle_date={day}', f'{day}.parquet')
+
+
+def write_partition(df: pd.DataFrame, path: str) -> None:
+    # Write one battle day as compressed Parquet, with period as a real timestamp so
+    # the warehouse can partition on it
+    df = df.assign(period=pd.to_datetime(df['period'].astype(str), utc=True))
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, compression='zstd', index=False)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, [buffer.getvalue()])
+
+
+class LocalBucket:
+    # Filesystem stand-in for prefect_gcp's GcsBucket, covering the calls the flows
+    # make. Object names such as '../prod_model/x.pkl' are stored flat, URL-quoted.
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _object_path(self, path: str) -> str:
+        return os.path.join(self.root, quote(path, safe=''))
+
+    def upload_from_path(self, from_path: str, to_path: Optional[str] = None) -> str:
+        to_path = to_path or os.path.basename(from_path)
+        shutil.copyfile(from_path, self._object_path(to_path))
+        return to_path
+
+    def read_path(self, path: str) -> bytes:
+        with open(self._object_path(path), 'rb') as object_file:
+            return object_file.read()
+
+
+def sync_folder(
+    bucket,
+    from_folder: str,
+    to_folder: Optional[str] = None,
+    last: Sequence[str] = (),
+) -> List[str]:
+    # Upload the files under from_folder whose content hash differs from the one recorded
+    # in the folder's local manifest at their last upload. Hidden files are skipped. The
+    # relative paths in last go up after every other file, for files such as a model
+    # manifest that readers take as the sign the rest is complete.
+    if not os.path.isdir(from_folder):
+        return []
+    to_folder = from_folder if to_folder is None else to_folder
+    manifest_path = os.path.join(from_folder, UPLOAD_MANIFEST)
+    manifest = load_manifest(manifest_path)
+    relative_paths = []
+    for dir_path, dir_names, file_names in os.walk(from_folder):
+        dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+        for file_name in sorted(file_names):
+            if file_name.startswith('.'):
+                continue
+            local_path = os.path.join(dir_path, file_name)
+            relative_path = os.path.relpath(local_path, from_folder)
+            relative_paths.append(relative_path.replace(os.sep, '/'))
+    # A stable sort keeps the walk order within both groups
+    relative_paths.sort(key=lambda path: path in last)
+    uploaded = []
+    try:
+        for relative_path in relative_paths:
+            local_path = os.path.join(from_folder, relative_path)
+            digest = file_digest(local_path)
+            if manifest.get(relative_path) == digest:
+                continue
+            bucket.upload_from_path(
+                local_path, posixpath.join(to_folder, relative_path)
+            )
+            manifest[relative_path] = digest
+            uploaded.append(relative_path)
+    finally:
+        # Record whatever was uploaded, so an interrupted sync resumes where it stopped
+        save_manifest(manifest_path, manifest)
+    return uploaded
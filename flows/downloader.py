@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import tempfile
+from typing import Any, Dict, List, Tuple, Iterable, Optional
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+STAT_INK_URL = 'https://dl-stats.stats.ink/splatoon-3/battle-results-csv'
+MANIFEST_NAME = '.download_manifest.json'
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+DOWNLOADED = 'downloaded'
+NOT_MODIFIED = 'not_modified'
+MISSING = 'missing'
+FAILED = 'failed'
+
+
+def battle_file_name(day: date) -> str:
+    return day.strftime('%Y-%m-%d') + '.csv'
+
+
+def battle_file_url(day: date, base_url: str = STAT_INK_URL) -> str:
+    # stat.ink publishes one CSV per day under <year>/<month>/<yyyy-mm-dd>.csv
+    return (
+        base_url.rstrip('/')
+        + '/'
+        + day.strftime('%Y')
+        + '/'
+        + day.strftime('%m')
+        + '/'
+        + battle_file_name(day)
+    )
+
+
+def make_session(pool_size: int) -> requests.Session:
+    # A single session shares keep-alive connections between all download threads
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def load_manifest(manifest_path: str) -> Dict[str, Any]:
+    # A JSON manifest written by save_manifest, or an empty one if there is none yet
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(manifest_path: str, manifest: Dict[str, Any]) -> None:
+    atomic_write(
+        manifest_path,
+        [json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8')],
+    )
+
+
+def atomic_write(
+    path: str, chunks: Iterable[bytes], expected_size: Optional[int] = None
+) -> int:
+    # Write to a temporary file next to the target and rename it into place, so an
+    # interrupted or short write never leaves a partial file under the final name
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory or '.', prefix='.' + name, suffix='.part'
+    )
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            for chunk in chunks:
+                tmp_file.write(chunk)
+                size += len(chunk)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        if expected_size is not None and expected_size != size:
+            raise IOError(f'{path}: expected {expected_size} bytes, got {size}')
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size
+
+
+def _conditional_headers(path: str, validators: Dict[str, str]) -> Dict[str, str]:
+    headers = {}
+    if not os.path.isfile(path):
+        return headers
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def fetch_file(
+    session: requests.Session,
+    url: str,
+    path: str,
+    validators: Dict[str, str],
+    retries: int = 3,
+    backoff: float = 0.5,
+    timeout: float = 30,
+) -> Tuple[str, Dict[str, str]]:
+    # Download a single file, returning its status and the validators to store for the next run
+    headers = _conditional_headers(path, validators)
+    for attempt in range(retries + 1):
+        try:
+            with session.get(
+                url, headers=headers, timeout=timeout, stream=True
+            ) as response:
+                if response.status_code == 304:
+                    return NOT_MODIFIED, validators
+                if response.status_code == 404:
+                    return MISSING, {}
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    # Content-Length only describes the body size when it isn't encoded
+                    expected_size = None
+                    if 'Content-Encoding' not in response.headers:
+                        expected_size = response.headers.get('Content-Length')
+                    atomic_write(
+                        path,
+                        response.iter_content(chunk_size=1 << 16),
+                        int(expected_size) if expected_size is not None else None,
+                    )
+                    return DOWNLOADED, {
+                        'etag': response.headers.get('ETag', ''),
+                        'last_modified': response.headers.get('Last-Modified', ''),
+                    }
+        except (requests.exceptions.RequestException, IOError) as error:
+            print(f'Attempt {attempt + 1} for {url} failed: {error}')
+        if attempt < retries:
+            time.sleep(backoff * 2**attempt)
+    return FAILED, validators
+
+
+def download_battle_files(
+    days: List[date],
+    data_path: str,
+    max_workers: int = 8,
+    base_url: str = STAT_INK_URL,
+    retries: int = 3,
+    backoff: float = 0.5,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, List[str]]:
+    # Fetch the daily CSVs for the given days with a bounded number of concurrent requests
+    os.makedirs(data_path, exist_ok=True)
+    manifest_path = os.path.join(data_path, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    session = session or make_session(max_workers)
+
+    def fetch_day(day: date) -> Tuple[str, str, Dict[str, str]]:
+        file_name = battle_file_name(day)
+        status, validators = fetch_file(
+            session,
+            battle_file_url(day, base_url),
+            os.path.join(data_path, file_name),
+            manifest.get(file_name, {}),
+            retries=retries,
+            backoff=backoff,
+        )
+        return file_name, status, validators
+
+    results: Dict[str, List[str]] = {
+        DOWNLOADED: [],
+        NOT_MODIFIED: [],
+        MISSING: [],
+        FAILED: [],
+    }
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for file_name, status, validators in executor.map(fetch_day, days):
+            results[status].append(file_name)
+            if status == DOWNLOADED:
+                manifest[file_name] = validators
+            elif status == MISSING:
+                manifest.pop(file_name, None)
+
+    save_manifest(manifest_path, manifest)
+    return results
@@ -0,0 +1,59 @@
+import io
+import os
+import glob
+import hashlib
+from typing import Tuple, Callable
+
+import pandas as pd
+from downloader import atomic_write
+
+
+def file_digest(path: str, salt: str = '') -> str:
+    # Content hash of a file, read in blocks so large daily exports aren't held in memory
+    digest = hashlib.sha256(salt.encode('utf-8'))
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DayFeatureCache:
+    # Stores the engineered features of each daily CSV as its own Parquet file, named after
+    # the hash of the source file. A day is only recomputed when its CSV is new or has
+    # changed, or when the feature version changes.
+    def __init__(
+        self,
+        cache_path: str,
+        compute: Callable[[str], pd.DataFrame],
+        version: str = '1',
+    ):
+        self.cache_path = cache_path
+        self.compute = compute
+        self.version = version
+        os.makedirs(cache_path, exist_ok=True)
+
+    def _stem(self, source_path: str) -> str:
+        return os.path.splitext(os.path.basename(source_path))[0]
+
+    def entry_path(self, source_path: str, digest: str) -> str:
+        return os.path.join(
+            self.cache_path, f'{self._stem(source_path)}-{digest[:16]}.parquet'
+        )
+
+    def load(self, source_path: str) -> Tuple[pd.DataFrame, bool]:
+        # Return the features for a daily CSV and whether they had to be recomputed
+        digest = file_digest(source_path, salt=self.version)
+        entry = self.entry_path(source_path, digest)
+        if os.path.isfile(entry):
+            return pd.read_parquet(entry), False
+
+        for stale in glob.glob(
+            os.path.join(self.cache_path, self._stem(source_path) + '-*.parquet')
+        ):
+            os.remove(stale)
+
+        df = self.compute(source_path)
+        buffer = io.BytesIO()
+        df.to_parquet(buffer)
+        atomic_write(entry, [buffer.getvalue()])
+        return df, True
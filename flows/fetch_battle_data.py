@@ -1,36 +1,68 @@
+# prefect_gcp is imported by the tasks that talk to GCP, so importing the flows
+# doesn't pay for it before any work starts
+# pylint: disable=import-outside-toplevel
+
 import os
+from typing import List, Optional
 from datetime import date, timedelta
 
 import pandas as pd
-import requests
 from prefect import task
-from prefect_gcp import GcpCredentials
-from prefect_gcp.bigquery import bigquery_query, bigquery_load_cloud_storage
-from prefect_gcp.cloud_storage import GcsBucket
-
-
-@task(name='Load data to bucket')
+from battle_store import (
+    PARTITION_DIR,
+    sync_folder,
+    partition_file,
+    write_partition,
+)
+from battle_ingest import read_battle_csv
+from model_format import MODEL_MANIFEST
+from battle_features import engineer_features
+from downloader import FAILED, download_battle_files
+from warehouse import BigQueryWarehouse, load_partitions
+from feature_cache import DayFeatureCache
+
+
+@task(name='Load data to bucket', log_prints=True)
 def load_battle_data_gcs(data_path: str) -> None:
-    # Write data to gcs bucket
-    gcs_block = GcsBucket.load("splatoon-battle-data")
-    gcs_block.upload_from_folder(from_folder=data_path, to_folder=data_path)
-
-
-def upload_data_bigquery(file_name: str, data_path: str) -> None:
-    # Upload data to BigQuery from appropriate file
-    gcp_credentials_block = GcpCredentials.load("gcp-creds")
+    # Write data to gcs bucket, skipping files whose hash matches their last upload
+    from prefect_gcp.cloud_storage import GcsBucket
 
-    bigquery_load_cloud_storage(
-        dataset="splatoon_battle_data",
-        table="battle_data",
-        uri=f"gs://splatoon-data-bucket/{data_path}/{file_name}",
-        gcp_credentials=gcp_credentials_block,
-        location='us-central1',
+    gcs_block = GcsBucket.load("splatoon-battle-data")
+    uploaded = sync_folder(
+        gcs_block, from_folder=data_path, to_folder=data_path, last=[MODEL_MANIFEST]
     )
+    print(f'Uploaded {len(uploaded)} changed files from {data_path}')
+
+
+@task(name='Load data to BigQuery', log_prints=True)
+def upload_data_bigquery(
+    data_path: str,
+    dataset: str = 'splatoon_battle_data',
+    table: str = 'battle_data',
+    warehouse=None,
+) -> List[str]:
+    # Upload data to BigQuery, one battle day at a time. Days already loaded from an
+    # identical partition are skipped and changed days replace their partition, so
+    # rerunning the pipeline never duplicates battles.
+    if warehouse is None:
+        from prefect_gcp import GcpCredentials
+
+        warehouse = BigQueryWarehouse(
+            GcpCredentials.load("gcp-creds"),
+            dataset,
+            table,
+            f"gs://splatoon-data-bucket/{data_path}/{PARTITION_DIR}",
+        )
+    loaded_days = load_partitions(warehouse, data_path)
+    print(f'Loaded {len(loaded_days)} battle days: {loaded_days}')
+    return loaded_days
 
 
 def retrieve_data_bq(query: str) -> pd.DataFrame:
     # Query BigQuery Dataset
+    from prefect_gcp import GcpCredentials
+    from prefect_gcp.bigquery import bigquery_query
+
     gcp_credentials_block = GcpCredentials.load("gcp-creds")
     df = bigquery_query(
         query, gcp_credentials_block, to_dataframe=True, location='us-central1'
@@ -38,41 +70,41 @@ def retrieve_data_bq(query: str) -> pd.DataFrame:
     return df
 
 
+def retrieve_days_bq(table_ref: str, start: date, end: date) -> pd.DataFrame:
+    # Query every battle played from start to end inclusive, as used by WindowCache
+    return retrieve_data_bq(f'''SELECT * FROM `{table_ref}`
+            WHERE DATE(period) BETWEEN '{start}' AND '{end}'
+            ORDER BY period;''')
+
+
 @task(name="Extract Splatoon Battle Data", log_prints=True)
-def extract_battle_data(data_path: str, num_months: int) -> None:
+def extract_battle_data(data_path: str, num_months: int, max_workers: int = 8) -> None:
     # Extract battle data from stat.ink from a specified number of months from the current date
-    os.makedirs(data_path, exist_ok=True)
     date_list = pd.date_range(
         start=date.today() - timedelta(days=30 * num_months + 1),
         end=date.today(),
         freq='D',
     )
-    for item in date_list:
-        file_name = (
-            str(item.year)
-            + '-'
-            + str(item.strftime("%m"))
-            + '-'
-            + str(item.strftime("%d"))
-            + '.csv'
-        )
-        file_url = (
-            'https://dl-stats.stats.ink/splatoon-3/battle-results-csv/'
-            + str(item.year)
-            + '/'
-            + str(item.strftime("%m"))
-            + '/'
-            + file_name
-        )
-        if not os.path.isfile(data_path + '/' + file_name):
-            response = requests.get(file_url, timeout=5)
-            with open(data_path + '/' + file_name, 'wb') as file:
-                file.write(response.content)
+    results = download_battle_files(
+        [item.date() for item in date_list], data_path, max_workers=max_workers
+    )
+    print({status: len(file_names) for status, file_names in results.items()})
+    if results[FAILED]:
+        raise RuntimeError(f"Failed to download {', '.join(results[FAILED])}")
+
+
+# Bump when battle_features.engineer_features changes so cached days are recomputed
+FEATURE_VERSION = '3'
 
 
 @task(name="Transform Splatoon Battle Data", log_prints=True)
-def transform_battle_data(data_path: str, num_months: int) -> str:
-    # Extract features from existing battle data features
+def transform_battle_data(
+    data_path: str, num_months: int, chunksize: Optional[int] = 50_000
+) -> List[str]:
+    # Extract features from existing battle data features into one compressed Parquet
+    # partition per battle day. Each day's features are cached by the hash of its CSV,
+    # so only new or changed days are read, aggregated and written again. stat.ink
+    # files each cover a single day, so a file maps to exactly one partition.
     date_list = pd.date_range(
         start=date.today() - timedelta(days=num_months * 30 + 1),
         end=date.today(),
@@ -89,45 +121,25 @@ def transform_battle_data(data_path: str, num_months: int) -> str:
         + '.csv'
         for date in date_list
     ]
-    # all_filenames = list(glob.glob(str(data_path) + f'/*.{0}'.format('csv')))
-    df = pd.concat([pd.read_csv(f) for f in all_filenames])
-
-    new_column_list = [
-        '-kill-assist',
-        '-kill',
-        '-assist',
-        '-death',
-        '-special',
-        '-inked',
-    ]
-    team_list = ['A', 'B']
-
-    for column in new_column_list:
-        for team in team_list:
-            column_names = [("{0}" + column).format(team + str(i)) for i in range(1, 5)]
-            df[team + column] = df[column_names].sum(axis=1)
-
-    df['kill_diff'] = df['A-kill'] - df['B-kill']
-    df['assist_diff'] = df['A-assist'] - df['B-assist']
-    df['death_diff'] = df['A-death'] - df['B-death']
-    df['special_diff'] = df['A-special'] - df['B-special']
-    df['inked_diff'] = df['A-inked'] - df['B-inked']
-
-    num_columns = [
-        'period',
-        'kill_diff',
-        'assist_diff',
-        'death_diff',
-        'special_diff',
-        'inked_diff',
-        'time',
-    ]
-    cat_columns = ['mode', 'stage', 'lobby', 'win']
-
-    df = df[num_columns + cat_columns]
-
-    file_name = str(date.today()) + '_merged.csv'
-
-    df.to_csv(os.path.join(data_path, file_name))
+    cache = DayFeatureCache(
+        os.path.join(data_path, 'feature_cache'),
+        # The same battle can be uploaded to stat.ink more than once
+        lambda path: read_battle_csv(
+            path, engineer_features, chunksize
+        ).drop_duplicates('battle_id'),
+        version=FEATURE_VERSION,
+    )
 
-    return file_name
+    written = []
+    # Days stat.ink has not published yet are skipped rather than failing the run
+    for file_path in filter(os.path.isfile, all_filenames):
+        day_df, is_new = cache.load(file_path)
+        day = os.path.splitext(os.path.basename(file_path))[0]
+        partition = partition_file(day)
+        partition_path = os.path.join(data_path, PARTITION_DIR, partition)
+        if is_new or not os.path.isfile(partition_path):
+            write_partition(day_df, partition_path)
+            written.append(partition)
+    print(f'Wrote {len(written)} partitions')
+
+    return written
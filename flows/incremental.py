@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import pickle
+import tempfile
+from typing import Any, Dict, List, Tuple, Optional
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sweep import make_classifier
+from downloader import atomic_write, load_manifest, save_manifest
+from window_cache import battle_days
+from model_format import (
+    NATIVE_MODEL_FILE,
+    PICKLED_MODEL_FILE,
+    load_prod_model,
+    write_model_manifest,
+)
+from preprocessing import PREPROCESSOR_FILE, Preprocessor
+
+# scikit-learn and catboost are imported by the functions that use them
+# pylint: disable=import-outside-toplevel
+
+# What the prod model was trained on, kept next to it
+TRAINING_FILE = 'training.json'
+REPORT_FILE = 'retraining_report.jsonl'
+
+FULL = 'full'
+INCREMENTAL = 'incremental'
+SKIP = 'skip'
+
+
+def load_training_state(model_dir: str) -> Dict[str, Any]:
+    return load_manifest(os.path.join(model_dir, TRAINING_FILE))
+
+
+def save_training_state(model_dir: str, state: Dict[str, Any]) -> None:
+    save_manifest(os.path.join(model_dir, TRAINING_FILE), state)
+
+
+def choose_retraining(
+    state: Dict[str, Any],
+    today: date,
+    full_retrain_days: int,
+    drift_threshold: float,
+) -> Tuple[str, str]:
+    # Whether to retrain from scratch, continue boosting the prod model on the days
+    # since it was trained, or keep it, and why
+    if not state.get('parameters') or not state.get('trained_through'):
+        return FULL, 'no training record for the prod model'
+    drift = state.get('drift')
+    if drift is not None and drift > drift_threshold:
+        return FULL, f'prediction drift {drift:.3f} above {drift_threshold}'
+    last_full = date.fromisoformat(state['last_full_retrain'])
+    if (today - last_full).days >= full_retrain_days:
+        return FULL, f'last full retrain on {last_full}'
+    trained_through = date.fromisoformat(state['trained_through'])
+    if trained_through >= today - timedelta(days=1):
+        return SKIP, f'no complete day since {trained_through}'
+    return INCREMENTAL, f'days after {trained_through}'
+
+
+def record_full_retrain(
+    model_dir: str, parameters: Dict[str, Any], trained_through: date, today: date
+) -> None:
+    save_training_state(
+        model_dir,
+        {
+            'parameters': dict(parameters),
+            'trained_through': str(trained_through),
+            'last_full_retrain': str(today),
+            'drift': None,
+        },
+    )
+
+
+def record_drift(model_dir: str, drift: float) -> None:
+    # Keep the prod model's latest prediction drift for the next run's decision
+    state = load_training_state(model_dir)
+    if state:
+        state['drift'] = float(drift)
+        save_training_state(model_dir, state)
+
+
+def labels(df: pd.DataFrame) -> np.ndarray:
+    # LabelBinarizer's encoding of win, as feature_engineering fits it
+    return (df['win'].astype(str) == 'bravo').to_numpy(dtype=np.int64)
+
+
+def holdout_metrics(model, X: pd.DataFrame, y: np.ndarray) -> Dict[str, float]:
+    from sklearn.metrics import log_loss, roc_auc_score, accuracy_score
+
+    probabilities = model.predict_proba(X)[:, 1]
+    return {
+        'AUC': float(roc_auc_score(y, probabilities)) if len(set(y)) > 1 else None,
+        'Accuracy': float(accuracy_score(y, probabilities > 0.5)),
+        'Logloss': float(log_loss(y, probabilities, labels=[0, 1])),
+    }
+
+
+def continue_training(
+    df: pd.DataFrame,
+    model_dir: str,
+    until: date,
+    iterations: int = 200,
+    holdout_fraction: float = 0.25,
+    seed: int = 0,
+):
+    # Continue boosting the prod model on the battles of the days after it was
+    # trained, up to until. The new days go through the prod model's preprocessor,
+    # so the added trees see the features scaled as the existing ones did, and a
+    # random holdout of them is used for early stopping and to compare the updated
+    # model with the one it replaces. Returns the updated model and its report, or
+    # None and None when there are no battles on those days.
+    from catboost import Pool
+
+    state = load_training_state(model_dir)
+    trained_through = date.fromisoformat(state['trained_through'])
+    days = battle_days(df['period'])
+    new = df[(days > np.datetime64(trained_through)) & (days <= np.datetime64(until))]
+    if new.empty:
+        return None, None
+    with open(
+        os.path.join(model_dir, PREPROCESSOR_FILE), 'r', encoding='utf-8'
+    ) as preprocessor_file:
+        preprocessor = Preprocessor.from_json(preprocessor_file.read())
+    X = preprocessor.transform(new)
+    y = labels(new)
+    holdout = np.random.default_rng(seed).random(len(X)) < holdout_fraction
+
+    start = time.perf_counter()
+    prod_model = load_prod_model(model_dir)
+    cat_features = X.select_dtypes(['uint8']).columns.to_list()
+    model = make_classifier(state['parameters'], iterations=iterations)
+    model.fit(
+        Pool(X[~holdout], y[~holdout], cat_features),
+        eval_set=Pool(X[holdout], y[holdout], cat_features),
+        init_model=prod_model,
+        verbose=False,
+    )
+    seconds = time.perf_counter() - start
+    return model, {
+        'mode': INCREMENTAL,
+        'trained_through': str(until),
+        'rows': int((~holdout).sum()),
+        'seconds': seconds,
+        'trees': int(model.tree_count_),
+        'trees_added': int(model.tree_count_ - prod_model.tree_count_),
+        'holdout_rows': int(holdout.sum()),
+        'holdout': holdout_metrics(model, X[holdout], y[holdout]),
+        'previous_holdout': holdout_metrics(prod_model, X[holdout], y[holdout]),
+    }
+
+
+def full_retrain_report(
+    model_dir: str, X_train: pd.DataFrame, X_test: pd.DataFrame, y_test, seconds
+) -> Dict[str, Any]:
+    # Report entry for the model a full retrain published, scored on the sweep's
+    # evaluation split
+    model = load_prod_model(model_dir)
+    return {
+        'mode': FULL,
+        'trained_through': load_training_state(model_dir).get('trained_through'),
+        'rows': len(X_train),
+        'seconds': seconds,
+        'trees': int(model.tree_count_),
+        'holdout_rows': len(X_test),
+        'holdout': holdout_metrics(model, X_test, np.asarray(y_test).ravel()),
+    }
+
+
+def publish_update(model, model_dir: str, trained_through: date) -> None:
+    # Replace the prod model with its update, which keeps its columns and
+    # preprocessor, and move the training record on to the days it now covers
+    atomic_write(os.path.join(model_dir, PICKLED_MODEL_FILE), [pickle.dumps(model)])
+    fd, tmp_path = tempfile.mkstemp(dir=model_dir, suffix='.cbm')
+    os.close(fd)
+    model.save_model(tmp_path)
+    os.replace(tmp_path, os.path.join(model_dir, NATIVE_MODEL_FILE))
+    write_model_manifest(model_dir)
+    state = load_training_state(model_dir)
+    state['trained_through'] = str(trained_through)
+    state['drift'] = None
+    save_training_state(model_dir, state)
+
+
+def append_report(artifact_path: str, entry: Dict[str, Any]) -> None:
+    os.makedirs(artifact_path, exist_ok=True)
+    with open(
+        os.path.join(artifact_path, REPORT_FILE), 'a', encoding='utf-8'
+    ) as report_file:
+        report_file.write(json.dumps(entry) + '\n')
+
+
+def load_report(artifact_path: str) -> List[Dict[str, Any]]:
+    report_path = os.path.join(artifact_path, REPORT_FILE)
+    if not os.path.isfile(report_path):
+        return []
+    with open(report_path, 'r', encoding='utf-8') as report_file:
+        return [json.loads(line) for line in report_file]
+
+
+def compare_retraining(entries: List[Dict[str, Any]]) -> Optional[str]:
+    # The latest full and incremental retrains side by side: what each cost and how
+    # the model it produced scored on its holdout
+    latest = {entry['mode']: entry for entry in entries}
+    if not latest:
+        return None
+    lines = [
+        f"{'':<12}{'date':>12}{'rows':>10}{'seconds':>10}"
+        f"{'AUC':>8}{'Accuracy':>10}{'Logloss':>9}"
+    ]
+    for mode in [FULL, INCREMENTAL]:
+        if mode not in latest:
+            continue
+        entry = latest[mode]
+        metrics = entry['holdout']
+        lines.append(
+            f"{mode:<12}{entry['date']:>12}{entry['rows']:>10}"
+            f"{entry['seconds']:>10.1f}{metrics['AUC'] or float('nan'):>8.4f}"
+            f"{metrics['Accuracy']:>10.4f}{metrics['Logloss']:>9.4f}"
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,112 @@
+from typing import List, Tuple, Optional
+
+import numpy as np
+import pandas as pd
+from preprocessing import Preprocessor, category_indices
+from battle_features import NUM_COLUMNS
+
+# CatBoost reads categorical values as strings; the one-hot columns hold 0 or 1
+CAT_VALUES = np.array([b'0', b'1'], dtype=object)
+
+
+class InferenceEngine:
+    # Scores engineered battles without building a DataFrame of model inputs. The
+    # numeric features go straight into a contiguous float32 matrix and the one-hot
+    # columns, which the model treats as categorical, are set from precomputed
+    # category value -> column indices, then both are handed to CatBoost as
+    # FeaturesData. That layout puts the numeric features before the categorical
+    # ones, so it only fits models trained on [numeric columns, one-hot columns],
+    # which is what the training flow produces; for_model checks this.
+    #
+    # Without a preprocessor the numeric columns are min-max scaled on the batch and
+    # each category's smallest value in the batch is left unencoded, as the pandas
+    # path's MinMaxScaler and get_dummies(drop_first=True) do.
+    def __init__(
+        self,
+        model,
+        columns: List[str],
+        preprocessor: Optional[Preprocessor] = None,
+    ):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.num_columns = preprocessor.num_columns if preprocessor else NUM_COLUMNS
+        num_features = len(self.num_columns)
+        self.num_feature_names = list(columns[:num_features])
+        self.cat_feature_names = list(columns[num_features:])
+        categories = (
+            preprocessor.categories if preprocessor else category_indices(columns)
+        )
+        # Positions within the categorical block rather than the full column list
+        self.categories = {
+            column: (
+                pd.Index(list(index_map)),
+                np.asarray(list(index_map.values()), dtype=np.intp) - num_features,
+            )
+            for column, index_map in categories.items()
+        }
+
+    @classmethod
+    def for_model(
+        cls, model, columns: List[str], preprocessor: Optional[Preprocessor] = None
+    ) -> Optional['InferenceEngine']:
+        # An engine for the model, or None when its inputs aren't laid out as
+        # numeric columns followed by categorical one-hot columns
+        num_columns = preprocessor.num_columns if preprocessor else NUM_COLUMNS
+        num_features = len(num_columns)
+        try:
+            cat_features = list(model.get_cat_feature_indices())
+        except AttributeError:
+            return None
+        if list(columns[:num_features]) != list(num_columns) or cat_features != list(
+            range(num_features, len(columns))
+        ):
+            return None
+        return cls(model, columns, preprocessor)
+
+    def numeric_features(self, df: pd.DataFrame) -> np.ndarray:
+        numeric = df[self.num_columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        if self.preprocessor is not None:
+            scale, offset = self.preprocessor.scale, self.preprocessor.offset
+        else:
+            # MinMaxScaler fitted on the batch; constant columns keep a scale of 1
+            low = np.nanmin(numeric, axis=0)
+            spread = np.nanmax(numeric, axis=0) - low
+            scale = 1 / np.where(spread < 10 * np.finfo(np.float64).eps, 1, spread)
+            offset = -low * scale
+        numeric = numeric * scale + offset
+        if self.preprocessor is None:
+            # The pandas path filled missing values with zeros after scaling
+            numeric = np.nan_to_num(numeric, nan=0)
+        return np.ascontiguousarray(numeric, dtype=np.float32)
+
+    def categorical_features(self, df: pd.DataFrame) -> np.ndarray:
+        one_hot = np.zeros((len(df), len(self.cat_feature_names)), dtype=np.uint8)
+        rows = np.arange(len(df))
+        for column, (values, indices) in self.categories.items():
+            batch_values = df[column].to_numpy()
+            codes = values.get_indexer(batch_values)
+            known = codes >= 0
+            if self.preprocessor is None:
+                # Compared as values, as the API receives them, even for categoricals
+                known &= batch_values != pd.Series(batch_values).min()
+            one_hot[rows[known], indices[codes[known]]] = 1
+        return CAT_VALUES[one_hot]
+
+    def features(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        return self.numeric_features(df), self.categorical_features(df)
+
+    def predict(self, df: pd.DataFrame, thread_count: int = -1) -> np.ndarray:
+        # Predicted class of each engineered battle
+        # pylint: disable=import-outside-toplevel
+        from catboost import FeaturesData
+
+        numeric, categorical = self.features(df)
+        return self.model.predict(
+            FeaturesData(
+                num_feature_data=numeric,
+                cat_feature_data=categorical,
+                num_feature_names=self.num_feature_names,
+                cat_feature_names=self.cat_feature_names,
+            ),
+            thread_count=thread_count,
+        )
@@ -1,11 +1,34 @@
+import os
 import sys
+import time
+from datetime import date, timedelta
+from functools import partial
 
+import pandas as pd
 from prefect import flow
-from train_model import optimize, feature_engineering
+from battle_store import PARTITION_DIR
+from window_cache import WindowCache, utc_today
+from train_model import (
+    PROD_MODEL_PATH,
+    optimize,
+    feature_engineering,
+    incremental_retrain,
+)
+from incremental import (
+    FULL,
+    INCREMENTAL,
+    load_report,
+    record_drift,
+    append_report,
+    choose_retraining,
+    compare_retraining,
+    load_training_state,
+    full_retrain_report,
+)
 from monitor_model import batch_monitoring_fill
-from prefect_email import EmailServerCredentials, email_send_message
+from training_data import load_snapshot
 from fetch_battle_data import (
-    retrieve_data_bq,
+    retrieve_days_bq,
     extract_battle_data,
     load_battle_data_gcs,
     upload_data_bigquery,
@@ -13,6 +36,11 @@ from fetch_battle_data import (
 )
 
 
+def window_start(end: date, num_months: int) -> date:
+    # Same as DATE_SUB(end, INTERVAL num_months MONTH) in BigQuery
+    return (pd.Timestamp(end) - pd.DateOffset(months=int(num_months))).date()
+
+
 @flow
 def run_pipeline(
     data_path: str,
@@ -23,36 +51,85 @@ def run_pipeline(
     gcp_project_id: str,
     bigquery_dataset: str,
     bigquery_table: str,
+    download_workers: int = 8,
+    sweep_trials: int = 1,
+    parallel_trials: int = 1,
+    successive_halving: bool = False,
+    incremental: bool = False,
+    full_retrain_days: int = 30,
+    drift_threshold: float = 0.1,
 ):
     # Runs Pipeline
-    extract_battle_data(data_path, num_months)
-    file_name = transform_battle_data(data_path, num_months)
-    load_battle_data_gcs(data_path)
-    upload_data_bigquery(file_name, data_path)
-    current_data_query = f'''SELECT * FROM `{gcp_project_id}.{bigquery_dataset}.{bigquery_table}`
-                            WHERE DATE(period) BETWEEN
-                            DATE_SUB(CURRENT_DATE(), INTERVAL {num_months} MONTH) AND CURRENT_DATE()
-                            ORDER BY period;'''
-    current_data_df = retrieve_data_bq(current_data_query)
+    extract_battle_data(data_path, num_months, download_workers)
+    transform_battle_data(data_path, num_months)
+    load_battle_data_gcs(os.path.join(data_path, PARTITION_DIR))
+    loaded_days = upload_data_bigquery(data_path, bigquery_dataset, bigquery_table)
+    # The current window and the reference window, shifted back one day, overlap in
+    # all but a day at each end, so their union is fetched once and cached locally
+    window_cache = WindowCache(
+        os.path.join(data_path, 'window_cache', bigquery_table),
+        partial(
+            retrieve_days_bq, f'{gcp_project_id}.{bigquery_dataset}.{bigquery_table}'
+        ),
+    )
+    window_cache.invalidate(loaded_days)
+    today = utc_today()
+    reference_end = today - timedelta(days=1)
+    window_cache.load(window_start(reference_end, num_months), today)
+    current_data_df = window_cache.window(window_start(today, num_months), today)
     print(current_data_df.head())
-    X_train, X_test, y_train, y_test = feature_engineering(
-        current_data_df, wandb_project, wandb_entity, artifact_path
+    # Incremental runs continue boosting the prod model on the days since it was
+    # trained, with a full retrain every full_retrain_days or once drift crosses
+    # drift_threshold
+    mode, reason = (
+        choose_retraining(
+            load_training_state(PROD_MODEL_PATH),
+            today,
+            full_retrain_days,
+            drift_threshold,
+        )
+        if incremental
+        else (FULL, 'incremental retraining is off')
     )
-    optimize(
-        X_train, X_test, y_train, y_test, wandb_project, wandb_entity, artifact_path, 1
+    print(f'Retraining: {mode} ({reason})')
+    if mode == INCREMENTAL:
+        entry = incremental_retrain(current_data_df, artifact_path, today)
+        if entry['published']:
+            load_battle_data_gcs(PROD_MODEL_PATH)
+    elif mode == FULL:
+        start = time.perf_counter()
+        snapshot_dir = feature_engineering(
+            current_data_df, wandb_project, wandb_entity, artifact_path
+        )
+        optimize(
+            snapshot_dir,
+            wandb_project,
+            wandb_entity,
+            artifact_path,
+            sweep_trials,
+            parallel_trials,
+            successive_halving,
+        )
+        seconds = time.perf_counter() - start
+        load_battle_data_gcs(PROD_MODEL_PATH)
+        X_train, X_test, _, y_test = load_snapshot(snapshot_dir)
+        entry = full_retrain_report(PROD_MODEL_PATH, X_train, X_test, y_test, seconds)
+        entry['date'] = str(today)
+        append_report(artifact_path, entry)
+        print(compare_retraining(load_report(artifact_path)))
+    reference_data_df = window_cache.window(
+        window_start(reference_end, num_months), reference_end
     )
-    load_battle_data_gcs('../prod_model')
-    reference_data_query = f'''SELECT * FROM `{gcp_project_id}.{bigquery_dataset}.{bigquery_table}`
-                              WHERE DATE(period) BETWEEN
-                              DATE_SUB(DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY),
-                              INTERVAL {num_months} MONTH) AND DATE_SUB(CURRENT_DATE(),
-                              INTERVAL 1 DAY);'''
-    reference_data_df = retrieve_data_bq(reference_data_query)
     pred_value = float(batch_monitoring_fill(current_data_df, reference_data_df))
-    # If prediction drift value is > 0.1, send and email
+    record_drift(PROD_MODEL_PATH, pred_value)
+    # Imported here, with the other heavy dependencies, so the flow starts quickly
+    # pylint: disable=import-outside-toplevel
+    from prefect_email import EmailServerCredentials, email_send_message
+
+    # If prediction drift value is > drift_threshold, send and email
     email_server_credentials = EmailServerCredentials.load("email-server-credentials")
 
-    if pred_value > 0.1:
+    if pred_value > drift_threshold:
         email_send_message(
             email_server_credentials=email_server_credentials,
             subject="Data Drift!",
@@ -0,0 +1,111 @@
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+from typing import Any, Dict, List, Tuple, Callable, Optional
+
+from preprocessing import PREPROCESSOR_FILE, Preprocessor
+
+# Models are published in CatBoost's native binary format, which loads without
+# unpickling. The pickle is still published for API images that predate it.
+NATIVE_MODEL_FILE = 'current_prod_model.cbm'
+PICKLED_MODEL_FILE = 'current_prod_model.pkl'
+COLUMNS_FILE = 'one_hot_columns.pkl'
+# Older models were published without the native model file and the preprocessor
+PUBLISHED_FILES = [
+    NATIVE_MODEL_FILE,
+    PICKLED_MODEL_FILE,
+    COLUMNS_FILE,
+    PREPROCESSOR_FILE,
+]
+# Content hashes of the published files, written after them and uploaded last, so a
+# reader can tell a complete set from one still being uploaded
+MODEL_MANIFEST = 'model_manifest.json'
+
+
+class IncompleteModelError(Exception):
+    # A published file doesn't match the model manifest: the set is being replaced
+    pass
+
+
+def load_native_model(content: bytes):
+    # Load a native model from memory, without writing it to disk first
+    # pylint: disable=import-outside-toplevel
+    from catboost import CatBoostClassifier
+
+    return CatBoostClassifier().load_model(blob=content)
+
+
+def read_published_file(model_dir: str, name: str) -> bytes:
+    with open(os.path.join(model_dir, name), 'rb') as model_file:
+        return model_file.read()
+
+
+def write_model_manifest(model_dir: str) -> Dict[str, str]:
+    # Record the hash of each published file in model_dir. Call it after the files
+    # are written, as its replacement is what marks the new set complete.
+    manifest = {}
+    for name in PUBLISHED_FILES:
+        path = os.path.join(model_dir, name)
+        if os.path.isfile(path):
+            manifest[name] = hashlib.sha256(
+                read_published_file(model_dir, name)
+            ).hexdigest()
+    fd, tmp_path = tempfile.mkstemp(dir=model_dir, suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(model_dir, MODEL_MANIFEST))
+    return manifest
+
+
+def manifest_reader(read: Callable[[str], bytes]) -> Callable[[str], bytes]:
+    # read, limited to the files the model manifest lists and checked against their
+    # hashes, raising IncompleteModelError for one from another publish. Models
+    # published before the manifest are read as they are.
+    try:
+        manifest = json.loads(read(MODEL_MANIFEST))
+    except FileNotFoundError:
+        return read
+
+    def read_listed(name: str) -> bytes:
+        if name not in manifest:
+            raise FileNotFoundError(name)
+        content = read(name)
+        if hashlib.sha256(content).hexdigest() != manifest[name]:
+            raise IncompleteModelError(f'{name} does not match {MODEL_MANIFEST}')
+        return content
+
+    return read_listed
+
+
+def load_published_model(
+    read: Callable[[str], bytes],
+) -> Tuple[Any, List[str], Optional[Preprocessor]]:
+    # The published model, its columns and its preprocessor, None for models
+    # published without one. read(name) returns the bytes of a published file and
+    # raises FileNotFoundError when it isn't there. Raises IncompleteModelError while
+    # the files don't all match the model manifest.
+    read = manifest_reader(read)
+    try:
+        model = load_native_model(read(NATIVE_MODEL_FILE))
+    except FileNotFoundError:
+        model = pickle.loads(read(PICKLED_MODEL_FILE))
+    columns = pickle.loads(read(COLUMNS_FILE))
+    try:
+        preprocessor = Preprocessor.from_json(read(PREPROCESSOR_FILE))
+    except FileNotFoundError:
+        preprocessor = None
+    return model, columns, preprocessor
+
+
+def load_prod_model(model_dir: str):
+    # The published model in model_dir, preferring the native format
+    native_path = os.path.join(model_dir, NATIVE_MODEL_FILE)
+    if os.path.isfile(native_path):
+        # pylint: disable=import-outside-toplevel
+        from catboost import CatBoostClassifier
+
+        return CatBoostClassifier().load_model(native_path)
+    with open(os.path.join(model_dir, PICKLED_MODEL_FILE), 'rb') as model_file:
+        return pickle.load(model_file)
@@ -1,26 +1,23 @@
 # prefect package imports are actually seperate, looks like they are in same module
 # pylint: disable=ungrouped-imports
 
-import pickle
+# evidently, psycopg and scikit-learn are imported by the functions that use them,
+# so importing the flows doesn't pay for them before any work starts
+# pylint: disable=import-outside-toplevel
+
 from typing import Any
 from datetime import date
 
 import pandas as pd
-import psycopg
 from prefect import task
-from evidently import ColumnMapping
-from evidently.report import Report
-from evidently.metrics import (
-    ColumnDriftMetric,
-    DatasetDriftMetric,
-    DatasetMissingValuesMetric,
-)
 from prefect.blocks.system import Secret
-from sklearn.preprocessing import MinMaxScaler
+from model_format import load_prod_model
 
 
 def prep_db(db_username_secret: Any, db_password_secret: Any):
     # Connect and prepare postgres database for inserting monitoing metric data 
+    import psycopg
+
     create_table_statement = """
         create table if not exists monitoring_metrics(
             timestamp timestamp,
@@ -56,8 +53,16 @@ def calculate_metrics_postgresql(
     reference_data: pd.DataFrame,
 ) -> float:
     # Calculate monitoring metrics using evidently and save to postgres database.
-    with open('../prod_model/current_prod_model.pkl', 'rb') as f_in:
-        model = pickle.load(f_in)
+    from evidently import ColumnMapping
+    from evidently.report import Report
+    from evidently.metrics import (
+        ColumnDriftMetric,
+        DatasetDriftMetric,
+        DatasetMissingValuesMetric,
+    )
+    from sklearn.preprocessing import MinMaxScaler
+
+    model = load_prod_model('../prod_model')
 
     num_columns = [
         'kill_diff',
@@ -140,6 +145,8 @@ def batch_monitoring_fill(
     current_data: pd.DataFrame, reference_data: pd.DataFrame
 ) -> float:
     # Run functions to prepare postgres database and calculate and insert drift metrics to postgres database.
+    import psycopg
+
     db_username_secret = Secret.load("db-username")
     db_password_secret = Secret.load("db-password")
     prep_db(db_username_secret, db_password_secret)
@@ -0,0 +1,103 @@
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from battle_features import NUM_COLUMNS, CAT_COLUMNS
+
+PREPROCESSOR_FILE = 'preprocessor.json'
+PREPROCESSOR_FORMAT = 1
+
+
+def category_indices(columns: List[str]) -> Dict[str, Dict[str, int]]:
+    # Category value -> index in columns of its one-hot column, for each category
+    categories = {column: {} for column in CAT_COLUMNS}
+    for index, name in enumerate(columns):
+        for column in CAT_COLUMNS:
+            if name.startswith(column + '_'):
+                categories[column][name[len(column) + 1 :]] = index
+    return categories
+
+
+class Preprocessor:
+    # The training-time preprocessing, fitted once and applied with array operations:
+    # min-max scaling of the numeric columns with the training scaler, and one-hot
+    # columns set from per-category value -> column index maps. Values the training
+    # data didn't have, and each category's dropped first value, leave every one-hot
+    # column of that category at zero, as get_dummies followed by reindex did.
+    def __init__(
+        self,
+        columns: List[str],
+        scale: List[float],
+        offset: List[float],
+        categories: Dict[str, Dict[str, int]],
+        num_columns: Optional[List[str]] = None,
+    ):
+        self.columns = columns
+        self.num_columns = num_columns or NUM_COLUMNS
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.categories = categories
+
+    @classmethod
+    def from_fitted(
+        cls, scaler, columns: List[str], num_columns: Optional[List[str]] = None
+    ):
+        # Export a MinMaxScaler fitted on num_columns and the final one-hot column order
+        return cls(
+            columns,
+            scaler.scale_.tolist(),
+            scaler.min_.tolist(),
+            category_indices(columns),
+            num_columns or NUM_COLUMNS,
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                'format': PREPROCESSOR_FORMAT,
+                'columns': self.columns,
+                'num_columns': self.num_columns,
+                'scale': self.scale.tolist(),
+                'offset': self.offset.tolist(),
+                'categories': self.categories,
+            },
+            indent=2,
+        )
+
+    @classmethod
+    def from_json(cls, content):
+        data = json.loads(content)
+        if data['format'] != PREPROCESSOR_FORMAT:
+            raise ValueError(f"Unsupported preprocessor format {data['format']}")
+        return cls(
+            data['columns'],
+            data['scale'],
+            data['offset'],
+            data['categories'],
+            data['num_columns'],
+        )
+
+    def save(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as preprocessor_file:
+            preprocessor_file.write(self.to_json())
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Model input for engineered battles, in the training column order
+        numeric = df[self.num_columns].to_numpy(dtype=np.float64)
+        numeric = numeric * self.scale + self.offset
+        one_hot = np.zeros((len(df), len(self.columns)), dtype=np.uint8)
+        rows = np.arange(len(df))
+        for column, index_map in self.categories.items():
+            codes = pd.Categorical(df[column], categories=list(index_map)).codes
+            indices = np.asarray(list(index_map.values()), dtype=np.intp)
+            known = codes >= 0
+            one_hot[rows[known], indices[codes[known]]] = 1
+
+        data = {}
+        for index, name in enumerate(self.columns):
+            if name in self.num_columns:
+                data[name] = numeric[:, self.num_columns.index(name)]
+            else:
+                data[name] = one_hot[:, index]
+        return pd.DataFrame(data, index=df.index)
@@ -0,0 +1,67 @@
+import os
+import json
+import hashlib
+import tempfile
+from typing import Tuple
+
+import numpy as np
+from training_data import load_labels, load_features
+
+# catboost is imported by the functions that use it
+# pylint: disable=import-outside-toplevel
+
+QUANTIZATION = {'border_count': 254, 'feature_border_type': 'GreedyLogSum'}
+# Named after the quantization settings, so changing them quantizes again
+QUANTIZATION_KEY = hashlib.sha256(
+    json.dumps(QUANTIZATION, sort_keys=True).encode('utf-8')
+).hexdigest()[:8]
+TRAIN_POOL_FILE = f'train.{QUANTIZATION_KEY}.quantized'
+BORDERS_FILE = f'borders.{QUANTIZATION_KEY}.tsv'
+
+
+def quantize_dataset(snapshot_dir: str) -> Tuple[str, bool]:
+    # Quantize the training split of a snapshot written by save_snapshot, once,
+    # into CatBoost's binary pool format next to it with its borders. Returns the
+    # snapshot directory and whether the pool had to be built. A trial loads the
+    # pool instead of building a Pool and quantizing the same features again. The
+    # evaluation split stays as the snapshot's matrices: CatBoost quantizes it with
+    # the training pool's borders when fitting, and a separately quantized pool
+    # wouldn't share the training pool's categorical values.
+    from catboost import Pool
+
+    pool_path = os.path.join(snapshot_dir, TRAIN_POOL_FILE)
+    if os.path.isfile(pool_path):
+        return snapshot_dir, False
+
+    X_train = load_features(snapshot_dir, 'train')
+    train_pool = Pool(
+        X_train,
+        np.asarray(load_labels(snapshot_dir, 'train')),
+        X_train.select_dtypes(['uint8']).columns.to_list(),
+    )
+    train_pool.quantize(**QUANTIZATION)
+    train_pool.save_quantization_borders(os.path.join(snapshot_dir, BORDERS_FILE))
+    fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, suffix='.part')
+    os.close(fd)
+    try:
+        train_pool.save(tmp_path)
+        os.replace(tmp_path, pool_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return snapshot_dir, True
+
+
+def load_pools(snapshot_dir: str):
+    # The training and evaluation pools of a quantized snapshot
+    from catboost import Pool
+
+    X_test = load_features(snapshot_dir, 'test')
+    train_pool = Pool('quantized://' + os.path.join(snapshot_dir, TRAIN_POOL_FILE))
+    test_pool = Pool(
+        X_test,
+        np.asarray(load_labels(snapshot_dir, 'test')),
+        X_test.select_dtypes(['uint8']).columns.to_list(),
+    )
+    return train_pool, test_pool
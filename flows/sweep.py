@@ -0,0 +1,323 @@
+import os
+import time
+import pickle
+import multiprocessing
+from typing import Any, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from quantized_data import load_pools
+
+# wandb and catboost are imported in the trial processes that use them
+# pylint: disable=import-outside-toplevel
+
+SWEEP_CONFIG = {
+    "method": "bayes",
+    "metric": {"name": "Accuracy", "goal": "minimize"},
+    "parameters": {
+        "max_depth": {
+            "distribution": "int_uniform",
+            "min": 1,
+            "max": 10,
+        },
+        "l2_leaf_reg": {
+            "distribution": "int_uniform",
+            "min": 1,
+            "max": 100,
+        },
+        "learning_rate": {
+            "distribution": "uniform",
+            "min": 0.01,
+            "max": 0.1,
+        },
+        "bagging_temperature": {
+            "distribution": "uniform",
+            "min": 0.01,
+            "max": 0.7,
+        },
+    },
+}
+
+
+def model_file_name(parameters: Dict[str, Any]) -> str:
+    # Name of a trial's pickled model in the artifact model directory
+    return (
+        f"catboost_cat_max_depth_{parameters['max_depth']}_"
+        f"l2_leaf_reg_{parameters['l2_leaf_reg']}_learning_rate_"
+        f"{parameters['learning_rate']}_bagging_temperature_"
+        f"{parameters['bagging_temperature']}.pkl"
+    )
+
+
+def make_classifier(
+    parameters: Dict[str, Any], thread_count: int = -1, iterations: int = 1000
+):
+    # The sweep's CatBoost model for one set of hyperparameters
+    from catboost import CatBoostClassifier
+
+    return CatBoostClassifier(
+        iterations=iterations,
+        custom_loss=['Accuracy'],
+        loss_function='Logloss',
+        max_depth=parameters['max_depth'],
+        l2_leaf_reg=parameters['l2_leaf_reg'],
+        learning_rate=parameters['learning_rate'],
+        bagging_temperature=parameters['bagging_temperature'],
+        use_best_model=True,
+        eval_metric='AUC',
+        od_type="Iter",
+        thread_count=thread_count,
+    )
+
+
+def sample_parameters(
+    trials: int, seed: Optional[int] = None, config: Optional[dict] = None
+) -> List[Dict[str, Any]]:
+    # Random search over the sweep's parameter distributions. wandb's Bayesian
+    # search needs its sweep server, which offline runs can't reach.
+    rng = np.random.default_rng(seed)
+    parameters = (config or SWEEP_CONFIG)['parameters']
+    samples = []
+    for _ in range(trials):
+        sample = {}
+        for name, spec in parameters.items():
+            if spec['distribution'] == 'int_uniform':
+                sample[name] = int(rng.integers(spec['min'], spec['max'] + 1))
+            elif spec['distribution'] == 'uniform':
+                sample[name] = float(rng.uniform(spec['min'], spec['max']))
+            else:
+                raise ValueError(f"Unsupported distribution {spec['distribution']}")
+        samples.append(sample)
+    return samples
+
+
+def run_trial(
+    dataset_dir: str,
+    parameters: Dict[str, Any],
+    thread_count: int,
+    artifact_path: str,
+    wandb_settings: Dict[str, Any],
+    iterations: int = 1000,
+) -> Dict[str, Any]:
+    # Train and save one sweep trial in a worker process, returning its scores and
+    # when it ran
+    started = time.time()
+    train_pool, test_pool = load_pools(dataset_dir)
+
+    run = None
+    callbacks = []
+    if wandb_settings.get('mode') != 'disabled':
+        import wandb
+
+        run = wandb.init(
+            config=dict(parameters, iterations=iterations),
+            job_type='Local Sweep Trial',
+            **wandb_settings,
+        )
+        callbacks.append(wandb.catboost.WandbCallback())
+
+    model = make_classifier(parameters, thread_count, iterations)
+    model.fit(train_pool, eval_set=test_pool, callbacks=callbacks, verbose=False)
+
+    artifact_model_path = os.path.join(artifact_path, 'model')
+    os.makedirs(artifact_model_path, exist_ok=True)
+    model_file_path = os.path.join(artifact_model_path, model_file_name(parameters))
+    with open(model_file_path, 'wb') as model_file:
+        pickle.dump(model, model_file)
+    model.save_model(os.path.splitext(model_file_path)[0] + '.cbm')
+
+    scores = model.get_best_score().get('validation', {})
+    if run is not None:
+        run.summary.update({f'validation-{name}': v for name, v in scores.items()})
+        run.finish()
+    return {
+        'parameters': parameters,
+        'thread_count': thread_count,
+        'validation': scores,
+        'best_iteration': model.get_best_iteration(),
+        # Trained before early stopping ended the trial, not the trees kept
+        'iterations_trained': len(model.get_evals_result()['learn']['Logloss']),
+        'model_file': model_file_path,
+        'pid': os.getpid(),
+        'started': started,
+        'finished': time.time(),
+    }
+
+
+def overlap_report(results: List[Dict[str, Any]], wall_seconds: float, parallel):
+    # How well the trials overlapped: the summed trial time against the sweep's
+    # wall-clock time, which is what running them one by one would have taken
+    trial_seconds = sum(result['finished'] - result['started'] for result in results)
+    return {
+        'trials': len(results),
+        'parallel': parallel,
+        'wall_seconds': wall_seconds,
+        'trial_seconds': trial_seconds,
+        'mean_concurrency': trial_seconds / wall_seconds if wall_seconds else 0.0,
+        'slot_utilisation': (
+            trial_seconds / (wall_seconds * parallel) if wall_seconds else 0.0
+        ),
+        'iterations_trained': sum(result['iterations_trained'] for result in results),
+    }
+
+
+def validation_auc(result: Dict[str, Any]) -> float:
+    return result['validation'].get('AUC', float('-inf'))
+
+
+def default_wandb_settings() -> Dict[str, Any]:
+    # Runs are logged offline unless WANDB_MODE says otherwise; wandb sync uploads them
+    return {'mode': os.environ.get('WANDB_MODE', 'offline')}
+
+
+def trial_pool(parallel: int) -> ProcessPoolExecutor:
+    # Spawned rather than forked, so trials never inherit the parent's OpenMP
+    # thread pools
+    return ProcessPoolExecutor(
+        parallel, mp_context=multiprocessing.get_context('spawn')
+    )
+
+
+def run_trials(
+    pool: ProcessPoolExecutor,
+    samples: List[Dict[str, Any]],
+    thread_count: int,
+    trial_args: tuple,
+    iterations: int,
+) -> List[Dict[str, Any]]:
+    # Run a trial per sample on the pool, returning their results best first.
+    # trial_args are the dataset directory, artifact path and wandb settings.
+    futures = [
+        pool.submit(
+            run_trial,
+            trial_args[0],
+            parameters,
+            thread_count,
+            trial_args[1],
+            trial_args[2],
+            iterations,
+        )
+        for parameters in samples
+    ]
+    return sorted(
+        (future.result() for future in futures), key=validation_auc, reverse=True
+    )
+
+
+def run_sweep(
+    dataset_dir: str,
+    artifact_path: str,
+    trials: int,
+    parallel: int,
+    wandb_settings: Optional[Dict[str, Any]] = None,
+    seed: Optional[int] = None,
+    iterations: int = 1000,
+) -> Dict[str, Any]:
+    # Run trials sampled from the sweep config on the quantized snapshot in
+    # dataset_dir, parallel at a time, each with an equal share of the cores.
+    # Trials are ranked by validation AUC, the metric CatBoost keeps the best
+    # iteration by.
+    parallel = max(1, min(parallel, trials))
+    thread_count = max(1, (os.cpu_count() or 1) // parallel)
+    trial_args = (
+        dataset_dir,
+        artifact_path,
+        wandb_settings or default_wandb_settings(),
+    )
+    samples = sample_parameters(trials, seed)
+
+    start = time.time()
+    with trial_pool(parallel) as pool:
+        results = run_trials(pool, samples, thread_count, trial_args, iterations)
+    wall_seconds = time.time() - start
+
+    report = overlap_report(results, wall_seconds, parallel)
+    print(
+        f"{report['trials']} trials, {parallel} at a time with {thread_count} "
+        f"threads each: {wall_seconds:.1f}s wall clock for "
+        f"{report['trial_seconds']:.1f}s of trials, "
+        f"mean concurrency {report['mean_concurrency']:.2f}"
+    )
+    return {'best': results[0], 'trials': results, 'report': report}
+
+
+def halving_rungs(trials: int, max_iterations: int, eta: int) -> List[tuple]:
+    # (configurations, iterations) of each rung of successive halving. Each rung
+    # keeps the best 1/eta of the configurations before it and trains them for eta
+    # times the iterations, and the last trains its survivors on the full budget.
+    rungs = 1
+    while trials // eta**rungs >= 1:
+        rungs += 1
+    first_iterations = max_iterations / eta ** (rungs - 1)
+    return [
+        (
+            max(1, trials // eta**rung),
+            max(1, round(first_iterations * eta**rung)),
+        )
+        for rung in range(rungs)
+    ]
+
+
+def run_successive_halving(
+    dataset_dir: str,
+    artifact_path: str,
+    trials: int,
+    parallel: int,
+    wandb_settings: Optional[Dict[str, Any]] = None,
+    seed: Optional[int] = None,
+    iterations: int = 1000,
+    eta: int = 3,
+) -> Dict[str, Any]:
+    # Successive halving over trials configurations sampled from the sweep config:
+    # all of them start on a small iteration budget, and only the best of each rung
+    # by validation AUC are retrained on a larger one, so hopeless configurations
+    # never get the full budget. The best of the last rung, trained for the full
+    # iterations, is the sweep's best.
+    parallel = max(1, min(parallel, trials))
+    trial_args = (
+        dataset_dir,
+        artifact_path,
+        wandb_settings or default_wandb_settings(),
+    )
+    survivors = sample_parameters(trials, seed)
+    rungs, all_results = [], []
+
+    start = time.time()
+    with trial_pool(parallel) as pool:
+        for configurations, rung_iterations in halving_rungs(trials, iterations, eta):
+            survivors = survivors[:configurations]
+            # Later rungs have fewer trials than slots, so each gets more threads
+            thread_count = max(
+                1, (os.cpu_count() or 1) // min(parallel, configurations)
+            )
+            results = run_trials(
+                pool, survivors, thread_count, trial_args, rung_iterations
+            )
+            rungs.append(
+                {
+                    'configurations': configurations,
+                    'iterations': rung_iterations,
+                    'iterations_trained': sum(
+                        result['iterations_trained'] for result in results
+                    ),
+                    'best_auc': validation_auc(results[0]),
+                }
+            )
+            all_results.extend(results)
+            survivors = [result['parameters'] for result in results]
+    wall_seconds = time.time() - start
+
+    report = overlap_report(all_results, wall_seconds, parallel)
+    # What the same configurations would have been given in a full-budget sweep;
+    # early stopping within a trial can still end any of them sooner
+    report['full_budget_iterations'] = trials * iterations
+    report['compute_saved'] = 1 - report['iterations_trained'] / (trials * iterations)
+    report['rungs'] = rungs
+    print(
+        f"{trials} configurations in {len(rungs)} rungs of "
+        + ', '.join(f"{rung['configurations']}x{rung['iterations']}" for rung in rungs)
+        + f": {report['iterations_trained']} of {trials * iterations} iterations "
+        f"trained ({report['compute_saved']:.0%} saved), "
+        f"{wall_seconds:.1f}s wall clock"
+    )
+    return {'best': results[0], 'trials': all_results, 'report': report}
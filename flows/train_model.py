@@ -1,24 +1,49 @@
+# wandb, catboost and scikit-learn are imported by the functions that use them, so
+# importing the flows doesn't pay for them before any work starts
+# pylint: disable=import-outside-toplevel
+
 import os
 import pickle
 import shutil
-from typing import Tuple
-from datetime import date
+from datetime import date, timedelta
 from functools import partial
 
-import numpy as np
-import wandb
 import pandas as pd
 from prefect import task
-from catboost import Pool, CatBoostClassifier
-from sklearn.preprocessing import MinMaxScaler, LabelBinarizer
-from sklearn.model_selection import train_test_split
+from window_cache import utc_today
+from preprocessing import PREPROCESSOR_FILE, Preprocessor
+from quantized_data import load_pools, quantize_dataset
+from training_data import save_snapshot, load_features
+from model_format import NATIVE_MODEL_FILE, PICKLED_MODEL_FILE, write_model_manifest
+from incremental import (
+    SKIP,
+    load_report,
+    append_report,
+    publish_update,
+    continue_training,
+    compare_retraining,
+    record_full_retrain,
+)
+from sweep import (
+    SWEEP_CONFIG,
+    run_sweep,
+    make_classifier,
+    model_file_name,
+    run_successive_halving,
+)
+
+PROD_MODEL_PATH = '../prod_model'
 
 
 @task(name="Prepare data for Training", log_prints=True)
 def feature_engineering(
     df: pd.DataFrame, wandb_project: str, wandb_entity: str, artifact_path: str
-) -> Tuple[pd.DataFrame, pd.DataFrame, np.ndarray, np.ndarray]:
+) -> str:
     # Prepare data for training by scaling features, Scaled data will be saved as an artifact using Weights and Biases
+    import wandb
+    from sklearn.preprocessing import MinMaxScaler, LabelBinarizer
+    from sklearn.model_selection import train_test_split
+
     run = wandb.init(
         project=wandb_project, entity=wandb_entity, job_type="Feature Engineering"
     )
@@ -46,6 +71,13 @@ def feature_engineering(
     X_train[num_columns] = scaler.transform(X_train[num_columns])
     X_test[num_columns] = scaler.transform(X_test[num_columns])
 
+    # Keep the fitted scaling and column layout so the API can apply them as they are
+    artifact_model_path = artifact_path + '/model/'
+    os.makedirs(artifact_model_path, exist_ok=True)
+    Preprocessor.from_fitted(scaler, X_train.columns.tolist(), num_columns).save(
+        os.path.join(artifact_model_path, PREPROCESSOR_FILE)
+    )
+
     lb = LabelBinarizer()
 
     lb.fit(y_train)
@@ -56,67 +88,35 @@ def feature_engineering(
 
     artifact_data_path = artifact_path + '/scaled_data/'
 
-    os.makedirs(artifact_data_path, exist_ok=True)
-
-    X_train.to_parquet(
-        os.path.join(artifact_data_path, artifact_date + "_X_train.parquet")
-    )
-
-    with open(
-        artifact_data_path + '/' + artifact_date + "_y_train.pkl", "wb"
-    ) as train_artifact:
-        pickle.dump(y_train, train_artifact)
-
-    X_test.to_parquet(
-        os.path.join(artifact_data_path, artifact_date + "_X_test.parquet")
-    )
-
-    with open(
-        artifact_data_path + '/' + artifact_date + "_y_test.pkl", "wb"
-    ) as test_artifact:
-        pickle.dump(y_test, test_artifact)
+    # The splits are written once as memory-mappable matrices, which the sweep's
+    # trials, however many run at once, read instead of their own copies
+    snapshot_dir = save_snapshot(artifact_data_path, X_train, X_test, y_train, y_test)
 
     artifact_name_scaled = artifact_date + '_scaled_data'
 
     artifact = wandb.Artifact(artifact_name_scaled, type="scaled_data")
-    artifact.add_dir(artifact_data_path)
+    artifact.add_dir(snapshot_dir)
     run.log_artifact(artifact)
     run.finish()
 
-    return X_train, X_test, y_train, y_test
+    # Quantized once here for every trial of the sweep that follows
+    quantize_dataset(snapshot_dir)
 
+    return snapshot_dir
 
-def train_model(
-    X_train: pd.DataFrame,
-    X_test: pd.DataFrame,
-    y_train: np.ndarray,
-    y_test: np.ndarray,
-    artifact_path: str,
-):
+
+def train_model(dataset_dir: str, artifact_path: str):
     # For model parameter sweep, train a CatBoost model and register model to Weights & Biases Model Registry
+    import wandb
+
     run = wandb.init()
     config = wandb.config
 
     wandb_callback = wandb.catboost.WandbCallback()
 
-    train_pool = Pool(
-        X_train, y_train, X_train.select_dtypes(['uint8']).columns.to_list()
-    )
+    train_pool, test_pool = load_pools(dataset_dir)
 
-    test_pool = Pool(X_test, y_test, X_test.select_dtypes(['uint8']).columns.to_list())
-
-    catboost_model = CatBoostClassifier(
-        iterations=1000,
-        custom_loss=['Accuracy'],
-        loss_function='Logloss',
-        max_depth=config.max_depth,
-        l2_leaf_reg=config.l2_leaf_reg,
-        learning_rate=config.learning_rate,
-        bagging_temperature=config.bagging_temperature,
-        use_best_model=True,
-        eval_metric='AUC',
-        od_type="Iter",
-    )
+    catboost_model = make_classifier(dict(config))
 
     catboost_model.fit(train_pool, eval_set=test_pool, callbacks=[wandb_callback])
 
@@ -124,24 +124,15 @@ def train_model(
 
     os.makedirs(artifact_model_path, exist_ok=True)
 
-    model_file_path = (
-        artifact_model_path
-        + '/'
-        + (
-            f'catboost_cat_max_depth_{config.max_depth}_l2_leaf_reg_{config.l2_leaf_reg}_'
-            f'learning_rate_{config.learning_rate}_bagging_temperature_'
-            f'{config.bagging_temperature}.pkl'
-        )
-    )
+    model_file_path = artifact_model_path + '/' + model_file_name(dict(config))
 
     with open(
         model_file_path,
         'wb',
     ) as model_file:
         pickle.dump(catboost_model, model_file)
-
-    with open(artifact_model_path + '/one_hot_columns.pkl', 'wb') as one_hot_file:
-        pickle.dump(X_train.columns.tolist(), one_hot_file)
+    # The native format loads without unpickling, which keeps the API's startup fast
+    catboost_model.save_model(os.path.splitext(model_file_path)[0] + '.cbm')
 
     artifact_date = str(date.today())
 
@@ -152,75 +143,116 @@ def train_model(
     run.link_artifact(artifact, 'model-registry/My Registered Model')
 
 
-SWEEP_CONFIG = {
-    "method": "bayes",
-    "metric": {"name": "Accuracy", "goal": "minimize"},
-    "parameters": {
-        "max_depth": {
-            "distribution": "int_uniform",
-            "min": 1,
-            "max": 10,
-        },
-        "l2_leaf_reg": {
-            "distribution": "int_uniform",
-            "min": 1,
-            "max": 100,
-        },
-        "learning_rate": {
-            "distribution": "uniform",
-            "min": 0.01,
-            "max": 0.1,
-        },
-        "bagging_temperature": {
-            "distribution": "uniform",
-            "min": 0.01,
-            "max": 0.7,
-        },
-    },
-}
+def publish_model(artifact_path: str, parameters: dict) -> None:
+    # Copy the sweep's model trained with parameters, its columns and the fitted
+    # preprocessing to ../prod_model
+    prod_model_path = PROD_MODEL_PATH
+
+    os.makedirs(prod_model_path, exist_ok=True)
+    artifact_model_path = artifact_path + '/model/'
+
+    prod_model_file_name = model_file_name(parameters)
+    shutil.copyfile(
+        artifact_model_path + prod_model_file_name,
+        os.path.join(prod_model_path, PICKLED_MODEL_FILE),
+    )
+    shutil.copyfile(
+        artifact_model_path + os.path.splitext(prod_model_file_name)[0] + '.cbm',
+        os.path.join(prod_model_path, NATIVE_MODEL_FILE),
+    )
+    shutil.copyfile(
+        artifact_model_path + '/one_hot_columns.pkl',
+        prod_model_path + '/one_hot_columns.pkl',
+    )
+    shutil.copyfile(
+        os.path.join(artifact_model_path, PREPROCESSOR_FILE),
+        os.path.join(prod_model_path, PREPROCESSOR_FILE),
+    )
+    write_model_manifest(prod_model_path)
+    # The window runs to today, so every complete day before it is covered
+    today = utc_today()
+    record_full_retrain(
+        prod_model_path,
+        {name: parameters[name] for name in SWEEP_CONFIG['parameters']},
+        today - timedelta(days=1),
+        today,
+    )
+
+
+@task(name="Continue Training the Prod Model", log_prints=True)
+def incremental_retrain(
+    df: pd.DataFrame, artifact_path: str, today: date, iterations: int = 200
+) -> dict:
+    # Continue boosting the prod model on the complete days since it was trained. The
+    # update only replaces it if it does at least as well on the new days' holdout.
+    until = today - timedelta(days=1)
+    model, entry = continue_training(df, PROD_MODEL_PATH, until, iterations)
+    if model is None:
+        # The window has no battles on those days, so the prod model is kept
+        print(f'Retraining: {SKIP} (no battles up to {until} to continue on)')
+        return {'mode': SKIP, 'date': str(today), 'published': False}
+    entry['date'] = str(today)
+    entry['published'] = (
+        entry['holdout']['Logloss'] <= entry['previous_holdout']['Logloss']
+    )
+    if entry['published']:
+        publish_update(model, PROD_MODEL_PATH, until)
+    append_report(artifact_path, entry)
+    print(compare_retraining(load_report(artifact_path)))
+    return entry
 
 
 @task(name="Optimize Model Parameters", log_prints=True)
 def optimize(
-    X_train: pd.DataFrame,
-    X_test: pd.DataFrame,
-    y_train: np.ndarray,
-    y_test: np.ndarray,
+    snapshot_dir: str,
     wandb_project: str,
     wandb_entity: str,
     artifact_path: str,
     count: int,
+    parallel_trials: int = 1,
+    successive_halving: bool = False,
 ):
     # Run a parameter sweep using Weights and Biases and Choose the best model for production. It is saved in the the ../prod_model directory
+    # Already built by feature_engineering, unless the snapshot was made elsewhere
+    dataset_dir, _ = quantize_dataset(snapshot_dir)
+    os.makedirs(artifact_path + '/model/', exist_ok=True)
+    with open(artifact_path + '/model/one_hot_columns.pkl', 'wb') as one_hot_file:
+        pickle.dump(load_features(snapshot_dir, 'train').columns.tolist(), one_hot_file)
+
+    if parallel_trials > 1 or successive_halving:
+        # Trials run in local processes, parallel_trials at a time, and are logged
+        # to wandb offline under one group. Successive halving starts all count
+        # configurations on a small iteration budget and only gives the best the
+        # full one.
+        local_sweep = run_successive_halving if successive_halving else run_sweep
+        results = local_sweep(
+            dataset_dir,
+            artifact_path,
+            count,
+            parallel_trials,
+            {
+                'mode': os.environ.get('WANDB_MODE', 'offline'),
+                'project': wandb_project,
+                'entity': wandb_entity,
+                'group': f'local-sweep-{date.today()}',
+            },
+        )
+        publish_model(artifact_path, results['best']['parameters'])
+        return results['report']
+
+    import wandb
+
     sweep_id = wandb.sweep(SWEEP_CONFIG, project=wandb_project, entity=wandb_entity)
     wandb.agent(
         sweep_id,
-        partial(train_model, X_train, X_test, y_train, y_test, artifact_path),
+        partial(train_model, dataset_dir, artifact_path),
         count=count,
     )
 
     api = wandb.Api()
     sweep = api.sweep(f"{wandb_entity}/{wandb_project}/sweeps/{sweep_id}")
 
-    prod_model_path = '../prod_model'
-
-    os.makedirs(prod_model_path, exist_ok=True)
-    artifact_model_path = artifact_path + '/model/'
-
     # Get best run parameters
     best_run = sweep.best_run()
-    best_parameters = best_run.config
-    prod_model_file_name = (
-        f"catboost_cat_max_depth_{best_parameters['max_depth']}_"
-        f"l2_leaf_reg_{best_parameters['l2_leaf_reg']}_learning_rate_"
-        f"{best_parameters['learning_rate']}_bagging_temperature_"
-        f"{best_parameters['bagging_temperature']}.pkl"
-    )
-    shutil.copyfile(
-        artifact_model_path + prod_model_file_name,
-        prod_model_path + '/current_prod_model.pkl',
-    )
-    shutil.copyfile(
-        artifact_model_path + '/one_hot_columns.pkl',
-        prod_model_path + '/one_hot_columns.pkl',
-    )
+    publish_model(artifact_path, best_run.config)
+    return None
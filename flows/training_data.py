@@ -0,0 +1,127 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Training snapshots are directories of .npy matrices described by a schema
+SCHEMA_FILE = 'schema.json'
+SCHEMA_FORMAT = 1
+
+
+def data_fingerprint(X_train, X_test, y_train, y_test) -> str:
+    # Content hash of a training snapshot: the values, column names and dtypes of
+    # both splits and their labels
+    digest = hashlib.sha256(f'format {SCHEMA_FORMAT}'.encode('utf-8'))
+    for X, y in [(X_train, y_train), (X_test, y_test)]:
+        digest.update(json.dumps([[c, str(t)] for c, t in X.dtypes.items()]).encode())
+        digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+        digest.update(np.ascontiguousarray(y).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def column_blocks(df: pd.DataFrame) -> List[Tuple[str, List[str]]]:
+    # Runs of adjacent columns sharing a dtype, in column order
+    blocks: List[Tuple[str, List[str]]] = []
+    for column, dtype in df.dtypes.items():
+        if blocks and blocks[-1][0] == str(dtype):
+            blocks[-1][1].append(column)
+        else:
+            blocks.append((str(dtype), [column]))
+    return blocks
+
+
+def save_split(directory: str, split: str, X: pd.DataFrame, y) -> Dict[str, Any]:
+    # Write a split's features as one column-major matrix per dtype block, so each
+    # column is a contiguous run of a file, and return its part of the schema
+    blocks = []
+    for index, (dtype, columns) in enumerate(column_blocks(X)):
+        file_name = f'X_{split}.{index}.npy'
+        np.save(
+            os.path.join(directory, file_name),
+            np.asfortranarray(X[columns].to_numpy(dtype=dtype)),
+        )
+        blocks.append({'file': file_name, 'dtype': dtype, 'columns': columns})
+    labels = np.ascontiguousarray(y)
+    np.save(os.path.join(directory, f'y_{split}.npy'), labels)
+    return {
+        'rows': len(X),
+        'blocks': blocks,
+        'labels': {
+            'file': f'y_{split}.npy',
+            'dtype': str(labels.dtype),
+            'shape': list(labels.shape),
+        },
+    }
+
+
+def save_snapshot(root: str, X_train, X_test, y_train, y_test) -> str:
+    # Write a training snapshot under root, in a directory named after its content,
+    # and return the directory. A snapshot that is already there is reused.
+    fingerprint = data_fingerprint(X_train, X_test, y_train, y_test)
+    directory = os.path.join(root, fingerprint)
+    if os.path.isfile(os.path.join(directory, SCHEMA_FILE)):
+        return directory
+
+    os.makedirs(root, exist_ok=True)
+    building = tempfile.mkdtemp(dir=root, prefix='.building-')
+    try:
+        schema = {
+            'format': SCHEMA_FORMAT,
+            'fingerprint': fingerprint,
+            'splits': {
+                'train': save_split(building, 'train', X_train, y_train),
+                'test': save_split(building, 'test', X_test, y_test),
+            },
+        }
+        with open(
+            os.path.join(building, SCHEMA_FILE), 'w', encoding='utf-8'
+        ) as schema_file:
+            json.dump(schema, schema_file, indent=2)
+        # Only the latest snapshot is kept here; earlier ones are in wandb
+        for stale in os.listdir(root):
+            if not stale.startswith('.'):
+                shutil.rmtree(os.path.join(root, stale), ignore_errors=True)
+        os.replace(building, directory)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    return directory
+
+
+def load_schema(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, SCHEMA_FILE), encoding='utf-8') as schema_file:
+        schema = json.load(schema_file)
+    if schema['format'] != SCHEMA_FORMAT:
+        raise ValueError(f"Unsupported training snapshot format {schema['format']}")
+    return schema
+
+
+def load_features(directory: str, split: str) -> pd.DataFrame:
+    # A split's features memory-mapped read-only. Each dtype block becomes one
+    # pandas block over its mapped matrix, so nothing is copied and processes
+    # reading the same snapshot share its pages.
+    frames = []
+    for block in load_schema(directory)['splits'][split]['blocks']:
+        values = np.load(os.path.join(directory, block['file']), mmap_mode='r')
+        frames.append(pd.DataFrame(values, columns=block['columns'], copy=False))
+    return pd.concat(frames, axis=1, copy=False)
+
+
+def load_labels(directory: str, split: str) -> np.ndarray:
+    labels = load_schema(directory)['splits'][split]['labels']
+    return np.load(os.path.join(directory, labels['file']), mmap_mode='r')
+
+
+def load_snapshot(directory: str):
+    # X_train, X_test, y_train and y_test of a snapshot, all memory-mapped
+    return (
+        load_features(directory, 'train'),
+        load_features(directory, 'test'),
+        load_labels(directory, 'train'),
+        load_labels(directory, 'test'),
+    )
@@ -0,0 +1,177 @@
+import os
+import sqlite3
+import posixpath
+from typing import Dict, List
+
+import pandas as pd
+from battle_store import PARTITION_DIR, partition_file
+from feature_cache import file_digest
+
+# Warehouses record the content hash each battle day was loaded from, so a partition
+# is only sent again when the transform has actually changed it. Both backends expose
+# loaded_partitions() and replace_partition(day, partition, content_hash).
+
+
+class BigQueryWarehouse:
+    # Battles in a BigQuery table partitioned by DATE(period). Each battle day is loaded
+    # from its Parquet partition in the bucket into a staging table, then merged into
+    # the day's partition: its previous rows are deleted, and battles already stored
+    # under another day are left there, so re-ingesting a day replaces it and battle_id
+    # stays unique across the whole table.
+    def __init__(
+        self,
+        gcp_credentials,
+        dataset: str,
+        table: str,
+        source_uri: str,
+        location: str = 'us-central1',
+    ):
+        self.client = gcp_credentials.get_bigquery_client(location=location)
+        self.dataset = dataset
+        self.table = table
+        self.source_uri = source_uri
+        self.location = location
+        self.loads_table = f'{dataset}.{table}_partition_loads'
+        self.staging_table = f'{dataset}.{table}_staging'
+        self.client.query(
+            f'CREATE TABLE IF NOT EXISTS `{self.loads_table}` '
+            '(battle_date DATE, content_hash STRING, row_count INT64, loaded_at TIMESTAMP)',
+            location=location,
+        ).result()
+
+    def loaded_partitions(self) -> Dict[str, str]:
+        rows = self.client.query(
+            f'SELECT CAST(battle_date AS STRING) AS battle_date, content_hash '
+            f'FROM `{self.loads_table}`',
+            location=self.location,
+        ).result()
+        return {row['battle_date']: row['content_hash'] for row in rows}
+
+    def replace_partition(self, day: str, partition: str, content_hash: str) -> None:
+        # Imported here so the SQLite stand-in works without the BigQuery client installed
+        # pylint: disable=import-outside-toplevel
+        from google.cloud import bigquery
+
+        self.client.load_table_from_uri(
+            posixpath.join(self.source_uri, partition),
+            self.staging_table,
+            job_config=bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.PARQUET,
+                write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            ),
+            location=self.location,
+        ).result()
+        table = f'{self.dataset}.{self.table}'
+        self.client.query(
+            f'CREATE TABLE IF NOT EXISTS `{table}` PARTITION BY DATE(period) '
+            f'AS SELECT * FROM `{self.staging_table}` WHERE FALSE',
+            location=self.location,
+        ).result()
+        # Rows of other days never match the day's own rows, so those are deleted
+        # and replaced, while a battle already stored under another day is kept there
+        merge_job = self.client.query(
+            f'MERGE `{table}` AS stored USING `{self.staging_table}` AS loaded '
+            'ON stored.battle_id = loaded.battle_id AND DATE(stored.period) != @day '
+            'WHEN NOT MATCHED BY TARGET THEN INSERT ROW '
+            'WHEN NOT MATCHED BY SOURCE AND DATE(stored.period) = @day THEN DELETE',
+            job_config=bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ScalarQueryParameter('day', 'DATE', day)]
+            ),
+            location=self.location,
+        )
+        merge_job.result()
+        self.client.query(
+            f'DELETE FROM `{self.loads_table}` WHERE battle_date = @day; '
+            f'INSERT INTO `{self.loads_table}` '
+            'VALUES (@day, @content_hash, @row_count, CURRENT_TIMESTAMP())',
+            job_config=bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ScalarQueryParameter('day', 'DATE', day),
+                    bigquery.ScalarQueryParameter(
+                        'content_hash', 'STRING', content_hash
+                    ),
+                    bigquery.ScalarQueryParameter(
+                        'row_count', 'INT64', merge_job.dml_stats.inserted_row_count
+                    ),
+                ]
+            ),
+            location=self.location,
+        ).result()
+
+
+class SQLiteWarehouse:
+    # Local stand-in for BigQueryWarehouse. Partitions are read from the local partition
+    # directory and battle_id is a unique key, so a battle is never counted twice: like
+    # the MERGE, a battle already stored under another day is kept there.
+    def __init__(self, db_path: str, partition_root: str, table: str = 'battle_data'):
+        self.db_path = db_path
+        self.partition_root = partition_root
+        self.table = table
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}_partition_loads" '
+                '(battle_date TEXT PRIMARY KEY, content_hash TEXT, row_count INTEGER, '
+                'loaded_at TEXT)'
+            )
+
+    def loaded_partitions(self) -> Dict[str, str]:
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                f'SELECT battle_date, content_hash FROM "{self.table}_partition_loads"'
+            ).fetchall()
+        return dict(rows)
+
+    def _create_table(self, conn: sqlite3.Connection, df: pd.DataFrame) -> None:
+        columns = ', '.join(
+            f'"{column}" '
+            + ('INTEGER' if pd.api.types.is_integer_dtype(dtype) else 'TEXT')
+            for column, dtype in df.dtypes.items()
+        )
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.table}" (battle_date TEXT, {columns})'
+        )
+        conn.execute(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS "{self.table}_battle_id" '
+            f'ON "{self.table}" (battle_id)'
+        )
+
+    def replace_partition(self, day: str, partition: str, content_hash: str) -> None:
+        df = pd.read_parquet(os.path.join(self.partition_root, partition))
+        df['period'] = df['period'].astype(str)
+        columns = ', '.join(f'"{column}"' for column in ['battle_date', *df.columns])
+        placeholders = ', '.join('?' * (len(df.columns) + 1))
+        rows = [(day, *row) for row in df.astype(object).itertuples(index=False)]
+        with sqlite3.connect(self.db_path) as conn:
+            self._create_table(conn, df)
+            conn.execute(f'DELETE FROM "{self.table}" WHERE battle_date = ?', (day,))
+            inserted = conn.executemany(
+                f'INSERT OR IGNORE INTO "{self.table}" ({columns}) '
+                f'VALUES ({placeholders})',
+                rows,
+            ).rowcount
+            conn.execute(
+                f'INSERT OR REPLACE INTO "{self.table}_partition_loads" '
+                "VALUES (?, ?, ?, datetime('now'))",
+                (day, content_hash, inserted),
+            )
+
+
+def load_partitions(warehouse, data_path: str) -> List[str]:
+    # Load every local battle day whose partition is new or differs from the version
+    # the warehouse last loaded, returning the days that were (re)loaded
+    partition_root = os.path.join(data_path, PARTITION_DIR)
+    if not os.path.isdir(partition_root):
+        return []
+    loaded = warehouse.loaded_partitions()
+    reloaded = []
+    for day_dir in sorted(os.listdir(partition_root)):
+        if not day_dir.startswith('battle_date='):
+            continue
+        day = day_dir.split('=', 1)[1]
+        partition = partition_file(day)
+        content_hash = file_digest(os.path.join(partition_root, partition))
+        if loaded.get(day) == content_hash:
+            continue
+        warehouse.replace_partition(day, partition, content_hash)
+        reloaded.append(day)
+    return reloaded
@@ -0,0 +1,100 @@
+import io
+import os
+from typing import List, Tuple, Callable, Iterable
+from datetime import date, datetime, timezone, timedelta
+
+import numpy as np
+import pandas as pd
+from downloader import atomic_write
+
+
+def utc_today() -> date:
+    # BigQuery's CURRENT_DATE(), which is evaluated in UTC
+    return datetime.now(timezone.utc).date()
+
+
+def battle_days(period: pd.Series) -> np.ndarray:
+    # Calendar day of each battle in UTC, the same day DATE(period) gives in BigQuery
+    period = pd.to_datetime(period, utc=True).dt.tz_localize(None)
+    return period.to_numpy().astype('datetime64[D]')
+
+
+class WindowCache:
+    # Local copy of warehouse battles, kept as one Parquet file per battle day. Windows
+    # are served from a single frame covering their union, sorted by period, so
+    # overlapping windows are row slices of the same data rather than separate copies.
+    # Only days without a local file are fetched, in as few contiguous ranges as
+    # possible, plus the most recent refresh_days, which may still be filling up.
+    def __init__(
+        self,
+        cache_path: str,
+        fetch: Callable[[date, date], pd.DataFrame],
+        refresh_days: int = 1,
+    ):
+        self.cache_path = cache_path
+        self.fetch = fetch
+        self.refresh_days = refresh_days
+        self.frame = pd.DataFrame()
+        self.days = np.array([], dtype='datetime64[D]')
+        os.makedirs(cache_path, exist_ok=True)
+
+    def _day_path(self, day: date) -> str:
+        return os.path.join(self.cache_path, f'day={day}.parquet')
+
+    def invalidate(self, days: Iterable[str]) -> None:
+        # Drop days the warehouse has reloaded since they were cached
+        for day in days:
+            path = self._day_path(date.fromisoformat(str(day)))
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _missing_ranges(self, start: date, end: date) -> List[Tuple[date, date]]:
+        refresh_from = utc_today() - timedelta(days=self.refresh_days - 1)
+        ranges = []
+        day = start
+        while day <= end:
+            if day >= refresh_from or not os.path.isfile(self._day_path(day)):
+                if ranges and ranges[-1][1] == day - timedelta(days=1):
+                    ranges[-1] = (ranges[-1][0], day)
+                else:
+                    ranges.append((day, day))
+            day += timedelta(days=1)
+        return ranges
+
+    def _store(self, df: pd.DataFrame, start: date, end: date) -> None:
+        # Write every day of the fetched range, empty ones included, so days without
+        # battles aren't queried again
+        days = battle_days(df['period']) if len(df) else np.array([], 'datetime64[D]')
+        day = start
+        while day <= end:
+            buffer = io.BytesIO()
+            df[days == np.datetime64(day)].to_parquet(buffer, index=False)
+            atomic_write(self._day_path(day), [buffer.getvalue()])
+            day += timedelta(days=1)
+
+    def load(self, start: date, end: date) -> pd.DataFrame:
+        # Make [start, end] available locally and hold it in memory for window()
+        missing = self._missing_ranges(start, end)
+        for range_start, range_end in missing:
+            self._store(self.fetch(range_start, range_end), range_start, range_end)
+        print(f'Fetched {len(missing)} ranges for {start} to {end}')
+
+        frames = []
+        day = start
+        while day <= end:
+            frames.append(pd.read_parquet(self._day_path(day)))
+            day += timedelta(days=1)
+        frames = [frame for frame in frames if len(frame)] or frames[:1]
+        self.frame = (
+            pd.concat(frames, ignore_index=True)
+            .sort_values('period', kind='stable')
+            .reset_index(drop=True)
+        )
+        self.days = battle_days(self.frame['period'])
+        return self.frame
+
+    def window(self, start: date, end: date) -> pd.DataFrame:
+        # Battles played from start to end inclusive, as a slice of the loaded frame
+        lower = np.searchsorted(self.days, np.datetime64(start), side='left')
+        upper = np.searchsorted(self.days, np.datetime64(end), side='right')
+        return self.frame.iloc[lower:upper]
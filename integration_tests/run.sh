@@ -1,8 +1,8 @@
-cd ./integration_files/
+cd "$(dirname "$0")"
 
-docker build -t splatoon-winner-prediction:v0 .
+# The image is built from the repository root, which holds the shared feature module
+docker build -t splatoon-winner-prediction:v0 -f integration_files/Dockerfile ..
 docker run -dp 127.0.0.1:9696:9696 --name integration-test splatoon-winner-prediction:v0
 sleep 5
-cd ..
 python3 test_docker.py
 docker stop integration-test
@@ -1,12 +1,27 @@
+import time
+
 import pandas as pd
 import requests
 
 with open('test.csv', 'rb') as file:
     files = {'file_csv': file}
-    upload_url = 'http://localhost:9696/'
+    upload_url = 'http://localhost:9696/jobs'
     r = requests.post(upload_url, files=files, timeout=100)
 
-download_url = 'http://localhost:9696/download_predict'
+assert r.status_code == 202
+job = r.json()
+
+# Scoring runs in the background; poll until the job has finished
+status_url = 'http://localhost:9696' + job['status_url']
+deadline = time.time() + 100
+status = requests.get(status_url, timeout=10).json()
+while status['status'] in ['queued', 'running'] and time.time() < deadline:
+    time.sleep(0.5)
+    status = requests.get(status_url, timeout=10).json()
+
+assert status['status'] == 'done', status
+
+download_url = 'http://localhost:9696' + job['result_url']
 df = pd.read_csv(download_url)
 
 predicted_result = df['prediction'].to_list()
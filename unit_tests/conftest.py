@@ -0,0 +1,82 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'flows'))
+sys.path.insert(0, os.path.join(ROOT, 'deployment'))
+
+
+class StatInkStandIn:
+    # Serves daily CSVs from memory the way dl-stats.stats.ink does, with hooks for
+    # injecting failures and truncated responses
+    def __init__(self):
+        self.files = {}
+        self.fail_next = {}
+        self.truncate_next = {}
+        self.requests = []
+        self.url = ''
+        self.lock = threading.Lock()
+
+    def add(self, path: str, content: bytes) -> None:
+        self.files[path] = content
+
+    def handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                with stand_in.lock:
+                    stand_in.requests.append((self.path, dict(self.headers)))
+                    failures = stand_in.fail_next.get(self.path, 0)
+                    if failures:
+                        stand_in.fail_next[self.path] = failures - 1
+                    truncate = stand_in.truncate_next.pop(self.path, False)
+                if failures:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                content = stand_in.files.get(self.path)
+                if content is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                etag = f'"{hash(content) & 0xFFFFFFFF:x}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                if truncate:
+                    self.wfile.write(content[: len(content) // 2])
+                    self.close_connection = True
+                else:
+                    self.wfile.write(content)
+
+        return Handler
+
+
+@pytest.fixture
+def stat_ink_server():
+    stand_in = StatInkStandIn()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), stand_in.handler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stand_in.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield stand_in
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,456 @@
+import io
+import os
+import shutil
+import sqlite3
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+from downloader import (
+    FAILED,
+    MISSING,
+    DOWNLOADED,
+    NOT_MODIFIED,
+    battle_file_url,
+    download_battle_files,
+)
+from battle_store import LocalBucket, sync_folder, partition_file, write_partition
+from battle_ingest import battle_dtypes, read_battle_csv
+from warehouse import SQLiteWarehouse, load_partitions
+from feature_cache import DayFeatureCache
+from window_cache import WindowCache
+from batch_score import FAILED as SCORE_FAILED
+from batch_score import SCORED, SKIPPED, archive_files, score_archives
+from sweep import run_sweep, halving_rungs, make_classifier, run_successive_halving
+from model_format import MODEL_MANIFEST, load_prod_model, write_model_manifest
+from preprocessing import PREPROCESSOR_FILE, Preprocessor
+from battle_features import CAT_COLUMNS, NUM_COLUMNS, FEATURE_COLUMNS
+from quantized_data import load_pools, quantize_dataset
+from training_data import load_labels, save_snapshot, load_snapshot
+from incremental import (
+    FULL,
+    SKIP,
+    INCREMENTAL,
+    record_drift,
+    publish_update,
+    choose_retraining,
+    continue_training,
+    load_training_state,
+    record_full_retrain,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_download_battle_files(tmp_path, stat_ink_server):
+    days = [date(2023, 7, 1) + timedelta(days=i) for i in range(5)]
+    for day in days[:4]:
+        path = battle_file_url(day, '')
+        stat_ink_server.add(path, f'# season,period\n{day},1\n'.encode() * 100)
+    stat_ink_server.fail_next[battle_file_url(days[1], '')] = 2
+    stat_ink_server.truncate_next[battle_file_url(days[2], '')] = True
+
+    results = download_battle_files(
+        days, str(tmp_path), max_workers=3, base_url=stat_ink_server.url, backoff=0
+    )
+
+    assert sorted(results[DOWNLOADED]) == [f'{day}.csv' for day in days[:4]]
+    assert results[MISSING] == [f'{days[4]}.csv']
+    assert not results[FAILED]
+    for day in days[:4]:
+        with open(os.path.join(tmp_path, f'{day}.csv'), 'rb') as csv_file:
+            assert csv_file.read() == stat_ink_server.files[battle_file_url(day, '')]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+    results = download_battle_files(
+        days, str(tmp_path), max_workers=3, base_url=stat_ink_server.url, backoff=0
+    )
+
+    assert sorted(results[NOT_MODIFIED]) == [f'{day}.csv' for day in days[:4]]
+
+
+def test_download_battle_files_keeps_nothing_after_failure(tmp_path, stat_ink_server):
+    day = date(2023, 7, 1)
+    stat_ink_server.add(battle_file_url(day, ''), b'# season,period\n')
+    stat_ink_server.fail_next[battle_file_url(day, '')] = 10
+
+    results = download_battle_files(
+        [day], str(tmp_path), base_url=stat_ink_server.url, retries=1, backoff=0
+    )
+
+    assert results[FAILED] == [f'{day}.csv']
+    assert not os.path.exists(os.path.join(tmp_path, f'{day}.csv'))
+
+
+def test_day_feature_cache(tmp_path):
+    calls = []
+
+    def compute(path):
+        calls.append(path)
+        return pd.read_csv(path).assign(total=lambda df: df['a'] + df['b'])
+
+    source = tmp_path / '2023-07-01.csv'
+    source.write_text('a,b\n1,2\n3,4\n')
+    cache = DayFeatureCache(str(tmp_path / 'cache'), compute)
+
+    first, first_new = cache.load(str(source))
+    second, second_new = cache.load(str(source))
+
+    assert first_new and not second_new
+    assert len(calls) == 1
+    assert second.to_dict() == first.to_dict()
+
+    source.write_text('a,b\n5,6\n')
+    changed, changed_new = cache.load(str(source))
+
+    assert changed_new
+    assert changed['total'].to_list() == [11]
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+
+    bumped = DayFeatureCache(str(tmp_path / 'cache'), compute, version='2')
+
+    assert bumped.load(str(source))[1]
+
+
+def test_read_battle_csv():
+    path = os.path.join(ROOT, 'integration_tests', 'test.csv')
+    raw = pd.read_csv(path)
+
+    streamed = read_battle_csv(path, chunksize=4)
+    whole = read_battle_csv(path, chunksize=None)
+
+    assert sorted(streamed.columns) == sorted(battle_dtypes())
+    assert streamed['A1-inked'].dtype == 'int32'
+    assert streamed['stage'].dtype == 'category'
+    assert streamed.astype(str).equals(whole.astype(str))
+    for column in ['time', 'A1-kill', 'B4-inked']:
+        assert streamed[column].to_list() == raw[column].fillna(0).to_list()
+    assert streamed['stage'].astype(str).to_list() == raw['stage'].to_list()
+
+
+def test_sync_folder(tmp_path):
+    partitions = tmp_path / 'battle_data'
+    df = pd.DataFrame(
+        {'period': ['2023-07-01T00:00:00+00:00'], 'kill_diff': [3], 'win': ['alpha']}
+    )
+    for day in ['2023-07-01', '2023-07-02']:
+        write_partition(df, str(partitions / partition_file(day)))
+    bucket = LocalBucket(str(tmp_path / 'bucket'))
+
+    first = sync_folder(bucket, str(partitions), 'data/battle_data')
+    second = sync_folder(bucket, str(partitions), 'data/battle_data')
+    write_partition(df.assign(kill_diff=[4]), str(partitions / partition_file(day)))
+    third = sync_folder(bucket, str(partitions), 'data/battle_data')
+
+    assert first == [partition_file('2023-07-01'), partition_file('2023-07-02')]
+    assert not second
+    assert third == [partition_file('2023-07-02')]
+    uploaded = pd.read_parquet(
+        io.BytesIO(bucket.read_path('data/battle_data/' + partition_file(day)))
+    )
+    assert uploaded['kill_diff'].to_list() == [4]
+    assert str(uploaded['period'].dtype) == 'datetime64[ns, UTC]'
+
+
+def test_sync_folder_uploads_model_manifest_last(tmp_path):
+    model_dir = tmp_path / 'prod_model'
+    model_dir.mkdir()
+    for name in [PREPROCESSOR_FILE, 'one_hot_columns.pkl']:
+        (model_dir / name).write_bytes(name.encode('utf-8'))
+    write_model_manifest(str(model_dir))
+    bucket = LocalBucket(str(tmp_path / 'bucket'))
+
+    uploaded = sync_folder(bucket, str(model_dir), last=[MODEL_MANIFEST])
+    assert uploaded == ['one_hot_columns.pkl', PREPROCESSOR_FILE, MODEL_MANIFEST]
+
+
+def test_load_partitions_is_idempotent(tmp_path):
+    partitions = tmp_path / 'battle_data'
+    battles = pd.DataFrame(
+        {
+            'battle_id': [1, 2, 3],
+            'period': ['2023-07-01T00:00:00+00:00'] * 3,
+            'kill_diff': [3, -2, 5],
+            'win': ['alpha', 'bravo', 'alpha'],
+        }
+    )
+    write_partition(battles, str(partitions / partition_file('2023-07-01')))
+    write_partition(
+        battles.iloc[2:].assign(period='2023-07-02T00:00:00+00:00'),
+        str(partitions / partition_file('2023-07-02')),
+    )
+    warehouse = SQLiteWarehouse(str(tmp_path / 'warehouse.db'), str(partitions))
+
+    def row_count():
+        with sqlite3.connect(tmp_path / 'warehouse.db') as conn:
+            return conn.execute('SELECT COUNT(*) FROM battle_data').fetchone()[0]
+
+    assert load_partitions(warehouse, str(tmp_path)) == ['2023-07-01', '2023-07-02']
+    assert row_count() == 3
+    # Battle 3 was already stored under the first day it was loaded with
+    with sqlite3.connect(tmp_path / 'warehouse.db') as conn:
+        assert conn.execute(
+            'SELECT battle_date, row_count FROM battle_data_partition_loads'
+        ).fetchall() == [('2023-07-01', 3), ('2023-07-02', 0)]
+    assert not load_partitions(warehouse, str(tmp_path))
+    assert row_count() == 3
+
+    write_partition(
+        battles.assign(kill_diff=[4, -2, 5]),
+        str(partitions / partition_file('2023-07-01')),
+    )
+
+    assert load_partitions(warehouse, str(tmp_path)) == ['2023-07-01']
+    assert row_count() == 3
+
+
+def test_window_cache(tmp_path):
+    periods = pd.date_range('2023-07-01', '2023-07-10 23:00', freq='6H', tz='UTC')
+    warehouse = pd.DataFrame({'period': periods, 'kill_diff': range(len(periods))})
+    fetched = []
+
+    def fetch(start, end):
+        fetched.append((start, end))
+        days = warehouse['period'].dt.date
+        return warehouse[(days >= start) & (days <= end)]
+
+    cache = WindowCache(str(tmp_path), fetch, refresh_days=0)
+    union = cache.load(date(2023, 7, 2), date(2023, 7, 5))
+    current = cache.window(date(2023, 7, 3), date(2023, 7, 5))
+    reference = cache.window(date(2023, 7, 2), date(2023, 7, 4))
+
+    assert fetched == [(date(2023, 7, 2), date(2023, 7, 5))]
+    assert len(union) == 16
+    assert list(current['kill_diff']) == list(range(8, 20))
+    assert list(reference['kill_diff']) == list(range(4, 16))
+    assert np.shares_memory(
+        current['kill_diff'].to_numpy(), union['kill_diff'].to_numpy()
+    )
+
+    # A later run only asks the warehouse for the days it hasn't cached
+    cache.invalidate(['2023-07-03'])
+    cache.load(date(2023, 7, 3), date(2023, 7, 7))
+    assert fetched[1:] == [
+        (date(2023, 7, 3), date(2023, 7, 3)),
+        (date(2023, 7, 6), date(2023, 7, 7)),
+    ]
+    assert list(cache.window(date(2023, 7, 6), date(2023, 7, 6))['kill_diff']) == [
+        20,
+        21,
+        22,
+        23,
+    ]
+
+
+def test_score_archives_resumes(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for day in ['2023-06-30', '2023-07-01', '2023-07-02']:
+        shutil.copyfile(
+            os.path.join(ROOT, 'integration_tests', 'test.csv'),
+            data_dir / f'{day}.csv',
+        )
+    (data_dir / '2023-07-02.csv').write_text('not,a\nbattle,export\n')
+    model_dir = os.path.join(
+        ROOT, 'integration_tests', 'integration_files', 'prod_model'
+    )
+    files = archive_files(str(data_dir), start='2023-07-01')
+    output_dir = str(tmp_path / 'scores')
+
+    first = score_archives(files, output_dir, model_dir, workers=2)
+    assert first[SCORED] == ['2023-07-01']
+    assert first[SCORE_FAILED] == ['2023-07-02']
+    scored = pd.read_parquet(os.path.join(output_dir, partition_file('2023-07-01')))
+    assert scored['prediction'].to_list() == [
+        'bravo',
+        'bravo',
+        'alpha',
+        'bravo',
+        'alpha',
+        'alpha',
+        'bravo',
+        'bravo',
+        'alpha',
+    ]
+    assert (
+        scored['win'].astype(str).to_list()
+        == pd.read_csv(os.path.join(ROOT, 'integration_tests', 'test.csv'))[
+            'win'
+        ].to_list()
+    )
+
+    assert score_archives(files, output_dir, model_dir)[SKIPPED] == ['2023-07-01']
+    shutil.copyfile(data_dir / '2023-06-30.csv', data_dir / '2023-07-02.csv')
+    second = score_archives(files, output_dir, model_dir)
+    assert (second[SCORED], second[SKIPPED]) == (['2023-07-02'], ['2023-07-01'])
+
+
+def test_run_sweep(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = 400
+    X = pd.DataFrame(
+        {
+            'kill_diff': rng.random(rows),
+            'time': rng.random(rows),
+            'mode_Rainmaker': rng.integers(0, 2, rows).astype('uint8'),
+        }
+    )
+    y = ((X['kill_diff'] + 0.1 * rng.standard_normal(rows)) > 0.5).astype(int)
+    y = y.to_numpy().reshape(-1, 1)
+    X_train, X_test, y_train, y_test = X[:300], X[300:], y[:300], y[300:]
+
+    root = str(tmp_path / 'scaled_data')
+    snapshot_dir = save_snapshot(root, X_train, X_test, y_train, y_test)
+    assert save_snapshot(root, X_train, X_test, y_train, y_test) == snapshot_dir
+    X_mapped, X_test_mapped, y_mapped, _ = load_snapshot(snapshot_dir)
+    pd.testing.assert_frame_equal(X_mapped, X_train.reset_index(drop=True))
+    pd.testing.assert_frame_equal(X_test_mapped, X_test.reset_index(drop=True))
+    np.testing.assert_array_equal(y_mapped, y_train)
+    # Columns are contiguous views of the mapped, column-major matrices
+    assert isinstance(load_labels(snapshot_dir, 'train'), np.memmap)
+    column = X_mapped['time'].to_numpy()
+    assert column.flags['C_CONTIGUOUS'] and not column.flags['OWNDATA']
+
+    dataset_dir, built = quantize_dataset(snapshot_dir)
+    assert built and dataset_dir == snapshot_dir
+    assert quantize_dataset(snapshot_dir) == (snapshot_dir, False)
+    train_pool, test_pool = load_pools(dataset_dir)
+    assert train_pool.is_quantized() and train_pool.num_row() == 300
+    assert train_pool.get_cat_feature_indices() == [2]
+    assert test_pool.num_row() == 100
+
+    other_dir = save_snapshot(root, X_train, X_test, 1 - y_train, y_test)
+    assert other_dir != snapshot_dir
+    # Older snapshots are removed once a new one is written
+    assert os.listdir(root) == [os.path.basename(other_dir)]
+    dataset_dir, _ = quantize_dataset(
+        save_snapshot(root, X_train, X_test, y_train, y_test)
+    )
+
+    results = run_sweep(
+        dataset_dir,
+        str(tmp_path / 'artifacts'),
+        trials=4,
+        parallel=2,
+        wandb_settings={'mode': 'disabled'},
+        seed=0,
+        iterations=20,
+    )
+    assert len(results['trials']) == 4
+    assert results['best'] is results['trials'][0]
+    aucs = [trial['validation']['AUC'] for trial in results['trials']]
+    assert aucs == sorted(aucs, reverse=True)
+    assert {trial['thread_count'] for trial in results['trials']} == {
+        max(1, (os.cpu_count() or 1) // 2)
+    }
+    assert all(os.path.isfile(trial['model_file']) for trial in results['trials'])
+    report = results['report']
+    assert (report['trials'], report['parallel']) == (4, 2)
+    assert report['trial_seconds'] > 0
+    assert 0 < report['slot_utilisation'] <= 1
+
+    halving = run_successive_halving(
+        dataset_dir,
+        str(tmp_path / 'artifacts'),
+        trials=4,
+        parallel=2,
+        wandb_settings={'mode': 'disabled'},
+        seed=0,
+        iterations=30,
+    )
+    report = halving['report']
+    assert [(r['configurations'], r['iterations']) for r in report['rungs']] == [
+        (4, 10),
+        (1, 30),
+    ]
+    assert len(halving['trials']) == 5
+    best_of_first_rung = max(
+        halving['trials'][:4], key=lambda t: t['validation']['AUC']
+    )
+    assert halving['best']['parameters'] == best_of_first_rung['parameters']
+    assert halving['best']['iterations_trained'] <= 30
+    assert report['iterations_trained'] <= 4 * 10 + 30
+    assert report['compute_saved'] == 1 - report['iterations_trained'] / (4 * 30)
+
+
+def test_halving_rungs():
+    assert halving_rungs(27, 1000, 3) == [(27, 37), (9, 111), (3, 333), (1, 1000)]
+    assert halving_rungs(10, 900, 3) == [(10, 100), (3, 300), (1, 900)]
+    assert halving_rungs(2, 1000, 3) == [(2, 1000)]
+
+
+def engineered_battles(days, rows_per_day, seed=0):
+    # Engineered battles spread over days, with wins that follow the kill difference
+    rng = np.random.default_rng(seed)
+    rows = len(days) * rows_per_day
+    df = pd.DataFrame(
+        {
+            'period': np.repeat(
+                [f'{day}T12:00:00+00:00' for day in days], rows_per_day
+            ),
+            **{column: rng.normal(0, 5, rows) for column in NUM_COLUMNS},
+            'mode': rng.choice(['area', 'hoko', 'asari'], rows),
+            'stage': rng.choice(['amabi', 'gonzui'], rows),
+            'lobby': rng.choice(['regular', 'xmatch'], rows),
+        }
+    )
+    noise = rng.normal(0, 3, rows)
+    df['win'] = np.where(df['kill_diff'] + noise > 0, 'bravo', 'alpha')
+    return df
+
+
+def test_incremental_retraining(tmp_path):
+    model_dir = str(tmp_path / 'prod_model')
+    os.makedirs(model_dir)
+    old = engineered_battles(['2023-07-01', '2023-07-02'], 500)
+    X = pd.get_dummies(old[FEATURE_COLUMNS], columns=CAT_COLUMNS, drop_first=True)
+    scaler = MinMaxScaler().fit(X[NUM_COLUMNS])
+    preprocessor = Preprocessor.from_fitted(scaler, X.columns.tolist())
+    preprocessor.save(os.path.join(model_dir, PREPROCESSOR_FILE))
+    parameters = {
+        'max_depth': 3,
+        'l2_leaf_reg': 3,
+        'learning_rate': 0.1,
+        'bagging_temperature': 0.5,
+    }
+    model = make_classifier(parameters, iterations=30)
+    X = preprocessor.transform(old)
+    model.fit(
+        X,
+        (old['win'] == 'bravo').astype(int),
+        cat_features=X.select_dtypes(['uint8']).columns.to_list(),
+        eval_set=(X, (old['win'] == 'bravo').astype(int)),
+        verbose=False,
+    )
+    publish_update(model, model_dir, date(2023, 7, 2))
+
+    today = date(2023, 7, 5)
+    assert choose_retraining(load_training_state(model_dir), today, 30, 0.1)[0] == FULL
+    record_full_retrain(model_dir, parameters, date(2023, 7, 2), date(2023, 7, 3))
+    state = load_training_state(model_dir)
+    assert choose_retraining(state, today, 30, 0.1)[0] == INCREMENTAL
+    assert choose_retraining(state, date(2023, 7, 3), 30, 0.1)[0] == SKIP
+    assert choose_retraining(state, date(2023, 8, 2), 30, 0.1)[0] == FULL
+    record_drift(model_dir, 0.25)
+    assert choose_retraining(load_training_state(model_dir), today, 30, 0.1) == (
+        FULL,
+        'prediction drift 0.250 above 0.1',
+    )
+
+    df = pd.concat(
+        [old, engineered_battles(['2023-07-03', '2023-07-04', '2023-07-05'], 400, 1)]
+    )
+    # Nothing to continue on when the window has no battles after the prod model's
+    assert continue_training(old, model_dir, date(2023, 7, 4), 20) == (None, None)
+    updated, report = continue_training(df, model_dir, date(2023, 7, 4), 20)
+    # Only the complete days after the prod model's training, less the holdout
+    assert report['rows'] + report['holdout_rows'] == 800
+    assert report['trees'] == model.tree_count_ + report['trees_added']
+    assert report['trees_added'] >= 1
+    assert set(report['holdout']) == {'AUC', 'Accuracy', 'Logloss'}
+
+    publish_update(updated, model_dir, date(2023, 7, 4))
+    state = load_training_state(model_dir)
+    assert (state['trained_through'], state['drift']) == ('2023-07-04', None)
+    assert load_prod_model(model_dir).tree_count_ == report['trees']
@@ -0,0 +1,620 @@
+import io
+import os
+import pickle
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import jinja2
+from sklearn.preprocessing import MinMaxScaler
+import api
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobManager
+from inference import InferenceEngine
+from metrics import Registry
+from background import BackgroundThread
+from micro_batch import MicroBatcher
+from prediction_cache import PredictionCache, feature_hashes
+from shadow import ShadowScorer
+from preprocessing import PREPROCESSOR_FILE, Preprocessor
+from battle_features import (
+    NUM_COLUMNS,
+    CAT_COLUMNS,
+    FEATURE_COLUMNS,
+    engineer_features,
+)
+from model_store import ModelCache, LocalModelStore
+from model_format import (
+    COLUMNS_FILE,
+    NATIVE_MODEL_FILE,
+    PICKLED_MODEL_FILE,
+    write_model_manifest,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Expected winners for integration_tests/test.csv under the integration test model
+INTEGRATION_PREDICTIONS = [
+    'bravo',
+    'bravo',
+    'alpha',
+    'bravo',
+    'alpha',
+    'alpha',
+    'bravo',
+    'bravo',
+    'alpha',
+]
+
+
+def publish(model_dir, model, columns):
+    for name, value in [(PICKLED_MODEL_FILE, model), (COLUMNS_FILE, columns)]:
+        with open(os.path.join(model_dir, name), 'wb') as model_file:
+            pickle.dump(value, model_file)
+
+
+class CountingStore(LocalModelStore):
+    def __init__(self, model_dir):
+        super().__init__(model_dir)
+        self.reads = 0
+
+    def read(self, name):
+        self.reads += 1
+        return super().read(name)
+
+
+def test_model_cache_reloads_on_new_version(tmp_path):
+    publish(tmp_path, {'model': 1}, ['kill_diff'])
+    store = CountingStore(str(tmp_path))
+    cache = ModelCache(store, refresh_interval=0)
+
+    first = cache.get()
+    assert cache.get() is first
+    assert not cache.refresh()
+    assert store.reads == 5
+    assert first.model == {'model': 1}
+    assert first.preprocessor is None
+
+    publish(tmp_path, {'model': 2, 'trees': 10}, ['kill_diff', 'time'])
+    assert cache.refresh()
+    second = cache.get()
+    assert second.model == {'model': 2, 'trees': 10}
+    assert second.columns == ['kill_diff', 'time']
+    assert second.version != first.version
+    assert store.reads == 10
+
+
+def test_model_cache_waits_for_the_model_manifest(tmp_path):
+    publish(tmp_path, {'model': 1}, ['kill_diff'])
+    write_model_manifest(str(tmp_path))
+    cache = ModelCache(LocalModelStore(str(tmp_path)), refresh_interval=0)
+    assert cache.get().model == {'model': 1}
+
+    # Files of the next publish arrive before its manifest, and aren't loaded with
+    # what is left of the current one
+    publish(tmp_path, {'model': 2}, ['kill_diff', 'time'])
+    assert not cache.refresh()
+    assert cache.get().model == {'model': 1}
+
+    write_model_manifest(str(tmp_path))
+    assert cache.refresh()
+    assert cache.get().model == {'model': 2}
+    assert cache.get().columns == ['kill_diff', 'time']
+
+
+def battles(rows, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.integers(-50, 50, (rows, 6)), columns=NUM_COLUMNS)
+    df['mode'] = rng.choice(['area', 'yagura', 'hoko', 'asari'], rows)
+    df['stage'] = rng.choice(['mategai', 'yunohana', 'gonzui'], rows)
+    df['lobby'] = rng.choice(['bankara_open', 'bankara_challenge', 'xmatch'], rows)
+    return df
+
+
+def test_preprocessor_matches_training_transform():
+    train = pd.get_dummies(battles(200, 0), columns=CAT_COLUMNS, drop_first=True)
+    scaler = MinMaxScaler().fit(train[NUM_COLUMNS])
+    preprocessor = Preprocessor.from_json(
+        Preprocessor.from_fitted(scaler, train.columns.tolist()).to_json()
+    )
+
+    batch = battles(50, 1)
+    batch.loc[0, 'stage'] = 'unseen_stage'
+    expected = pd.get_dummies(batch, columns=CAT_COLUMNS, drop_first=True)
+    expected[NUM_COLUMNS] = scaler.transform(expected[NUM_COLUMNS])
+    expected = expected.reindex(columns=train.columns).fillna(0)
+
+    result = preprocessor.transform(batch)
+    assert list(result.columns) == list(train.columns)
+    np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+    # A single battle is scaled with the training scaler, not fitted on itself
+    np.testing.assert_array_equal(
+        preprocessor.transform(batch.iloc[:1]).to_numpy(), expected.iloc[:1].to_numpy()
+    )
+
+
+def test_micro_batcher_groups_concurrent_requests():
+    calls = []
+
+    def score(df):
+        calls.append(len(df))
+        return df['x'].to_numpy() * 2
+
+    batcher = MicroBatcher(score, max_batch_size=100, max_wait=0.2)
+    frames = [pd.DataFrame({'x': [i, i + 100]}) for i in range(8)]
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(batcher.predict, frames))
+
+    for frame, result in zip(frames, results):
+        np.testing.assert_array_equal(result, frame['x'].to_numpy() * 2)
+    assert sum(calls) == 16
+    assert len(calls) < 8
+    stats = batcher.stats()
+    assert stats['requests'] == 8
+    assert stats['batches'] == len(calls)
+    assert stats['latency_ms']['p50'] > 0
+
+    # Requests the model can't score together are scored one by one
+    calls.clear()
+    batcher = MicroBatcher(
+        score, max_batch_size=100, max_wait=0.2, batchable=lambda: False
+    )
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(batcher.predict, frames))
+    for frame, result in zip(frames, results):
+        np.testing.assert_array_equal(result, frame['x'].to_numpy() * 2)
+    assert calls == [2] * 8
+
+
+def test_micro_batcher_isolates_failing_requests(monkeypatch):
+    def score(df):
+        if (df['x'] < 0).any():
+            raise ValueError('negative x')
+        return df['x'].to_numpy() * 2
+
+    batcher = MicroBatcher(score, max_batch_size=100, max_wait=0.2)
+    frames = [pd.DataFrame({'x': [-i if i == 3 else i]}) for i in range(1, 7)]
+    with ThreadPoolExecutor(6) as pool:
+        futures = [pool.submit(batcher.predict, frame) for frame in frames]
+    for frame, future in zip(frames, futures):
+        if frame['x'].iloc[0] < 0:
+            assert isinstance(future.exception(), ValueError)
+        else:
+            np.testing.assert_array_equal(future.result(), frame['x'].to_numpy() * 2)
+    stats = batcher.stats()
+    assert stats['errors'] == 1
+    assert stats['requests'] == 5
+
+    # A model that can't be loaded fails the requests, not the worker thread
+    def unavailable():
+        raise OSError('model store unavailable')
+
+    batcher = MicroBatcher(score, max_wait=0.2, batchable=unavailable)
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(batcher.predict, frame, 5) for frame in frames[:2]]
+    assert [future.result().tolist() for future in futures] == [[2], [4]]
+
+    # Neither does an error outside scoring
+    monkeypatch.setattr(batcher, '_finish', lambda batch, results: 1 / 0)
+    assert isinstance(batcher.submit(frames[0]).exception(5), ZeroDivisionError)
+    monkeypatch.undo()
+    assert batcher.predict(frames[1], 5).tolist() == [4]
+
+
+def test_predict_json(monkeypatch):
+    monkeypatch.setattr(
+        api,
+        'MODEL_CACHE',
+        ModelCache(
+            LocalModelStore(
+                os.path.join(
+                    ROOT, 'integration_tests', 'integration_files', 'prod_model'
+                )
+            ),
+            refresh_interval=0,
+        ),
+    )
+    battles = pd.read_csv(os.path.join(ROOT, 'integration_tests', 'test.csv'))
+    client = api.app.test_client()
+
+    response = client.post(
+        '/predict',
+        data=battles.to_json(orient='records'),
+        content_type='application/json',
+    )
+    assert response.status_code == 200
+    assert response.get_json()['predictions'] == INTEGRATION_PREDICTIONS
+
+    response = client.post(
+        '/predict',
+        data=battles.iloc[0].to_json(),
+        content_type='application/json',
+    )
+    # The integration model has no preprocessor, so a lone battle is scaled on its own
+    assert response.get_json()['prediction'] in ['alpha', 'bravo']
+
+    response = client.post('/predict', json=[{'time': 180}])
+    assert response.status_code == 400
+    for payload in [5, 'battle', [5], [{'time': 180}, None]]:
+        assert client.post('/predict', json=payload).status_code == 400
+    assert 'mode' in response.get_json()['missing']
+
+    battle = battles.iloc[0].to_dict()
+    battle['A1-kill'] = 'abc'
+    response = client.post('/predict', json=battle)
+    assert response.status_code == 400
+    assert response.get_json()['invalid'] == ['A1-kill']
+
+
+def test_predict_csv_streams_chunks(tmp_path, monkeypatch):
+    model_dir = os.path.join(
+        ROOT, 'integration_tests', 'integration_files', 'prod_model'
+    )
+    for name in [PICKLED_MODEL_FILE, COLUMNS_FILE]:
+        shutil.copyfile(os.path.join(model_dir, name), tmp_path / name)
+    # Scale with a fixed scaler, so chunking can't change the predictions
+    test_csv = os.path.join(ROOT, 'integration_tests', 'test.csv')
+    with open(tmp_path / COLUMNS_FILE, 'rb') as columns_file:
+        columns = pickle.load(columns_file)
+    features = engineer_features(pd.read_csv(test_csv), FEATURE_COLUMNS)
+    scaler = MinMaxScaler().fit(features[NUM_COLUMNS])
+    Preprocessor.from_fitted(scaler, columns).save(tmp_path / PREPROCESSOR_FILE)
+    monkeypatch.setattr(
+        api, 'MODEL_CACHE', ModelCache(LocalModelStore(str(tmp_path)), 0)
+    )
+    client = api.app.test_client()
+
+    with open(test_csv, 'rb') as csv_file:
+        whole = client.post('/predict_csv', data={'file_csv': (csv_file, 'test.csv')})
+    monkeypatch.setattr(api, 'CSV_CHUNKSIZE', 4)
+    with open(test_csv, 'rb') as csv_file:
+        chunked = client.post('/predict_csv', data=csv_file.read())
+
+    assert chunked.data == whole.data
+    predictions = pd.read_csv(io.BytesIO(chunked.data), dtype=str)
+    original = pd.read_csv(test_csv, dtype=str)
+    assert len(predictions) == len(original)
+    assert list(predictions.columns[1:-1]) == list(original.columns)
+    assert predictions['prediction'].isin(['alpha', 'bravo']).all()
+
+    # Uploads without the battle fields are rejected before streaming starts
+    response = client.post('/predict_csv', data=original.drop(columns='mode').to_csv())
+    assert response.status_code == 400
+    assert response.get_json()['missing'] == ['mode']
+    assert client.post('/predict_csv', data=b'').status_code == 400
+
+
+def wait_for_job(jobs, job_id):
+    deadline = time.time() + 10
+    while jobs.status(job_id)['status'] in [QUEUED, RUNNING]:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return jobs.status(job_id)
+
+
+def test_job_manager(tmp_path):
+    def score(source_path, result_path):
+        with open(source_path, 'rb') as source:
+            content = source.read()
+        with open(result_path, 'wb') as result:
+            if content == b'bad':
+                result.write(b'partial')
+                raise ValueError('not a csv')
+            result.write(content.upper())
+
+    jobs = JobManager(str(tmp_path), score, max_workers=2, ttl=3600)
+    done_id = jobs.submit(io.BytesIO(b'battles'))
+    failed_id = jobs.submit(io.BytesIO(b'bad'))
+
+    assert wait_for_job(jobs, done_id)['status'] == DONE
+    with open(jobs.result_path(done_id), 'rb') as result:
+        assert result.read() == b'BATTLES'
+    failed = wait_for_job(jobs, failed_id)
+    assert failed['status'] == FAILED
+    assert failed['error'] == 'not a csv'
+    assert os.listdir(tmp_path / failed_id) == ['status.json']
+    assert jobs.status('../' + done_id) is None
+    stats = jobs.stats()
+    assert (stats['done'], stats['failed'], stats['queue_depth']) == (1, 1, 0)
+
+    jobs.ttl = 0
+    jobs.cleanup()
+    assert jobs.status(done_id) is None
+    assert not os.listdir(tmp_path)
+
+
+def test_scoring_job_endpoints(tmp_path, monkeypatch):
+    model_dir = os.path.join(
+        ROOT, 'integration_tests', 'integration_files', 'prod_model'
+    )
+    monkeypatch.setattr(api, 'MODEL_CACHE', ModelCache(LocalModelStore(model_dir), 0))
+    monkeypatch.setattr(api, 'JOBS', JobManager(str(tmp_path), api.score_csv_file))
+    client = api.app.test_client()
+
+    with open(os.path.join(ROOT, 'integration_tests', 'test.csv'), 'rb') as csv_file:
+        response = client.post('/jobs', data={'file_csv': (csv_file, 'test.csv')})
+    assert response.status_code == 202
+    job = response.get_json()
+
+    wait_for_job(api.JOBS, job['job_id'])
+    assert client.get(job['status_url']).get_json()['status'] == DONE
+    result = client.get(job['result_url'])
+    predictions = pd.read_csv(io.BytesIO(result.data))['prediction']
+    assert predictions.tolist() == INTEGRATION_PREDICTIONS
+    assert client.get('/jobs/' + 'f' * 32).status_code == 404
+
+    # The upload page polls the job and keeps the download hidden until it is done.
+    # The app finds its templates from the directory the image starts it in.
+    templates = os.path.join(ROOT, 'deployment', 'templates')
+    monkeypatch.setattr(api.app, 'jinja_loader', jinja2.FileSystemLoader(templates))
+    with open(os.path.join(ROOT, 'integration_tests', 'test.csv'), 'rb') as csv_file:
+        page = client.post('/', data={'file_csv': (csv_file, 'test.csv')}).text
+    assert 'data-status-url="/jobs/' in page
+    assert 'hidden>Download</a>' in page
+
+
+def test_model_cache_loads_native_model(tmp_path, monkeypatch):
+    model_dir = os.path.join(
+        ROOT, 'integration_tests', 'integration_files', 'prod_model'
+    )
+    with open(os.path.join(model_dir, PICKLED_MODEL_FILE), 'rb') as model_file:
+        pickle.load(model_file).save_model(str(tmp_path / NATIVE_MODEL_FILE))
+    shutil.copyfile(os.path.join(model_dir, COLUMNS_FILE), tmp_path / COLUMNS_FILE)
+    monkeypatch.setattr(
+        api, 'MODEL_CACHE', ModelCache(LocalModelStore(str(tmp_path)), 0)
+    )
+
+    battles = pd.read_csv(os.path.join(ROOT, 'integration_tests', 'test.csv'))
+    predictions = api.winner_labels(api.score_battles(battles))
+    assert predictions.tolist() == INTEGRATION_PREDICTIONS
+
+
+def test_inference_engine_matches_pandas_path():
+    model_dir = os.path.join(
+        ROOT, 'integration_tests', 'integration_files', 'prod_model'
+    )
+    with open(os.path.join(model_dir, PICKLED_MODEL_FILE), 'rb') as model_file:
+        model = pickle.load(model_file)
+    with open(os.path.join(model_dir, COLUMNS_FILE), 'rb') as columns_file:
+        columns = pickle.load(columns_file)
+    batch = battles(300, 2)
+    batch.loc[0, 'stage'] = 'unseen_stage'
+    batch.loc[1, 'time'] = np.nan
+    batch['lobby'] = batch['lobby'].replace('bankara_challenge', 'regular')
+
+    scaler = MinMaxScaler().fit(battles(200, 0)[NUM_COLUMNS])
+    preprocessor = Preprocessor.from_fitted(scaler, columns)
+    for expected_input, engine in [
+        (api.legacy_model_input(batch, columns), InferenceEngine(model, columns)),
+        (
+            preprocessor.transform(batch),
+            InferenceEngine.for_model(model, columns, preprocessor),
+        ),
+    ]:
+        numeric, categorical = engine.features(batch)
+        assert numeric.dtype == np.float32 and numeric.flags['C_CONTIGUOUS']
+        np.testing.assert_array_equal(
+            numeric, expected_input[NUM_COLUMNS].to_numpy(dtype=np.float32)
+        )
+        np.testing.assert_array_equal(
+            categorical,
+            expected_input[columns[6:]].astype(int).astype(str).to_numpy().astype('S'),
+        )
+        np.testing.assert_array_equal(
+            engine.predict(batch, thread_count=1), model.predict(expected_input)
+        )
+
+    # Models whose inputs aren't laid out as numeric then one-hot columns keep pandas
+    assert InferenceEngine.for_model({'model': 1}, columns) is None
+    assert InferenceEngine.for_model(model, columns[6:] + columns[:6]) is None
+
+
+def test_prediction_cache_evicts_expires_and_invalidates(monkeypatch):
+    cache = PredictionCache(max_entries=2, ttl=60)
+    cache.put_many('v1', [1, 2], [0, 1])
+    assert cache.get_many('v1', [1, 3]) == [0, None]
+    cache.put_many('v1', [3], [1])
+    # 2 was used least recently
+    assert cache.get_many('v1', [1, 2, 3]) == [0, None, 1]
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 120)
+    assert cache.get_many('v1', [1]) == [None]
+    cache.put_many('v1', [1], [0])
+    assert cache.get_many('v2', [1]) == [None]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (3, 4)
+    assert (stats['evictions'], stats['expirations'], stats['invalidations']) == (
+        1,
+        1,
+        1,
+    )
+
+
+def test_predict_skips_cached_battles(tmp_path, monkeypatch):
+    model_dir = os.path.join(
+        ROOT, 'integration_tests', 'integration_files', 'prod_model'
+    )
+    for name in [PICKLED_MODEL_FILE, COLUMNS_FILE]:
+        shutil.copyfile(os.path.join(model_dir, name), tmp_path / name)
+    with open(tmp_path / COLUMNS_FILE, 'rb') as columns_file:
+        columns = pickle.load(columns_file)
+    scaler = MinMaxScaler().fit(battles(200, 0)[NUM_COLUMNS])
+    Preprocessor.from_fitted(scaler, columns).save(tmp_path / PREPROCESSOR_FILE)
+    monkeypatch.setattr(
+        api, 'MODEL_CACHE', ModelCache(LocalModelStore(str(tmp_path)), 0)
+    )
+    monkeypatch.setattr(api, 'PREDICTION_CACHE', PredictionCache(100, 60))
+    scored = []
+    model_predictions = api.model_predictions
+
+    def counting_predictions(loaded, df):
+        scored.append(len(df))
+        return model_predictions(loaded, df)
+
+    monkeypatch.setattr(api, 'model_predictions', counting_predictions)
+
+    batch = battles(30, 3)
+    expected = api.predict(batch)
+    # The same battles, re-parsed as floats and reordered, among new ones
+    repeat = pd.concat([batch.astype({'time': float}).iloc[::-1], battles(10, 4)])
+    predictions = api.predict(repeat)
+    np.testing.assert_array_equal(predictions[:30], expected[::-1])
+    np.testing.assert_array_equal(predictions[30:], api.predict(battles(10, 4)))
+    assert scored == [30, 10]
+    assert len(np.unique(feature_hashes(repeat))) == 40
+
+    Preprocessor.from_fitted(scaler, columns).save(tmp_path / PREPROCESSOR_FILE)
+    os.utime(tmp_path / PREPROCESSOR_FILE, ns=(0, 0))
+    api.MODEL_CACHE.refresh()
+    api.predict(batch)
+    assert scored == [30, 10, 30]
+    assert api.PREDICTION_CACHE.stats()['invalidations'] == 1
+
+
+def test_background_thread_restarts_after_fork():
+    ran, resets = [], []
+
+    def run():
+        ran.append(os.getpid())
+
+    thread = BackgroundThread(run, 'test-worker', on_fork=lambda: resets.append(1))
+    thread.start()
+    thread.start()
+    pid = os.fork()
+    if pid == 0:
+        # The parent's thread didn't survive the fork, so the child starts its own
+        thread.start()
+        time.sleep(0.2)
+        os._exit(0 if resets == [1] and ran[-1] == os.getpid() else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert ran == [os.getpid()]
+    assert not resets
+
+
+def test_metrics_registry_renders_and_merges_processes(tmp_path):
+    registry = Registry(str(tmp_path))
+    rows = registry.counter('rows_total', 'Rows', ['source'])
+    busy = registry.gauge('busy', 'Busy')
+    seconds = registry.histogram('stage_seconds', 'Stages', ['stage'], [0.1, 1])
+    rows.inc('model', amount=3)
+    busy.inc()
+    seconds.observe(0.5, 'parse')
+    seconds.observe(2, 'parse')
+    # Files left by a worker that has exited and by one still running
+    for pid in [2**22 + 1, os.getppid()]:
+        (tmp_path / f'{pid}.json').write_text(
+            '{"rows_total": {"[\\"model\\"]": 2}, "busy": {"[]": 5}}'
+        )
+
+    lines = registry.render().splitlines()
+    assert '# TYPE stage_seconds histogram' in lines
+    assert 'rows_total{source="model"} 7' in lines
+    assert 'busy 6' in lines
+    assert 'stage_seconds_bucket{stage="parse",le="0.1"} 0' in lines
+    assert 'stage_seconds_bucket{stage="parse",le="1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="parse",le="+Inf"} 2' in lines
+    assert 'stage_seconds_count{stage="parse"} 2' in lines
+
+    registry.flush()
+    assert (tmp_path / f'{os.getpid()}.json').exists()
+
+
+def metric_values(client):
+    lines = client.get('/metrics').get_data(as_text=True).splitlines()
+    return {
+        series: float(value)
+        for series, value in (line.rsplit(' ', 1) for line in lines)
+        if not series.startswith('#')
+    }
+
+
+def test_metrics_endpoint(monkeypatch):
+    model_dir = os.path.join(
+        ROOT, 'integration_tests', 'integration_files', 'prod_model'
+    )
+    monkeypatch.setattr(
+        api,
+        'MODEL_CACHE',
+        ModelCache(LocalModelStore(model_dir), 0, api.MODEL_LOAD_SECONDS.observe),
+    )
+    client = api.app.test_client()
+    assert client.get('/metrics').mimetype == 'text/plain'
+
+    before = metric_values(client)
+    with open(os.path.join(ROOT, 'integration_tests', 'test.csv'), 'rb') as csv_file:
+        assert client.post('/predict_csv', data=csv_file.read()).status_code == 200
+    after = metric_values(client)
+
+    def increase(series):
+        return after[series] - before.get(series, 0)
+
+    for stage in ['csv_read', 'csv_convert', 'features', 'inference', 'csv_write']:
+        assert increase(f'scoring_stage_seconds_count{{stage="{stage}"}}') == 1
+    assert increase('battles_scored_total{source="model"}') == 9
+    assert increase('model_load_seconds_count') == 1
+    assert increase('api_request_duration_seconds_count{endpoint="predict_csv"}') == 1
+    assert increase('api_requests_in_flight{endpoint="predict_csv"}') == 0
+
+
+def test_shadow_scorer_compares_candidates(tmp_path):
+    candidates = {'same': {'flip': False}, 'flipped': {'flip': True}, 'broken': {}}
+    for name, model in candidates.items():
+        os.makedirs(tmp_path / name)
+        publish(tmp_path / name, model, ['kill_diff'])
+    release = threading.Event()
+
+    def score(loaded, df):
+        release.wait(5)
+        predictions = (df['kill_diff'] > 0).astype(int).to_numpy()
+        return 1 - predictions if loaded.model['flip'] else predictions
+
+    shadow = ShadowScorer(
+        {
+            name: ModelCache(LocalModelStore(str(tmp_path / name)), 0)
+            for name in candidates
+        },
+        score,
+        max_queued=1,
+    )
+    features = pd.DataFrame({'kill_diff': [3, -2, 5, 0]})
+    prod = np.array([1, 0, 1, 0])
+    shadow.submit(features, prod)
+    deadline = time.time() + 5
+    while shadow.stats()['queue_depth']:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    # One batch is being scored and one waits, so the queue is full
+    shadow.submit(features, prod)
+    shadow.submit(features, prod)
+    release.set()
+    shadow.join()
+
+    stats = shadow.stats()
+    assert stats['dropped_batches'] == 1
+    models = stats['models']
+    assert (models['same']['battles'], models['same']['disagreements']) == (8, 0)
+    assert models['flipped']['disagreement_rate'] == 1.0
+    assert models['broken']['errors'] == 2
+    assert models['same']['latency_ms']['p50'] > 0
+
+
+def test_predict_scores_shadow_models(monkeypatch):
+    model_dir = os.path.join(
+        ROOT, 'integration_tests', 'integration_files', 'prod_model'
+    )
+    monkeypatch.setattr(api, 'MODEL_CACHE', ModelCache(LocalModelStore(model_dir), 0))
+    shadow = ShadowScorer(
+        {'candidate': ModelCache(LocalModelStore(model_dir), 0)}, api.SHADOW.score
+    )
+    monkeypatch.setattr(api, 'SHADOW', shadow)
+    battles = pd.read_csv(os.path.join(ROOT, 'integration_tests', 'test.csv'))
+    client = api.app.test_client()
+
+    response = client.post('/predict', json=battles.to_dict(orient='records'))
+    assert response.get_json()['predictions'] == INTEGRATION_PREDICTIONS
+    shadow.join()
+    candidate = client.get('/predict/stats').get_json()['shadow']['models']['candidate']
+    assert (candidate['battles'], candidate['disagreements']) == (9, 0)
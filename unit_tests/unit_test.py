@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler, LabelBinarizer
+from battle_features import DIFF_COLUMNS, stat_columns, engineer_features
 
 
 def test_feature_engineering():
@@ -123,6 +124,30 @@ def test_transform_battle_data():
     assert resulting_df.to_dict() == expected_df.to_dict()
 
 
+def test_engineer_features():
+    data = [
+        tuple(range(1, len(stat_columns()) + 1)),
+        tuple(range(2, len(stat_columns()) * 2 + 1, 2)),
+    ]
+    df = pd.DataFrame(data, columns=stat_columns(), dtype=float)
+    df.loc[1, 'B2-kill'] = np.nan
+    df['time'] = [300, 180]
+    df['mode'] = ['hoko', 'yagura']
+
+    resulting_df = engineer_features(df, DIFF_COLUMNS + ['time', 'mode'])
+
+    expected_data = [
+        (-80, -80, -80, -80, -80, 300, 'hoko'),
+        (-160 + 52, -160, -160, -160, -160, 180, 'yagura'),
+    ]
+    expected_cols = DIFF_COLUMNS + ['time', 'mode']
+    expected_df = pd.DataFrame(expected_data, columns=expected_cols)
+
+    assert resulting_df.to_dict() == expected_df.to_dict()
+    # Only the requested features are kept, not team totals such as A-kill
+    assert list(resulting_df.columns) == expected_cols
+
+
 if __name__ == "__main__":
     test_transform_battle_data()
     test_feature_engineering()